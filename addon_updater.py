@@ -27,12 +27,8 @@ __version__ = "1.1.1"
 import errno
 import traceback
 import platform
-import ssl
-import urllib.request
-import urllib
 import os
 import json
-import zipfile
 import shutil
 import threading
 import fnmatch
@@ -42,6 +38,9 @@ from datetime import datetime, timedelta
 import bpy
 import addon_utils
 
+# ssl, urllib.request and zipfile are imported where they are used, they are
+# only needed once an update check or install actually runs.
+
 # -----------------------------------------------------------------------------
 # The main class
 # -----------------------------------------------------------------------------
@@ -671,6 +670,10 @@ class SingletonUpdater:
 
     def get_raw(self, url):
         """All API calls to base url."""
+        import ssl
+        import urllib.error
+        import urllib.request
+
         request = urllib.request.Request(url)
         try:
             context = ssl._create_unverified_context()
@@ -776,6 +779,9 @@ class SingletonUpdater:
         self._source_zip = os.path.join(local, "source.zip")
         self.print_verbose("Starting download update zip")
         try:
+            import ssl
+            import urllib.request
+
             request = urllib.request.Request(url)
             context = ssl._create_unverified_context()
 
@@ -915,6 +921,8 @@ class SingletonUpdater:
             return -1
 
         self.print_verbose("Begin extracting source from zip:" + str(self._source_zip))
+        import zipfile
+
         with zipfile.ZipFile(self._source_zip, "r") as zfile:
             if not zfile:
                 self._error = "Install failed"
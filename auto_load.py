@@ -1,3 +1,4 @@
+import re
 import bpy
 import typing
 import inspect
@@ -16,6 +17,12 @@ blender_version = bpy.app.version
 modules = None
 ordered_classes = None
 
+# Vendored third party packages, never scanned for classes
+ignored_packages = {"libs"}
+
+register_pattern = re.compile(rb"^def register\(", re.MULTILINE)
+class_pattern = re.compile(rb"^class\s+\w+\s*\(([^)]*)\)", re.MULTILINE)
+
 
 def init():
     global modules
@@ -30,7 +37,6 @@ def register():
         bpy.utils.register_class(cls)
 
     for module in modules:
-        print(module.__name__)
         if module.__name__ == __name__:
             continue
         if hasattr(module, "register"):
@@ -64,13 +70,34 @@ def iter_submodules(path, package_name):
 def iter_submodule_names(path, root=""):
     for _, module_name, is_package in pkgutil.iter_modules([str(path)]):
         if is_package:
+            if not root and module_name in ignored_packages:
+                continue
             sub_path = path / module_name
             sub_root = root + module_name + "."
             yield from iter_submodule_names(sub_path, sub_root)
-        else:
+        elif defines_registrables(path / (module_name + ".py")):
             yield root + module_name
 
 
+def defines_registrables(file):
+    # Only modules with classes to register or a register() function are
+    # imported at enable time, helpers are left to be imported on first use.
+    # A plain text scan of top level statements: parsing every module with
+    # ast took longer than importing the helpers it skipped.
+    try:
+        source = file.read_bytes()
+    except OSError:
+        return True
+    if register_pattern.search(source):
+        return True
+    base_names = {name.encode() for name in get_register_base_type_names()}
+    for match in class_pattern.finditer(source):
+        for base in match.group(1).split(b","):
+            if base.strip().rsplit(b".", 1)[-1] in base_names:
+                return True
+    return False
+
+
 # Find classes to register
 #################################################
 
@@ -149,24 +176,25 @@ def iter_classes_in_module(module):
 
 
 def get_register_base_types():
-    return set(
-        getattr(bpy.types, name)
-        for name in [
-            "Panel",
-            "Operator",
-            "PropertyGroup",
-            "AddonPreferences",
-            "Header",
-            "Menu",
-            "Node",
-            "NodeSocket",
-            "NodeTree",
-            "UIList",
-            "RenderEngine",
-            "Gizmo",
-            "GizmoGroup",
-        ]
-    )
+    return set(getattr(bpy.types, name) for name in get_register_base_type_names())
+
+
+def get_register_base_type_names():
+    return [
+        "Panel",
+        "Operator",
+        "PropertyGroup",
+        "AddonPreferences",
+        "Header",
+        "Menu",
+        "Node",
+        "NodeSocket",
+        "NodeTree",
+        "UIList",
+        "RenderEngine",
+        "Gizmo",
+        "GizmoGroup",
+    ]
 
 
 # Find order to register to solve dependencies
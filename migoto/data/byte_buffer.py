@@ -167,6 +167,19 @@ class BufferLayout:
         return ret
 
     def get_numpy_type(self) -> DTypeLike:
+        if self.force_stride:
+            # Keep the offsets and stride as given, layouts taken from a game
+            # may have gaps and elements that spill over into the next one
+            return numpy.dtype(
+                {
+                    "names": [semantic.get_name() for semantic in self.semantics],
+                    "formats": [
+                        semantic.get_numpy_type() for semantic in self.semantics
+                    ],
+                    "offsets": [semantic.offset for semantic in self.semantics],
+                    "itemsize": self.stride,
+                }
+            )
         dtype = numpy.dtype([])
         for semantic in self.semantics:
             dtype = numpy.dtype(
@@ -3,7 +3,7 @@ import copy
 import numpy
 from numpy.typing import NDArray, DTypeLike
 import time
-from bpy.types import Mesh, Object
+from bpy.types import Mesh
 
 from typing import Optional, Callable
 from operator import attrgetter
@@ -353,37 +353,32 @@ class BlenderDataExtractor:
 
     def get_shapekey_data(
         self,
-        obj: Object,
-        names_filter: Optional[list[str]] = None,
+        mesh: Mesh,
+        names: list[str],
         deduct_basis=False,
-    ) -> dict[str, numpy.ndarray]:
+    ) -> NDArray:
+        """Returns the coordinates of the named shapekeys stacked in a (K, V, 3) array"""
         start_time = time.time()
 
         numpy_type = self.blender_data_formats[Semantic.ShapeKey].get_numpy_type()
+        key_blocks = mesh.shape_keys.key_blocks
 
         base_data = None
         if deduct_basis:
             base_data = self.fetch_data(
-                obj.data.shape_keys.key_blocks["Basis"].data, "co", numpy_type
+                mesh.shape_keys.reference_key.data, "co", numpy_type
             )
 
-        result = {}
+        result = numpy.empty((len(names), len(mesh.vertices)), dtype=numpy_type)
 
-        for shapekey in obj.data.shape_keys.key_blocks:
-            if names_filter is not None:
-                if shapekey.name not in names_filter:
-                    continue
-            elif deduct_basis and shapekey.name == "Basis":
-                continue
-
-            data = self.fetch_data(shapekey.data, "co", numpy_type)
+        for i, name in enumerate(names):
+            data = result[i]
+            key_blocks[name].data.foreach_get("co", data.ravel())
             self.sanitize_blender_data(data)
 
             if deduct_basis:
                 data -= base_data
 
-            result[shapekey.name] = data
-
         print(
             f"Shape Keys fetch time: {time.time() - start_time:.3f}s ({len(result)} shapekeys)"
         )
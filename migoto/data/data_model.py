@@ -143,17 +143,37 @@ class DataModel(object):
         mesh: Mesh,
         excluded_buffers: list[str],
         mirror_mesh: bool = False,
-    ) -> tuple[dict[str, NumpyBuffer], int]:
+        vg_remap: Optional[NDArray] = None,
+    ) -> tuple[dict[str, NumpyBuffer], NDArray]:
+        """Returns the export buffers and the mesh vertex id of every exported vertex"""
         try:
             index_data, vertex_buffer = self.export_data(
-                context, collection, mesh, excluded_buffers, mirror_mesh
+                context, collection, mesh, excluded_buffers, mirror_mesh, vg_remap
             )
         except RuntimeError:
             raise Fatal(
                 f"Failed to calculate tangents! Ensure the mesh({obj.name}) has at least 1 UV map called 'TEXCOORD.xy'"
             )
         buffers = self.build_buffers(index_data, vertex_buffer, excluded_buffers)
-        return buffers, len(vertex_buffer)
+        vertex_ids = vertex_buffer.get_field(
+            AbstractSemantic(Semantic.VertexId).get_name()
+        )
+        return buffers, vertex_ids
+
+    def get_shapekey_data(
+        self,
+        mesh: Mesh,
+        names: list[str],
+        vertex_ids: NDArray,
+        mirror_mesh: bool = False,
+    ) -> NDArray:
+        """Returns the deltas of the named shapekeys for every exported vertex as a (K, V, 3) array"""
+        self.data_extractor.blender_data_formats = self.blender_data_formats
+        deltas = self.data_extractor.get_shapekey_data(mesh, names, deduct_basis=True)
+        deltas = deltas[:, vertex_ids]
+        if mirror_mesh:
+            deltas[:, :, 0] *= -1
+        return deltas
 
     def build_buffers(
         self, index_data, vertex_buffer, excluded_buffers
@@ -186,11 +206,23 @@ class DataModel(object):
         return result
 
     def export_data(
-        self, context, collection, mesh, excluded_buffers, mirror_mesh: bool = False
+        self,
+        context,
+        collection,
+        mesh,
+        excluded_buffers,
+        mirror_mesh: bool = False,
+        vg_remap: Optional[NDArray] = None,
     ) -> tuple[NDArray, NumpyBuffer]:
         export_layout, fetch_loop_data = self.make_export_layout(excluded_buffers)
         index_data, vertex_buffer = self.get_mesh_data(
-            context, collection, mesh, export_layout, fetch_loop_data, mirror_mesh
+            context,
+            collection,
+            mesh,
+            export_layout,
+            fetch_loop_data,
+            mirror_mesh,
+            vg_remap,
         )
         return index_data, vertex_buffer
 
@@ -234,6 +266,7 @@ class DataModel(object):
         export_layout: BufferLayout,
         fetch_loop_data: bool,
         mirror_mesh: bool = False,
+        vg_remap: Optional[NDArray] = None,
     ) -> tuple[NDArray, NumpyBuffer]:
         # vertex_ids_cache, cache_vertex_ids = None, False
         vertex_ids_cache = None
@@ -300,6 +333,14 @@ class DataModel(object):
                 self._insert_converter(
                     semantic_converters, semantic.abstract, self.converter_mirror_vector
                 )
+            # Remap indicies of VG groups
+            if vg_remap is not None:
+                if semantic.abstract.enum == Semantic.Blendindices:
+                    self._insert_converter(
+                        semantic_converters,
+                        semantic.abstract,
+                        lambda data: vg_remap[data],
+                    )
             # Flip V component of UV maps
             if self.flip_texcoord_v and semantic.abstract.enum == Semantic.TexCoord:
                 self._insert_converter(
@@ -634,6 +675,7 @@ class DataModelXXMI(DataModel):
         export_layout: BufferLayout,
         fetch_loop_data: bool,
         mirror_mesh: bool = False,
+        vg_remap: Optional[NDArray] = None,
     ) -> tuple[NDArray, NumpyBuffer]:
         flip_winding: bool = (
             self.flip_winding if not self.mirror_mesh else not self.flip_winding
@@ -676,6 +718,14 @@ class DataModelXXMI(DataModel):
                 self._insert_converter(
                     semantic_converters, semantic.abstract, self.converter_mirror_vector
                 )
+            # Remap indicies of VG groups
+            if vg_remap is not None:
+                if semantic.abstract.enum == Semantic.Blendindices:
+                    self._insert_converter(
+                        semantic_converters,
+                        semantic.abstract,
+                        lambda data: vg_remap[data],
+                    )
             # Flip V component of UV maps
             if self.flip_texcoord_v and semantic.abstract.enum == Semantic.TexCoord:
                 self._insert_converter(
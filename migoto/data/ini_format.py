@@ -1,30 +1,69 @@
-from dataclasses import dataclass, field
+import io
+from dataclasses import dataclass
+from typing import Callable, Optional
+
 
-@dataclass
 class INI_Line:
     """Class to represent a line in an ini file"""
 
-    key: str
-    value: str
-    is_value_pair: bool
-    _stripped_lower_key: str = field(init=False, repr=False)
-    _stripped_lower_value: str = field(init=False, repr=False)
+    # Parsing a generated ini creates one of these per line, so they are kept
+    # small and the stripped, lowercase key is only worked out when needed
+    __slots__ = ("_key", "value", "is_value_pair", "_normalized_key")
+
+    def __init__(self, key: str, value: str, is_value_pair: bool) -> None:
+        self._key: str = key
+        self.value: str = value
+        self.is_value_pair: bool = is_value_pair
+        self._normalized_key: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f"INI_Line(key={self._key!r}, value={self.value!r}, is_value_pair={self.is_value_pair!r})"
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, INI_Line):
+            return NotImplemented
+        return (self._key, self.value, self.is_value_pair) == (
+            other._key,
+            other.value,
+            other.is_value_pair,
+        )
 
-    def __setattr__(self, name, value) -> None:
-        """Override the __setattr__ method to strip and lowercase the key and value"""
-        if name == "key":
-            self._stripped_lower_key = value.strip().lower()
-        elif name == "value":
-            self._stripped_lower_value = value.strip().lower()
-        super().__setattr__(name, value)
+    @property
+    def key(self) -> str:
+        return self._key
+
+    @key.setter
+    def key(self, key: str) -> None:
+        self._key = key
+        self._normalized_key = None
+
+    @property
+    def normalized_key(self) -> str:
+        """The key stripped and lowercased"""
+        if self._normalized_key is None:
+            self._normalized_key = self._key.strip().lower()
+        return self._normalized_key
+
+    def indent(self, depth: int) -> None:
+        """Replace the leading whitespace of the key with depth tabs"""
+        # Only leading whitespace changes, so the normalized key still holds
+        self._key = "\t" * depth + self._key.lstrip()
 
     def has_key(self, key: str) -> bool:
         """Check if the line has a specific key"""
-        return self._stripped_lower_key == key.strip().lower()
+        return self.normalized_key == key.strip().lower()
 
     def key_startswith(self, key: str) -> bool:
         """Check if the line key starts with a specific string"""
-        return self._stripped_lower_key.startswith(key.strip().lower())
+        return self.normalized_key.startswith(key.strip().lower())
+
+
+def parse_line(line: str) -> INI_Line:
+    """Split a line in key and value, if it has exactly one '='"""
+    key_value: list[str] = line.split("=")
+    if len(key_value) == 2:
+        return INI_Line(key_value[0], key_value[1], True)
+    return INI_Line(line, "", False)
 
 
 @dataclass
@@ -45,6 +84,93 @@ class Section:
             return False
         return self.name.strip().lower()[1:].startswith(name.strip().lower())
 
+    @property
+    def normalized_name(self) -> str:
+        """The section name without brackets, stripped and lowercased"""
+        return self.name.strip()[1:].strip("]").strip().lower()
+
+    def __str__(self) -> str:
+        content = io.StringIO()
+        self.write(content.write)
+        return content.getvalue()
+
+    def write(self, write: Callable[[str], object]) -> None:
+        """Write the section, header line included, through write"""
+        if not self.is_header:
+            write(self.name)
+        for line in self.lines:
+            write(line.key)
+            if line.is_value_pair:
+                write("=")
+                write(line.value)
+
+    def trailing_comments_start(self) -> int:
+        """Index of the block of comments and empty lines ending the section"""
+        end: int = len(self.lines)
+        while end > 0:
+            key: str = self.lines[end - 1].normalized_key
+            if key != "" and not key.startswith(";"):
+                break
+            end -= 1
+        return end
+
+    def owned_lines(self, owns_line: Callable[[INI_Line], bool]) -> list[int]:
+        """
+        Indices of the lines owns_line accepts, along with the comments
+        directly above each of them
+        """
+        owned: list[int] = []
+        for i, line in enumerate(self.lines):
+            if not owns_line(line):
+                continue
+            start: int = i
+            while start > 0 and self.lines[start - 1].normalized_key.startswith(";"):
+                start -= 1
+            first: int = owned[-1] + 1 if owned else 0
+            owned.extend(range(max(start, first), i + 1))
+        return owned
+
+    def replace_owned_lines(
+        self, lines: list[INI_Line], owns_line: Callable[[INI_Line], bool]
+    ) -> bool:
+        """
+        Replace the lines owns_line accepts (and their comments) with lines,
+        placed where the first of them was or after the last entry if there
+        were none. Returns whether the section changed.
+        """
+        owned: list[int] = self.owned_lines(owns_line)
+        current: list[INI_Line] = [self.lines[i] for i in owned]
+        if current == lines:
+            return False
+        position: int = owned[0] if owned else self.trailing_comments_start()
+        owned_set: set[int] = set(owned)
+        kept: list[INI_Line] = [
+            line for i, line in enumerate(self.lines) if i not in owned_set
+        ]
+        if lines and position > 0:
+            # The entry before might be the last one of a section without a
+            # trailing newline
+            previous: INI_Line = kept[position - 1]
+            if previous.is_value_pair and not previous.value.endswith("\n"):
+                previous.value += "\n"
+            elif not previous.is_value_pair and not previous.key.endswith("\n"):
+                previous.key += "\n"
+        self.lines = kept[:position] + lines + kept[position:]
+        return True
+
+    def end_with_newline(self) -> None:
+        """Make sure whatever follows the section starts on a line of its own"""
+        if not self.lines:
+            if not self.is_header and not self.name.endswith("\n"):
+                self.name += "\n"
+            return
+        last: INI_Line = self.lines[-1]
+        if last.is_value_pair:
+            if not last.value.endswith("\n"):
+                last.value += "\n"
+        elif last.key != "" and not last.key.endswith("\n"):
+            last.key += "\n"
+
     def add_lines(self, lines: str) -> None:
         """Add lines to the section"""
         self.clear_empty_ending_lines()
@@ -55,17 +181,11 @@ class Section:
         self.add_single_line("\n\n")
 
     def add_single_line(self, line: str) -> None:
-        key_value: list[str] = line.split("=")
-        if len(key_value) == 2:
-            key: str = key_value[0]
-            value: str = key_value[1]
-            self.lines.append(INI_Line(key=key, value=value, is_value_pair=True))
-        else:
-            self.lines.append(INI_Line(key=line, value="", is_value_pair=False))
+        self.lines.append(parse_line(line))
 
     def clear_empty_ending_lines(self) -> None:
         """Remove empty lines at the end of the section"""
-        while self.lines and self.lines[-1].key.strip() == "":
+        while self.lines and self.lines[-1].normalized_key == "":
             self.lines.pop()
 
     def comment_out(self) -> None:
@@ -87,20 +207,17 @@ class INI_file:
 
     def split_in_sections(self, content: str) -> None:
         """Split the content into sections based on [section] headers"""
-        lines: list[str] = content.splitlines(keepends=True)
         curr_section: Section = Section(name="", lines=[], is_header=True)
-        self.sections: list[Section] = []
-        for line in lines:
-            stripped_line = line.strip()
+        lines: list[INI_Line] = curr_section.lines
+        self.sections: list[Section] = [curr_section]
+        for line in content.splitlines(keepends=True):
+            stripped_line: str = line.strip()
             if stripped_line.startswith("[") and stripped_line.endswith("]"):
-                if curr_section:
-                    self.sections.append(curr_section)
-                section_name: str = line
-                curr_section = Section(name=section_name, lines=[])
+                curr_section = Section(name=line, lines=[])
+                lines = curr_section.lines
+                self.sections.append(curr_section)
                 continue
-            curr_section.add_single_line(line)
-        if curr_section:
-            self.sections.append(curr_section)
+            lines.append(parse_line(line))
 
     def clean_up_indentation(self) -> None:
         """Clean up indentation in the ini file content"""
@@ -108,33 +225,105 @@ class INI_file:
             s.name = s.name.lstrip()
             depth: int = 0
             for line in s.lines:
-                if line._stripped_lower_key == "":
+                key: str = line.normalized_key
+                if key == "":
                     continue
-                if line.key_startswith("if"):
+                # if/elif/else sit one level out from the block they open
+                if key.startswith("if"):
                     depth += 1
-                elif line.key_startswith("endif"):
-                    depth -= 1
-                if (
-                    line.key_startswith("if")
-                    or line.key_startswith("elif")
-                    or line.key_startswith("else")
-                ):
-                    line.key = "\t" * (depth - 1) + line.key.lstrip()
+                    line.indent(depth - 1)
+                elif key.startswith(("elif", "else")):
+                    line.indent(depth - 1)
                 else:
-                    line.key = "\t" * depth + line.key.lstrip()
-                # line.key = str(depth) + line.key
+                    if key.startswith("endif"):
+                        depth -= 1
+                    line.indent(depth)
             s.clear_empty_ending_lines()
             s.add_single_line("\n")
 
-    def __str__(self) -> str:
-        """Reconstruct the ini file from sections"""
-        content: list[str] = []
+    def section_index(self) -> dict[str, Section]:
+        """Map normalized section names to the first section with that name"""
+        index: dict[str, Section] = {}
         for section in self.sections:
             if not section.is_header:
-                content.append(section.name)
-            for line in section.lines:
-                if line.is_value_pair:
-                    content.append(f"{line.key}={line.value}")
+                index.setdefault(section.normalized_name, section)
+        return index
+
+    def merge(
+        self,
+        generated: "INI_file",
+        is_owned: Callable[[str], bool],
+        owns_line: Optional[Callable[[str, INI_Line], bool]] = None,
+    ) -> list[str]:
+        """
+        Splice the sections of a freshly generated ini into this one. Entries
+        of the sections is_owned accepts by normalized name are replaced if
+        they changed, sections missing here are inserted after the one
+        preceding them in generated, and everything else is left untouched.
+        In sections shared with other content, the lines owns_line accepts
+        for the section name are replaced with the generated ones (removed if
+        generated has none). Returns the names of the changed sections.
+        """
+        if not self.sections:
+            self.sections = generated.sections
+            return list(self.section_index())
+        index: dict[str, Section] = self.section_index()
+        generated_index: dict[str, Section] = generated.section_index()
+        changed: list[str] = []
+        if owns_line is not None:
+            for name, current in index.items():
+                if is_owned(name):
                     continue
-                content.append(line.key)
-        return "".join(content)
+
+                def owns(line: INI_Line, name: str = name) -> bool:
+                    return owns_line(name, line)
+
+                source: Optional[Section] = generated_index.get(name)
+                lines: list[INI_Line] = []
+                if source is not None:
+                    lines = [source.lines[i] for i in source.owned_lines(owns)]
+                if current.replace_owned_lines(lines, owns):
+                    changed.append(name)
+        # New sections, keyed by the id of the section they go after
+        inserts: dict[int, list[Section]] = {}
+        anchor: Section = self.sections[0]
+        for section in generated.sections:
+            if section.is_header:
+                continue
+            name: str = section.normalized_name
+            current: Optional[Section] = index.get(name)
+            if current is None:
+                inserts.setdefault(id(anchor), []).append(section)
+                index[name] = section
+                changed.append(name)
+                continue
+            if is_owned(name):
+                # Comments after the last entry usually introduce whatever
+                # follows, so they are kept as they are in this file
+                end: int = current.trailing_comments_start()
+                new_end: int = section.trailing_comments_start()
+                if (
+                    current.name != section.name
+                    or current.lines[:end] != section.lines[:new_end]
+                ):
+                    current.name = section.name
+                    current.lines = section.lines[:new_end] + current.lines[end:]
+                    changed.append(name)
+            anchor = current
+        if inserts:
+            sections: list[Section] = []
+            for section in self.sections:
+                sections.append(section)
+                if id(section) in inserts:
+                    section.end_with_newline()
+                    sections.extend(inserts[id(section)])
+            self.sections = sections
+        return changed
+
+    def __str__(self) -> str:
+        """Reconstruct the ini file from sections"""
+        content = io.StringIO()
+        write = content.write
+        for section in self.sections:
+            section.write(write)
+        return content.getvalue()
@@ -0,0 +1,120 @@
+"""
+Index buffer reordering for the GPU's post-transform vertex cache.
+
+Triangles are reordered with Tipsify (Sander, Nehab and Barczak, "Fast
+Triangle Reordering for Vertex Locality and Reduced Overdraw", 2007), which
+fans out from one vertex at a time and picks the next one among the vertices
+still in the cache. Vertices are then renumbered in the order they are first
+used, so the vertex fetch walks the buffers front to back.
+
+Cache efficiency is reported as the average cache miss ratio (ACMR, vertices
+transformed per triangle) and the average transform to vertex ratio (ATVR,
+vertices transformed per unique vertex, 1.0 being optimal) of a FIFO cache.
+"""
+
+import numpy
+from numpy.typing import NDArray
+
+# Entries of the simulated FIFO cache, both for Tipsify and the statistics
+cache_size: int = 32
+
+
+def build_adjacency(indices: NDArray, vertex_count: int) -> tuple[NDArray, NDArray]:
+    """Triangles using each vertex, as CSR offsets into a triangle list"""
+    counts: NDArray = numpy.bincount(indices, minlength=vertex_count)
+    offsets: NDArray = numpy.zeros(vertex_count + 1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=offsets[1:])
+    triangles: NDArray = numpy.argsort(indices, kind="stable") // 3
+    return offsets, triangles
+
+
+def optimize_triangle_order(
+    indices: NDArray, vertex_count: int, cache_size: int = cache_size
+) -> NDArray:
+    """
+    Returns the order to draw the triangles of a triangle list in, indices
+    being in [0, vertex_count). Winding is left as it is.
+    """
+    triangle_count: int = len(indices) // 3
+    if triangle_count == 0:
+        return numpy.arange(0, dtype=numpy.int64)
+    offsets, adjacency = build_adjacency(indices, vertex_count)
+    offsets = offsets.tolist()
+    adjacency = adjacency.tolist()
+    triangles: list[int] = indices.tolist()
+    live: list[int] = numpy.diff(offsets).tolist()
+    cache_time: list[int] = [0] * vertex_count
+    emitted: list[bool] = [False] * triangle_count
+    dead_end: list[int] = []
+    output: list[int] = []
+    time: int = cache_size + 1
+    cursor: int = 0
+    fanning: int = triangles[0]
+    while fanning >= 0:
+        candidates: list[int] = []
+        for t in adjacency[offsets[fanning] : offsets[fanning + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            output.append(t)
+            for v in triangles[3 * t : 3 * t + 3]:
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if time - cache_time[v] > cache_size:
+                    cache_time[v] = time
+                    time += 1
+        # Next vertex: the one in cache the longest that will still be in
+        # cache after fanning out from it
+        fanning = -1
+        best: int = -1
+        for v in candidates:
+            if live[v] == 0:
+                continue
+            age: int = time - cache_time[v]
+            if age + 2 * live[v] <= cache_size and age > best:
+                best = age
+                fanning = v
+        if fanning >= 0:
+            continue
+        # Dead end, go back to a recently used vertex or the next unused one
+        while dead_end:
+            v = dead_end.pop()
+            if live[v] > 0:
+                fanning = v
+                break
+        else:
+            while cursor < vertex_count:
+                if live[cursor] > 0:
+                    fanning = cursor
+                    break
+                cursor += 1
+    return numpy.array(output, dtype=numpy.int64)
+
+
+def vertex_fetch_order(indices: NDArray, vertex_count: int) -> tuple[NDArray, NDArray]:
+    """
+    Returns the vertices in the order they are first used by indices, unused
+    ones last, and the new index of every vertex.
+    """
+    first_use: NDArray = numpy.full(vertex_count, len(indices), dtype=numpy.int64)
+    used, first_position = numpy.unique(indices, return_index=True)
+    first_use[used] = first_position
+    order: NDArray = numpy.argsort(first_use, kind="stable")
+    remap: NDArray = numpy.empty(vertex_count, dtype=indices.dtype)
+    remap[order] = numpy.arange(vertex_count, dtype=indices.dtype)
+    return order, remap
+
+
+def count_cache_misses(
+    indices: NDArray, vertex_count: int, cache_size: int = cache_size
+) -> int:
+    """Vertices transformed drawing indices through a FIFO cache"""
+    misses: int = 0
+    # Vertices are in cache if they were inserted within the last cache_size misses
+    inserted: list[int] = [-cache_size - 1] * vertex_count
+    for v in indices.tolist():
+        if misses - inserted[v] > cache_size:
+            inserted[v] = misses
+            misses += 1
+    return misses
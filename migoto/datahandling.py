@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 import re
@@ -10,10 +11,12 @@ from bpy.types import Context, Mesh, Object, Operator
 from bpy_extras.io_utils import axis_conversion
 from mathutils import Vector
 
+from .. import __name__ as package_name
 from .datastructures import (
     ConstantBuffer,
-    FALogFile,
     Fatal,
+    FrameAnalysisDumpIndex,
+    FrameAnalysisLog,
     IndexBuffer,
     VBSOMapEntry,
     VertexBufferGroup,
@@ -114,14 +117,67 @@ def find_stream_output_vertex_buffers(log):
     return vb_so_map
 
 
-def open_frame_analysis_log_file(dirname: Path) -> FALogFile:
+def open_frame_analysis_log(dirname: Path) -> "tuple[FrameAnalysisLog, str]":
+    """
+    Returns the FrameAnalysisLog of the dump containing dirname, and which
+    context dirname holds the dumps of (None for the immediate context).
+    """
+    cache_dir = get_cache_dir("fa_log")
     basename = os.path.basename(dirname)
     if basename.lower().startswith("ctx-0x"):
-        context = basename[6:]
-        path = os.path.join(dirname, "..", f"log-0x{context}.txt")
-    else:
-        path = os.path.join(dirname, "log.txt")
-    return FALogFile(open(path, "r"))
+        return FrameAnalysisLog(os.path.dirname(dirname), cache_dir), basename[6:]
+    return FrameAnalysisLog(dirname, cache_dir), None
+
+
+def get_cache_dir(*subdirs: str) -> str:
+    """Directory inside the Blender user config folder used for add-on caches"""
+    path = bpy.utils.user_resource(
+        "CONFIG", path=os.path.join("xxmi_tools", *subdirs), create=True
+    )
+    return path
+
+
+def get_import_cache():
+    """
+    Returns the parsed buffer ImportCache, or None if disabled by setting its
+    size to 0 in the add-on preferences.
+    """
+    max_size = 512
+    addon = bpy.context.preferences.addons.get(package_name)
+    if addon is not None and addon.preferences is not None:
+        max_size = addon.preferences.import_cache_size
+    if max_size <= 0:
+        return None
+    from .import_cache import ImportCache
+
+    return ImportCache(get_cache_dir("import_cache"), max_size * 1024 * 1024)
+
+
+dump_indices = {}
+
+
+def open_frame_analysis_dump_index(dirname: Path) -> FrameAnalysisDumpIndex:
+    """
+    Returns the file index of a frame analysis dump folder. Indices are kept
+    in memory for the session and persisted to the add-on cache folder (not
+    the dump itself, as that would change the mtime the cache is keyed by).
+    """
+    dirname = os.path.normpath(os.path.abspath(dirname))
+    mtime = os.stat(dirname).st_mtime_ns
+    index = dump_indices.get(dirname)
+    if index is not None and index.mtime == mtime:
+        return index
+    key = hashlib.sha1(os.path.normcase(dirname).encode("utf-8")).hexdigest()
+    cache_path = os.path.join(get_cache_dir("dump_index"), key + ".json")
+    index = FrameAnalysisDumpIndex.load(dirname, cache_path)
+    if index is None:
+        index = FrameAnalysisDumpIndex(dirname)
+        try:
+            index.save(cache_path)
+        except OSError as e:
+            print(f"Unable to save frame analysis dump index: {e}")
+    dump_indices[dirname] = index
+    return index
 
 
 # Parsing the headers for vb0 txt files
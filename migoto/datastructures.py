@@ -1,12 +1,15 @@
+import bisect
 import collections
+import hashlib
 import io
 import itertools
+import json
+import os
 import re
 import struct
 import textwrap
 from enum import Enum
 import numpy
-from mathutils import Matrix
 
 IOOBJOrientationHelper = type("DummyIOOBJOrientationHelper", (object,), {})
 vertex_color_layer_channels = 4
@@ -690,6 +693,57 @@ class VertexBufferGroup(object):
     def __len__(self):
         return len(self.vertices)
 
+    def to_columns(self):
+        """
+        Returns the parsed vertex buffer as plain data with one numpy array per
+        semantic, compact enough to be pickled between processes or saved with
+        numpy.savez.
+        """
+        semantics = list(self.vertices[0]) if self.vertices else []
+        return {
+            "layout": self.layout.serialise(),
+            "first": self.first,
+            "vertex_count": self.vertex_count,
+            "topology": self.topology,
+            "vbs": [
+                {
+                    "idx": vb.idx,
+                    "stride": vb.stride,
+                    "first": vb.first,
+                    "vertex_count": vb.vertex_count,
+                    "offset": vb.offset,
+                    "topology": vb.topology,
+                }
+                for vb in self.vbs
+            ],
+            "columns": {
+                semantic: numpy.array([vertex[semantic] for vertex in self.vertices])
+                for semantic in semantics
+            },
+        }
+
+    @classmethod
+    def from_columns(cls, state):
+        vb = cls(layout=InputLayout(state["layout"]), topology=state["topology"])
+        vb.first = state["first"]
+        vb.vertex_count = state["vertex_count"]
+        for entry in state["vbs"]:
+            individual_vb = IndividualVertexBuffer(entry["idx"], layout=vb.layout)
+            for attr in ("stride", "first", "vertex_count", "offset", "topology"):
+                setattr(individual_vb, attr, entry[attr])
+            vb.vbs.append(individual_vb)
+            vb.slots[individual_vb.idx] = individual_vb
+        vb.flag_invalid_semantics()
+
+        semantics = list(state["columns"])
+        columns = [
+            list(map(tuple, state["columns"][semantic].tolist()))
+            for semantic in semantics
+        ]
+        vb.vertices = [dict(zip(semantics, vertex)) for vertex in zip(*columns)]
+        assert len(vb.vertices) == vb.vertex_count
+        return vb
+
     def merge_vbs(self, vbs):
         self.vertices = self.vbs[0].vertices
         del self.vbs[0].vertices
@@ -948,6 +1002,29 @@ class IndexBuffer(object):
     def __len__(self):
         return len(self.faces) * self.indices_per_face + self.extra_indices
 
+    def to_columns(self):
+        """
+        Returns the parsed index buffer as plain data with the faces in a
+        single numpy array, see VertexBufferGroup.to_columns()
+        """
+        return {
+            "format": self.format,
+            "first": self.first,
+            "index_count": self.index_count,
+            "offset": self.offset,
+            "topology": self.topology,
+            "used_in_drawcall": self.used_in_drawcall,
+            "faces": numpy.array(self.faces, dtype=numpy.int64),
+        }
+
+    @classmethod
+    def from_columns(cls, state):
+        ib = cls(state["format"])
+        for attr in ("first", "index_count", "offset", "topology", "used_in_drawcall"):
+            setattr(ib, attr, state[attr])
+        ib.faces = list(map(tuple, state["faces"].tolist()))
+        return ib
+
 
 class ConstantBuffer(object):
     def __init__(self, f, start_idx, end_idx):
@@ -969,6 +1046,10 @@ class ConstantBuffer(object):
         assert entry == []
 
     def as_3x4_matrices(self):
+        # Imported here so the parsing classes in this module can be used
+        # from worker processes that run outside of Blender:
+        from mathutils import Matrix
+
         return [Matrix(self.entries[i : i + 3]) for i in range(0, len(self.entries), 3)]
 
 
@@ -977,9 +1058,11 @@ class FALogFile(object):
     Class that is able to parse frame analysis log files, query bound resource
     state at the time of a given draw call, and search for resource usage.
 
-    TODO: Support hold frame analysis log files that include multiple frames
+    Each FALogFile covers a single frame of a single context - see
+    FrameAnalysisLog for hold frame analysis logs that include multiple frames
+    and deferred context log files.
+
     TODO: Track bound shaders
-    TODO: Merge deferred context log files into main log file
     TODO: Track CopyResource / other ways resources can be updated
     """
 
@@ -1001,14 +1084,17 @@ class FALogFile(object):
         def __init__(self):
             dict.__init__(self, {0: {}})
             self.last_draw_call = 0
+            # Draw calls are only ever added in increasing order, so keep them
+            # in a sorted list alongside the dict for bisect lookups:
+            self.draw_calls = [0]
 
         def prev_draw_call(self, draw_call):
-            return max([i for i in self.keys() if i < draw_call])
+            return self.draw_calls[bisect.bisect_left(self.draw_calls, draw_call) - 1]
 
         # def next_draw_call(self, draw_call):
         #    return min([ i for i in self.keys() if i > draw_call ])
         def subsequent_draw_calls(self, draw_call):
-            return [i for i in sorted(self.keys()) if i >= draw_call]
+            return self.draw_calls[bisect.bisect_left(self.draw_calls, draw_call) :]
 
         def __getitem__(self, draw_call):
             if draw_call > self.last_draw_call:
@@ -1016,16 +1102,66 @@ class FALogFile(object):
                     self, draw_call, dict.__getitem__(self, self.last_draw_call).copy()
                 )
                 self.last_draw_call = draw_call
-            elif draw_call not in self.keys():
+                self.draw_calls.append(draw_call)
+            elif draw_call not in self:
                 return dict.__getitem__(self, self.prev_draw_call(draw_call))
             return dict.__getitem__(self, draw_call)
 
+        def bound_intervals(self):
+            """
+            Returns {resource address: [(slot, first, end), ...]} for every run
+            of draw calls a resource stayed bound to a slot. end is the draw
+            call it was unbound or replaced in, or None if it was still bound
+            at the end of the log.
+            """
+            intervals = collections.defaultdict(list)
+            bound = {}  # slot -> (resource address, first draw call)
+            for draw_call in self.draw_calls:
+                slots = dict.__getitem__(self, draw_call)
+                for slot in list(bound):
+                    address, first = bound[slot]
+                    if slot not in slots or slots[slot].resource_address != address:
+                        intervals[address].append((slot, first, draw_call))
+                        del bound[slot]
+                for slot, binding in slots.items():
+                    if slot not in bound:
+                        bound[slot] = (binding.resource_address, draw_call)
+            for slot, (address, first) in bound.items():
+                intervals[address].append((slot, first, None))
+            return intervals
+
+    class LineReader(object):
+        """
+        Iterates over the lines of a log file with a single line of lookahead,
+        so parsers can consume the continuation lines that follow a call
+        without the whole file being held in memory.
+        """
+
+        def __init__(self, f):
+            self.lines = iter(f)
+            self.next_line = next(self.lines, None)
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            line = self.next_line
+            if line is None:
+                raise StopIteration
+            self.next_line = next(self.lines, None)
+            return line
+
+        def peek(self):
+            return self.next_line or ""
+
     class FALogParser(object):
         """
         Base class implementing some common parsing functions
         """
 
         pattern = None
+        # Cheap startswith() check to reject lines before running the pattern
+        prefix = None
 
         def parse(self, line, q, state):
             match = self.pattern.match(line)
@@ -1044,7 +1180,8 @@ class FALogFile(object):
         parse the remainder of such lines.
         """
 
-        pattern = re.compile(r"""^(?P<drawcall>\d+) """)
+        # Hold frame analysis prefixes the draw call with the frame number:
+        pattern = re.compile(r"""^(?:(?P<frame>\d+)\.)?(?P<drawcall>\d+) """)
         next_parsers_classes = []
 
         @classmethod
@@ -1095,10 +1232,8 @@ class FALogFile(object):
                 for i in range(self.num_bindings(api_match)):
                     self.sparse_slots[state.draw_call].pop(start_slot + i, None)
             bindings = self.sparse_slots[state.draw_call]
-            while self.resource_pattern.match(q[0]):
-                # FIXME: Inefficiently calling match twice. I hate that Python
-                # lacks a do/while and every workaround is ugly in some way.
-                resource_match = self.resource_pattern.match(q.popleft())
+            while resource_match := self.resource_pattern.match(q.peek()):
+                next(q)
                 slot = resource_match.group("slot")
                 if slot.isnumeric():
                     slot = int(slot)
@@ -1123,6 +1258,7 @@ class FALogFile(object):
 
     class FALogParserSOSetTargets(FALogParserBindResources):
         pattern = re.compile(r"""SOSetTargets\(.*\)$""")
+        prefix = "SOSetTargets("
         slot_prefix = "so"
         bind_clears_all_slots = True
 
@@ -1132,6 +1268,7 @@ class FALogFile(object):
         pattern = re.compile(
             r"""IASetVertexBuffers\(StartSlot:(?P<StartSlot>[0-9]+), NumBuffers:(?P<NumBindings>[0-9]+),.*\)$"""
         )
+        prefix = "IASetVertexBuffers("
         slot_prefix = "vb"
 
     FALogParserDrawcall.register(FALogParserIASetVertexBuffers)
@@ -1200,57 +1337,514 @@ class FALogFile(object):
     #    bind_clears_all_slots = True
     # FALogParserDrawcall.register(FALogParserOMSetRenderTargets)
 
-    def __init__(self, f):
+    cache_version = 1
+
+    def __init__(self, f=None):
         self.draw_call = None
         self.slot_class = {}
         self.resource_index = collections.defaultdict(set)
+        self.interval_index = {}
+        if f is not None:
+            self.parse(f)
+
+    def parse(self, f):
         draw_call_parser = self.FALogParserDrawcall(self)
-        # Using a deque for a concise way to use a pop iterator and be able to
-        # peek/consume the following line. Maybe overkill, but shorter code
-        q = collections.deque(f)
-        q.append(None)
-        for line in iter(q.popleft, None):
-            # print(line)
-            if not draw_call_parser.parse(line, q, self):
-                # print(line)
-                pass
+        prefixes = tuple(parser.prefix for parser in draw_call_parser.next_parsers)
+        lines = self.LineReader(f)
+        last_draw_call = None
+        # Almost every line of a log is irrelevant to the slots we track, so
+        # reject them with cheap string checks before running any regex:
+        for line in lines:
+            space = line.find(" ")
+            frame, _, draw_call = line[:max(space, 0)].rpartition(".")
+            if not draw_call.isdigit() or (frame and not frame.isdigit()):
+                # Header, or a continuation line of a call we don't track
+                continue
+            last_draw_call = draw_call
+            if line.startswith(prefixes, space + 1):
+                draw_call_parser.parse(line, lines, self)
+        if last_draw_call is not None:
+            self.draw_call = int(last_draw_call)
+
+    @classmethod
+    def open(cls, path, cache_dir=None):
+        """
+        Parses the log file at path, or loads it from the cache saved in
+        cache_dir the first time it was parsed if the log hasn't changed
+        since. The cache is never written next to the log, as that would
+        change the mtime of the dump folder and fail on read-only dumps.
+        """
+        stat = os.stat(path)
+        cache_path = None
+        log = None
+        if cache_dir is not None:
+            key = os.path.normcase(os.path.abspath(path)).encode("utf-8")
+            cache_path = os.path.join(
+                cache_dir, hashlib.sha1(key).hexdigest() + ".npz"
+            )
+            log = cls.load_cache(cache_path, stat)
+        if log is None:
+            # Large read buffer to stream through logs that can be 100s of MB:
+            with open(path, "r", buffering=1024 * 1024) as f:
+                log = cls(f)
+            if cache_path is None:
+                return log
+            try:
+                log.save_cache(cache_path, stat)
+            except OSError as e:
+                print(f"Unable to save frame analysis log cache: {e}")
+        return log
+
+    def save_cache(self, cache_path, stat):
+        """
+        Saves the parsed slots and resource index in a compact binary form.
+        Only the slots that changed are stored for each draw call.
+        """
+        slot_types = list(self.slot_class)
+        arrays = {}
+        for i, slot_type in enumerate(slot_types):
+            sparse_slots = self.slot_class[slot_type]
+            rows = []
+            prev = {}
+            for draw_call in sparse_slots.draw_calls:
+                slots = dict.__getitem__(sparse_slots, draw_call)
+                for slot in prev.keys() - slots.keys():
+                    rows.append((draw_call, self.encode_slot(slot), 0, 0, 0, 0))
+                for slot, binding in slots.items():
+                    if prev.get(slot) != binding:
+                        view = binding.view_address
+                        if view is None:
+                            view = -1
+                        rows.append(
+                            (
+                                draw_call,
+                                self.encode_slot(slot),
+                                1,
+                                view,
+                                binding.resource_address,
+                                binding.resource_hash,
+                            )
+                        )
+                prev = slots
+            arrays[f"slots_{i}"] = numpy.array(rows, dtype=numpy.int64).reshape(-1, 6)
+            arrays[f"draw_calls_{i}"] = numpy.array(
+                sparse_slots.draw_calls, dtype=numpy.int64
+            )
+        uses = [
+            (
+                address,
+                use.draw_call,
+                slot_types.index(use.slot_type),
+                self.encode_slot(use.slot),
+            )
+            for address, resource_uses in self.resource_index.items()
+            for use in resource_uses
+        ]
+        arrays["resource_index"] = numpy.array(uses, dtype=numpy.int64).reshape(-1, 4)
+        meta = {
+            "version": self.cache_version,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "draw_call": self.draw_call,
+            "slot_types": slot_types,
+        }
+        arrays["meta"] = numpy.array(json.dumps(meta))
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            numpy.savez(f, **arrays)
+        os.replace(tmp_path, cache_path)
+
+    @classmethod
+    def load_cache(cls, cache_path, stat):
+        try:
+            with numpy.load(cache_path, allow_pickle=False) as npz:
+                meta = json.loads(str(npz["meta"]))
+                if (
+                    meta["version"] != cls.cache_version
+                    or meta["size"] != stat.st_size
+                    or meta["mtime"] != stat.st_mtime_ns
+                ):
+                    return None
+                arrays = {name: npz[name] for name in npz.files}
+        except (OSError, KeyError, ValueError):
+            return None
+
+        Binding = cls.FALogParserBindResources.FALogResourceBinding
+        log = cls()
+        log.draw_call = meta["draw_call"]
+        slot_types = meta["slot_types"]
+        for i, slot_type in enumerate(slot_types):
+            sparse_slots = cls.SparseSlots()
+            changes = collections.defaultdict(list)
+            for row in arrays[f"slots_{i}"].tolist():
+                changes[row[0]].append(row[1:])
+            for draw_call in arrays[f"draw_calls_{i}"].tolist():
+                slots = sparse_slots[draw_call]
+                for slot, bound, view, address, resource_hash in changes[draw_call]:
+                    slot = cls.decode_slot(slot)
+                    if not bound:
+                        slots.pop(slot, None)
+                        continue
+                    view = None if view == -1 else view
+                    slots[slot] = Binding(slot, view, address, resource_hash)
+            log.slot_class[slot_type] = sparse_slots
+        for address, draw_call, slot_type, slot in arrays["resource_index"].tolist():
+            log.resource_index[address].add(
+                cls.ResourceUse(draw_call, slot_types[slot_type], cls.decode_slot(slot))
+            )
+        return log
+
+    @staticmethod
+    def encode_slot(slot):
+        # Slots are numbered, apart from the depth target "D"
+        return -1 if slot == "D" else slot
+
+    @staticmethod
+    def decode_slot(slot):
+        return "D" if slot == -1 else slot
+
+    def resource_intervals(self, slot_class):
+        """
+        Bind / unbind intervals of every resource in the given slot class,
+        see SparseSlots.bound_intervals(). Built once on first use.
+        """
+        if slot_class not in self.interval_index:
+            sparse_slots = self.slot_class[slot_class]
+            self.interval_index[slot_class] = sparse_slots.bound_intervals()
+        return self.interval_index[slot_class]
 
     def find_resource_uses(self, resource_address, slot_class=None):
         """
         Find draw calls + slots where this resource is used.
         """
-        # return [ x for x in sorted(self.resource_index[resource_address]) if x.slot_type == slot_class ]
+        # A resource that was bound in a draw call could potentially have been
+        # left bound in subsequent draw calls that we also want to return, so
+        # each interval it stayed bound for gives a range of draw calls, up to
+        # the end of the frame if it was never unbound.
         ret = set()
-        for bound in sorted(self.resource_index[resource_address]):
-            if slot_class is not None and bound.slot_type != slot_class:
+        if slot_class is None:
+            slot_classes = self.slot_class.keys()
+        else:
+            slot_classes = (slot_class,)
+        for slot_type in slot_classes:
+            intervals = self.resource_intervals(slot_type).get(resource_address, ())
+            for slot, first, end in intervals:
+                if end is None:
+                    end = self.draw_call
+                for draw_call in range(first, end):
+                    ret.add(FALogFile.ResourceUse(draw_call, slot_type, slot))
+        return ret
+
+
+VBSOMapEntry = collections.namedtuple("VBSOMapEntry", ["draw_call", "slot"])
+
+
+class FrameAnalysisLog(object):
+    """
+    All of the log files of a frame analysis dump: log.txt for the immediate
+    context and a log-0x*.txt for each deferred context, each of which may
+    span several frames when frame analysis was held.
+
+    Frame boundaries are found by bisecting the log files rather than reading
+    them, and each (context, frame) section is only parsed into its own
+    FALogFile the first time it is queried. Contexts are identified by the
+    hex address in their file name (None for the immediate context), frames
+    by their number (None if frame analysis wasn't held). Whole log files
+    parsed this way are cached in cache_dir, if given.
+    """
+
+    Section = collections.namedtuple(
+        "Section", ["context", "frame", "path", "start", "end"]
+    )
+    HashUse = collections.namedtuple(
+        "HashUse", ["context", "frame", "draw_call", "slot"]
+    )
+    line_pattern = re.compile(rb"""^(?:(?P<frame>[0-9]+)\.)?[0-9]+ """)
+    log_pattern = re.compile(r"""^log(?:-0x(?P<context>[0-9a-fA-F]+))?\.txt$""")
+
+    def __init__(self, dirname, cache_dir=None):
+        self.dirname = dirname
+        self.cache_dir = cache_dir
+        self.sections = collections.OrderedDict()
+        self.logs = {}
+        with os.scandir(dirname) as it:
+            names = sorted(x.name for x in it if x.is_file())
+        for name in names:
+            match = self.log_pattern.match(name)
+            if match is None:
                 continue
-            # Resource was bound in this draw call, but could potentially have
-            # been left bound in subsequent draw calls that we also want to
-            # return, so return a range of draw calls if appropriate:
-            sparse_slots = self.slot_class[bound.slot_type]
-            for sparse_draw_call in sparse_slots.subsequent_draw_calls(bound.draw_call):
-                if (
-                    bound.slot not in sparse_slots[sparse_draw_call]
-                    or sparse_slots[sparse_draw_call][bound.slot].resource_address
-                    != resource_address
-                ):
-                    # print('x', sparse_draw_call, sparse_slots[sparse_draw_call][bound.slot])
-                    for draw_call in range(bound.draw_call, sparse_draw_call):
-                        ret.add(
-                            FALogFile.ResourceUse(
-                                draw_call, bound.slot_type, bound.slot
-                            )
-                        )
+            context = match.group("context")
+            path = os.path.join(dirname, name)
+            for frame, start, end in self.find_frames(path):
+                self.sections[(context, frame)] = self.Section(
+                    context, frame, path, start, end
+                )
+        if not self.sections:
+            raise FileNotFoundError(f"No frame analysis log found in {dirname}")
+
+    def frame_at(self, f, offset):
+        """
+        Returns the frame number and start offset of the first draw call line
+        starting at or after offset, or None if there are no more.
+        """
+        if offset > 0:
+            f.seek(offset - 1)
+            f.readline()  # Skip to the start of the next line
+        else:
+            f.seek(0)
+        while True:
+            line_start = f.tell()
+            line = f.readline()
+            if not line:
+                return None
+            match = self.line_pattern.match(line)
+            if match:
+                frame = match.group("frame")
+                return (frame and int(frame), line_start)
+
+    def find_frames(self, path):
+        """Returns (frame, start, end) for every frame in the log file"""
+        with open(path, "rb") as f:
+            first = self.frame_at(f, 0)
+            if first is None or first[0] is None:
+                return [(None, 0, None)]
+            size = f.seek(0, os.SEEK_END)
+            starts = [(first[0], 0)]
+            frame, offset = first
+            while True:
+                # Bisect for the first line belonging to a later frame:
+                lo, hi = offset, size + 1
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    found = self.frame_at(f, mid)
+                    if found is not None and found[0] == frame:
+                        lo = mid
+                    else:
+                        hi = mid
+                found = self.frame_at(f, hi)
+                if found is None:
                     break
-                # print('y', sparse_draw_call, sparse_slots[sparse_draw_call][bound.slot])
+                frame, offset = found
+                starts.append(found)
+        ends = [start for _, start in starts[1:]] + [None]
+        return [(frame, start, end) for (frame, start), end in zip(starts, ends)]
+
+    @property
+    def contexts(self):
+        return list(collections.OrderedDict.fromkeys(x[0] for x in self.sections))
+
+    def frames(self, context=None):
+        return [frame for ctx, frame in self.sections if ctx == context]
+
+    def read_lines(self, section):
+        with open(section.path, "rb", buffering=1024 * 1024) as f:
+            f.seek(section.start)
+            pos = section.start
+            for line in f:
+                if section.end is not None and pos >= section.end:
+                    break
+                pos += len(line)
+                yield line.decode("utf-8", "replace")
+
+    def get(self, context=None, frame=None):
+        """
+        Returns the FALogFile for one frame of one context, parsing it on
+        first use. If frame is None the first frame of the context is used.
+        """
+        if frame is None:
+            frames = self.frames(context)
+            if not frames:
+                raise KeyError(f"No log found for context {context}")
+            frame = frames[0]
+        key = (context, frame)
+        if key not in self.logs:
+            section = self.sections[key]
+            if section.start == 0 and section.end is None:
+                # Whole file, can use the parsed log cache:
+                self.logs[key] = FALogFile.open(section.path, self.cache_dir)
             else:
-                # I love Python's for/else clause. Means we didn't hit the
-                # above break so the resource was still bound at end of frame
-                for draw_call in range(bound.draw_call, self.draw_call):
-                    ret.add(
-                        FALogFile.ResourceUse(draw_call, bound.slot_type, bound.slot)
-                    )
+                self.logs[key] = FALogFile(self.read_lines(section))
+        return self.logs[key]
+
+    def section_contains(self, section, needle, chunk_size=4 * 1024 * 1024):
+        """Raw byte search of a section, far cheaper than parsing it"""
+        with open(section.path, "rb") as f:
+            f.seek(section.start)
+            remaining = None if section.end is None else section.end - section.start
+            tail = b""
+            while remaining is None or remaining > 0:
+                size = chunk_size if remaining is None else min(chunk_size, remaining)
+                chunk = f.read(size)
+                if not chunk:
+                    return False
+                if remaining is not None:
+                    remaining -= len(chunk)
+                if needle in tail + chunk:
+                    return True
+                tail = chunk[-len(needle) + 1 :]
+        return False
+
+    def find_hash(self, resource_hash, slot_class="vb"):
+        """
+        Which contexts / frames / draw calls bound a resource with this hash
+        to the given slot class. Only sections whose text contains the hash
+        at all are parsed.
+        """
+        if isinstance(resource_hash, str):
+            resource_hash = int(resource_hash, 16)
+        needle = b"hash=%08x" % resource_hash
+        ret = []
+        for (context, frame), section in self.sections.items():
+            if not self.section_contains(section, needle):
+                continue
+            sparse_slots = self.get(context, frame).slot_class.get(slot_class)
+            if sparse_slots is None:
+                continue
+            for draw_call in sparse_slots.draw_calls:
+                for slot, binding in dict.__getitem__(sparse_slots, draw_call).items():
+                    if binding.resource_hash == resource_hash:
+                        ret.append(self.HashUse(context, frame, draw_call, slot))
         return ret
 
 
-VBSOMapEntry = collections.namedtuple("VBSOMapEntry", ["draw_call", "slot"])
+class FrameAnalysisDumpIndex(object):
+    """
+    Index of the files in a frame analysis dump folder, built with a single
+    directory scan. Every filename is parsed once into its draw call prefix
+    ("000123", or "4.000123" in hold frame analysis dumps), slot,
+    hash, shader hashes and extension so that finding the buffers related to
+    a selected file becomes a handful of dictionary lookups instead of
+    repeated globbing over folders that can easily hold 100k files.
+
+    The parsed entries can be persisted to a JSON cache keyed by the mtime of
+    the dump folder, so re-opening a previously indexed dump skips the scan.
+    """
+
+    version = 2
+    buffer_pattern = re.compile(
+        r"""-(?:ib|vb[0-9]+)(?P<hash>=[0-9a-f]+)?(?=[^0-9a-f=])"""
+    )
+    filename_pattern = re.compile(
+        r"""^(?P<prefix>(?:[0-9]+\.)?[0-9]+)-(?P<slot>(?:[a-z]{2}-)?[a-zA-Z]+[0-9]*)(?:=(?:![A-Z]!=)?(?P<hash>[0-9a-f]+))?(?P<shaders>(?:-[a-z]{2}=[0-9a-f]+)*)(?P<ext>\.[^.]+)$"""
+    )
+    shader_pattern = re.compile(r"""-(?P<type>[a-z]{2})=(?P<hash>[0-9a-f]+)""")
+    Entry = collections.namedtuple(
+        "Entry", ["name", "prefix", "slot", "hash", "shaders", "ext"]
+    )
+
+    def __init__(self, dirname, entries=None, mtime=None):
+        self.dirname = dirname
+        self.mtime = mtime
+        if entries is None:
+            self.mtime = os.stat(dirname).st_mtime_ns
+            entries = self.scan(dirname)
+        self.entries = entries
+        self.build_lookups()
+
+    @classmethod
+    def scan(cls, dirname):
+        with os.scandir(dirname) as it:
+            names = sorted(x.name for x in it if x.is_file())
+        return [cls.parse_filename(name) for name in names]
+
+    @classmethod
+    def parse_filename(cls, name):
+        match = cls.filename_pattern.match(name)
+        if match is None:
+            return cls.Entry(name, None, None, None, {}, os.path.splitext(name)[1])
+        shaders = {
+            x.group("type"): x.group("hash")
+            for x in cls.shader_pattern.finditer(match.group("shaders"))
+        }
+        return cls.Entry(
+            name,
+            match.group("prefix"),
+            match.group("slot"),
+            match.group("hash"),
+            shaders,
+            match.group("ext"),
+        )
+
+    def build_lookups(self):
+        self.names = set()
+        # "-vb0=1234abcd" -> names, replaces glob("*-vb0=1234abcd*.txt"):
+        self.by_buffer_hash = collections.defaultdict(list)
+        # (prefix, suffix) -> {"ib": names, "vb": names}, replaces
+        # glob(prefix + "-ib*" + suffix) and glob(prefix + "-vb*" + suffix):
+        self.by_buffer_group = collections.defaultdict(
+            lambda: {"ib": [], "vb": []}
+        )
+        # draw call prefix -> entries, replaces glob("000123-vb*.txt"), pose
+        # CBs, etc:
+        self.by_prefix = collections.defaultdict(list)
+        for entry in self.entries:
+            self.names.add(entry.name)
+            if entry.prefix is not None:
+                self.by_prefix[entry.prefix].append(entry)
+            match = self.buffer_pattern.search(entry.name)
+            if match is None:
+                continue
+            prefix, suffix = entry.name[: match.start()], entry.name[match.end() :]
+            kind = entry.name[match.start() + 1 : match.start() + 3]
+            self.by_buffer_group[(prefix, suffix)][kind].append(entry.name)
+            if match.group("hash") and entry.ext == ".txt":
+                self.by_buffer_hash[match.group(0)].append(entry.name)
+
+    def path(self, name):
+        return os.path.join(self.dirname, name)
+
+    def exists(self, name):
+        return name in self.names
+
+    def find_related(self, buffer_hash):
+        """Names of .txt files containing the given '-vbN=hash' / '-ib=hash'"""
+        return self.by_buffer_hash.get(buffer_hash, [])
+
+    def find_buffers(self, prefix, suffix, kind):
+        group = self.by_buffer_group.get((prefix, suffix))
+        if group is None:
+            return []
+        return group[kind]
+
+    def find_slot(self, prefix, slot, ext=None, startswith=False):
+        """Names of files dumped from the given draw call prefix and slot"""
+        ret = []
+        for entry in self.by_prefix.get(prefix, []):
+            if entry.slot is None or (ext is not None and entry.ext != ext):
+                continue
+            if entry.slot == slot or (startswith and entry.slot.startswith(slot)):
+                ret.append(entry.name)
+        return ret
+
+    def serialise(self):
+        return {
+            "version": self.version,
+            "dirname": self.dirname,
+            "mtime": self.mtime,
+            "entries": [list(x) for x in self.entries],
+        }
+
+    def save(self, cache_path):
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.serialise(), f, separators=(",", ":"))
+        os.replace(tmp_path, cache_path)
+
+    @classmethod
+    def load(cls, dirname, cache_path):
+        """
+        Load the index from cache_path if it is still valid for the current
+        mtime of the dump folder, returns None if it needs to be rebuilt.
+        """
+        try:
+            with open(cache_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (
+            data.get("version") != cls.version
+            or data.get("mtime") != os.stat(dirname).st_mtime_ns
+        ):
+            return None
+        entries = [cls.Entry(*x) for x in data["entries"]]
+        return cls(dirname, entries, data["mtime"])
@@ -1,26 +1,34 @@
 import collections
 import json
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import SimpleQueue
+from operator import attrgetter
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Optional
 import textwrap
 import shutil
 import bpy
 from bpy.props import (
     BoolProperty,
     EnumProperty,
+    FloatProperty,
     PointerProperty,
     StringProperty,
     IntProperty,
 )
 from bpy.types import Context, Mesh, Object, Operator, PropertyGroup
 from bpy_extras.io_utils import ExportHelper
+import numpy
 from .data.byte_buffer import (
     AbstractSemantic,
     BufferLayout,
+    BufferSemantic,
+    NumpyBuffer,
     Semantic,
 )
-from .data.dxgi_format import DXGIType
+from .data.data_extractor import BlenderDataExtractor
+from .data.dxgi_format import DXGIFormat, DXGIType
 from .datahandling import (
     Fatal,
     custom_attributes_float,
@@ -30,13 +38,11 @@ from .datahandling import (
 )
 from .datastructures import (
     GameEnum,
-    HashableVertex,
     IndexBuffer,
     InputLayout,
     VertexBufferGroup,
     game_enum,
 )
-from .exporter import ModExporter
 
 
 
@@ -67,171 +73,107 @@ def normal_export_translation(
     return lambda x: x
 
 def apply_modifiers_and_shapekeys(context: Context, obj: Object) -> Mesh:
-    """Apply all modifiers to a mesh with shapekeys. Preserves shapekeys named Deform"""
+    """
+    Apply all modifiers to a mesh with shapekeys. Preserves shapekeys named Deform
+
+    Other shapekeys are applied at their current value. Each preserved
+    shapekey is evaluated through the depsgraph with its value temporarily
+    set to 1.0 (and the other preserved ones to 0.0), and the evaluated
+    coordinates are stored as a shapekey of the returned mesh.
+
+    The returned mesh is always a new datablock in bpy.data, owned by the
+    caller, which must remove it with bpy.data.meshes.remove once done.
+    """
     start_timer = time.time()
     deform_SKs = []
     total_applied = 0
-    desgraph = context.evaluated_depsgraph_get()
+    depsgraph = context.evaluated_depsgraph_get()
     modifiers_to_apply = [mod for mod in obj.modifiers if mod.show_viewport]
     if obj.data.shape_keys is not None:
         deform_SKs = [
-            sk.name
-            for sk in obj.data.shape_keys.key_blocks
+            sk
+            for sk in obj.data.shape_keys.key_blocks[1:]
             if "deform" in sk.name.lower()
         ]
         total_applied = len(obj.data.shape_keys.key_blocks) - len(deform_SKs)
 
     if len(deform_SKs) == 0:
-        mesh = obj.evaluated_get(desgraph).to_mesh()
-    else:
-        mesh = obj.to_mesh()
-        result_obj = obj.copy()
-        result_obj.data = mesh.copy()
-        context.collection.objects.link(result_obj)
-        for sk in obj.data.shape_keys.key_blocks:
-            if sk.name not in deform_SKs:
-                result_obj.shape_key_remove(sk)
-        list_properties = []
-        vert_count = -1
-        bpy.ops.object.select_all(action="DESELECT")
-        result_obj.select_set(True)
-        bpy.ops.object.duplicate_move(
-            OBJECT_OT_duplicate={"linked": False, "mode": "TRANSLATION"},
-            TRANSFORM_OT_translate={
-                "value": (0, 0, 0),
-                "orient_type": "GLOBAL",
-                "orient_matrix": ((1, 0, 0), (0, 1, 0), (0, 0, 1)),
-                "orient_matrix_type": "GLOBAL",
-                "constraint_axis": (False, False, False),
-                "mirror": True,
-                "use_proportional_edit": False,
-                "proportional_edit_falloff": "SMOOTH",
-                "proportional_size": 1,
-                "use_proportional_connected": False,
-                "use_proportional_projected": False,
-                "snap": False,
-                "snap_target": "CLOSEST",
-                "snap_point": (0, 0, 0),
-                "snap_align": False,
-                "snap_normal": (0, 0, 0),
-                "gpencil_strokes": False,
-                "cursor_transform": False,
-                "texture_space": False,
-                "remove_on_cancel": False,
-                "release_confirm": False,
-                "use_accurate": False,
-            },
+        mesh = bpy.data.meshes.new_from_object(
+            obj.evaluated_get(depsgraph),
+            preserve_all_data_layers=True,
+            depsgraph=depsgraph,
         )
-        copy_obj = context.view_layer.objects.active
-        copy_obj.select_set(False)
-        context.view_layer.objects.active = result_obj
-        result_obj.select_set(True)
-        # Store key shape properties
-        for key_b in obj.data.shape_keys.key_blocks:
-            properties_object = {}
-            properties_object["name"] = key_b.name
-            properties_object["mute"] = key_b.mute
-            properties_object["interpolation"] = key_b.interpolation
-            properties_object["relative_key"] = key_b.relative_key.name
-            properties_object["slider_max"] = key_b.slider_max
-            properties_object["slider_min"] = key_b.slider_min
-            properties_object["value"] = key_b.value
-            properties_object["vertex_group"] = key_b.vertex_group
-            list_properties.append(properties_object)
-            result_obj.shape_key_remove(key_b)
-        # Set up Basis
-        result_obj = result_obj.evaluated_get(desgraph)
-        # bpy.ops.object.shape_key_add(from_mix=False)
-        # for mod in modifiers_to_apply:
-        #     bpy.ops.object.modifier_apply(modifier=mod.name)
-        mesh = result_obj.to_mesh()
-        vert_count = len(result_obj.data.vertices)
-        result_obj.select_set(False)
-        # Create a temp object to apply modifiers into once per SK
-        for i in range(1, obj.data.shape_keys.key_blocks):
-            context.view_layer.objects.active = copy_obj
-            copy_obj.select_set(True)
-            bpy.ops.object.duplicate_move(
-                OBJECT_OT_duplicate={"linked": False, "mode": "TRANSLATION"},
-                TRANSFORM_OT_translate={
-                    "value": (0, 0, 0),
-                    "orient_type": "GLOBAL",
-                    "orient_matrix": ((1, 0, 0), (0, 1, 0), (0, 0, 1)),
-                    "orient_matrix_type": "GLOBAL",
-                    "constraint_axis": (False, False, False),
-                    "mirror": True,
-                    "use_proportional_edit": False,
-                    "proportional_edit_falloff": "SMOOTH",
-                    "proportional_size": 1,
-                    "use_proportional_connected": False,
-                    "use_proportional_projected": False,
-                    "snap": False,
-                    "snap_target": "CLOSEST",
-                    "snap_point": (0, 0, 0),
-                    "snap_align": False,
-                    "snap_normal": (0, 0, 0),
-                    "gpencil_strokes": False,
-                    "cursor_transform": False,
-                    "texture_space": False,
-                    "remove_on_cancel": False,
-                    "release_confirm": False,
-                    "use_accurate": False,
-                },
+    else:
+        # Stash every setting that is overridden while evaluating:
+        properties = [
+            {
+                "value": sk.value,
+                "mute": sk.mute,
+                "slider_min": sk.slider_min,
+                "slider_max": sk.slider_max,
+                "vertex_group": sk.vertex_group,
+            }
+            for sk in deform_SKs
+        ]
+        show_only_shape_key = obj.show_only_shape_key
+        try:
+            obj.show_only_shape_key = False
+            for sk in deform_SKs:
+                sk.vertex_group = ""
+                sk.slider_min = min(sk.slider_min, 0.0)
+                sk.slider_max = max(sk.slider_max, 1.0)
+                sk.value = 0.0
+                sk.mute = False
+            depsgraph.update()
+            mesh = bpy.data.meshes.new_from_object(
+                obj.evaluated_get(depsgraph),
+                preserve_all_data_layers=True,
+                depsgraph=depsgraph,
             )
-            temp_obj = context.view_layer.objects.active
-            for k in temp_obj.data.shape_keys.key_blocks:
-                temp_obj.shape_key_remove(k)
-
-            copy_obj.select_set(True)
-            copy_obj.active_shape_key_index = i
-
-            bpy.ops.object.shape_key_transfer(use_clamp=True)
-            context.object.active_shape_key_index = 0
-            bpy.ops.object.shape_key_remove()
-            bpy.ops.object.shape_key_remove(all=True)
-            for mod in modifiers_to_apply:
-                bpy.ops.object.modifier_apply(modifier=mod.name)
-            if vert_count != len(temp_obj.data.vertices):
-                raise Fatal(
-                    f"After modifier application, object {obj.name} has a different vertex count in shape key {i} than in the basis shape key. Manual resolution required."
-                )
-            copy_obj.select_set(False)
-            context.view_layer.objects.active = result_obj
-            result_obj.select_set(True)
-            bpy.ops.object.join_shapes()
-            result_obj.select_set(False)
-            context.view_layer.objects.active = temp_obj
-            bpy.ops.object.delete(use_global=False)
-        # Restore shape key properties like name, mute etc.
-        context.view_layer.objects.active = result_obj
-        for i in range(0, obj.data.shape_keys.key_blocks):
-            key_b = context.view_layer.objects.active.data.shape_keys.key_blocks[i]
-            key_b.name = list_properties[i]["name"]
-            key_b.interpolation = list_properties[i]["interpolation"]
-            key_b.mute = list_properties[i]["mute"]
-            key_b.slider_max = list_properties[i]["slider_max"]
-            key_b.slider_min = list_properties[i]["slider_min"]
-            key_b.value = list_properties[i]["value"]
-            key_b.vertex_group = list_properties[i]["vertex_group"]
-            rel_key = list_properties[i]["relative_key"]
-
-            for j in range(0, obj.data.shape_keys.key_blocks):
-                key_brel = context.view_layer.objects.active.data.shape_keys.key_blocks[
-                    j
-                ]
-                if rel_key == key_brel.name:
-                    key_b.relative_key = key_brel
-                    break
-            context.view_layer.objects.active.data.update()
-        result_obj.select_set(False)
-        context.view_layer.objects.active = copy_obj
-        copy_obj.select_set(True)
-        bpy.ops.object.delete(use_global=False)
-        bpy.ops.object.select_all(action="DESELECT")
-        context.view_layer.objects.active = result_obj
-        context.view_layer.objects.active.select_set(True)
-        mesh = result_obj.data
-        bpy.ops.object.delete(use_global=False)
+            vert_count = len(mesh.vertices)
+            coords = numpy.empty((len(deform_SKs), vert_count, 3), numpy.float32)
+            for i, sk in enumerate(deform_SKs):
+                sk.value = 1.0
+                depsgraph.update()
+                evaluated = obj.evaluated_get(depsgraph)
+                sk_mesh = evaluated.to_mesh()
+                if vert_count != len(sk_mesh.vertices):
+                    evaluated.to_mesh_clear()
+                    bpy.data.meshes.remove(mesh)
+                    raise Fatal(
+                        f"After modifier application, object {obj.name} has a different vertex count in shape key {sk.name} than in the basis shape key. Manual resolution required."
+                    )
+                sk_mesh.vertices.foreach_get("co", coords[i].ravel())
+                evaluated.to_mesh_clear()
+                sk.value = 0.0
+        finally:
+            for sk, props in zip(deform_SKs, properties):
+                for name, value in props.items():
+                    setattr(sk, name, value)
+            obj.show_only_shape_key = show_only_shape_key
+            depsgraph.update()
+
+        # Shapekeys can only be added through an object, but it doesn't need
+        # to be linked to the scene:
+        temp_obj = bpy.data.objects.new(obj.name + "_shapekeys", mesh)
+        try:
+            basis = temp_obj.shape_key_add(
+                name=obj.data.shape_keys.key_blocks[0].name, from_mix=False
+            )
+            for sk, props, co in zip(deform_SKs, properties, coords):
+                key_b = temp_obj.shape_key_add(name=sk.name, from_mix=False)
+                key_b.data.foreach_set("co", co.ravel())
+                key_b.interpolation = sk.interpolation
+                key_b.mute = props["mute"]
+                key_b.slider_min = props["slider_min"]
+                key_b.slider_max = props["slider_max"]
+                key_b.value = props["value"]
+                key_b.vertex_group = props["vertex_group"]
+                # Evaluated on top of the basis, so no longer relative to
+                # whichever key it was relative to before:
+                key_b.relative_key = basis
+        finally:
+            bpy.data.objects.remove(temp_obj)
 
     print(
         f"\tApplied {len(modifiers_to_apply)} modifiers, {total_applied} shapekeys and stored {len(deform_SKs)} shapekeys in {time.time() - start_timer:.5f} seconds"
@@ -337,9 +279,16 @@ class XXMIProperties(PropertyGroup):
     )
     export_shapekeys: BoolProperty(
         name="Export shape keys",
-        description="Exports marked shape keys for the selected object. Also generates the necessary sections in ini file",
+        description="Exports shape keys named Deform, storing only the vertices each of them moves. Also generates the necessary sections in ini file",
         default=False,
     )
+    shapekey_threshold: FloatProperty(
+        name="Shape key threshold",
+        description="Vertices a shape key moves less than this along every axis are left out of its buffer",
+        default=1e-5,
+        min=0.0,
+        precision=6,
+    )
     batch_pattern: StringProperty(
         name="Batch pattern",
         description="Pattern to name export folders. Example: name_###",
@@ -355,6 +304,36 @@ class XXMIProperties(PropertyGroup):
         description="Writes the ini file to disk. Disabling this won't refresh the ini file in the mod folder, useful for debugging.",
         default=True,
     )
+    split_draw_calls: BoolProperty(
+        name="Draw objects separately",
+        description="Issues one drawindexed per object so each can be toggled in the ini. Otherwise objects laid out next to each other are drawn with a single call",
+        default=False,
+    )
+    pack_index_buffers: BoolProperty(
+        name="Pack index buffers",
+        description="Writes a single index buffer per component instead of one per part, so the mod loads and binds fewer buffers",
+        default=False,
+    )
+    use_16bit_indices: BoolProperty(
+        name="Use 16-bit indices",
+        description="Writes index buffers as R16_UINT when they address fewer than 65535 vertices, halving their size. Custom templates must declare the IB resources with the ib_format of each part or component",
+        default=False,
+    )
+    optimize_vertex_cache: BoolProperty(
+        name="Optimize vertex cache",
+        description="Reorders triangles and vertices so the GPU reuses more transformed vertices when drawing the mod. Slower export, prints the cache miss ratios to the console",
+        default=False,
+    )
+    remap_vertex_groups: BoolProperty(
+        name="Remap numbered vertex groups",
+        description="Exports each vertex group as the bone index in its name instead of its position in the list, as if missing numbers were filled in and the groups sorted by name",
+        default=False,
+    )
+    merge_ini: BoolProperty(
+        name="Merge into existing ini",
+        description="Only updates the override, resource and shape key sections of the exported components in the ini already in the mod folder, keeping any sections and comments added by hand",
+        default=False,
+    )
 
 
 class Export3DMigoto(Operator, ExportHelper):
@@ -426,9 +405,16 @@ class Export3DMigotoXXMI(Operator, ExportHelper):
             box_tex.prop(xxmi, "no_ramps")
             box_tex.prop(xxmi, "ignore_duplicate_textures")
         col.prop(xxmi, "write_buffers")
+        if xxmi.write_buffers:
+            box_buf = col.box()
+            box_buf.prop(xxmi, "pack_index_buffers")
+            box_buf.prop(xxmi, "use_16bit_indices")
+            box_buf.prop(xxmi, "optimize_vertex_cache")
         col.prop(xxmi, "write_ini")
         if xxmi.write_ini:
             box_ini = col.box()
+            box_ini.prop(xxmi, "merge_ini")
+            box_ini.prop(xxmi, "split_draw_calls")
             box_ini.prop(xxmi, "credit")
         col = box.column(align=True)
         split = col.split(factor=0.25)
@@ -437,7 +423,12 @@ class Export3DMigotoXXMI(Operator, ExportHelper):
         col_1.prop(xxmi, "outline_optimization")
         col_2.enabled = xxmi.outline_optimization
         col_2.prop(xxmi, "outline_rounding_precision")
-        # col.prop(xxmi, 'export_shapekeys')
+        split = col.split(factor=0.25)
+        col_1 = split.column()
+        col_2 = split.column()
+        col_1.prop(xxmi, "export_shapekeys")
+        col_2.enabled = xxmi.export_shapekeys
+        col_2.prop(xxmi, "shapekey_threshold")
         # col.prop(xxmi, "export_materials")
 
     def execute(self, context):
@@ -449,6 +440,9 @@ class Export3DMigotoXXMI(Operator, ExportHelper):
                     "Please select a valid game before continuing.",
                 )
                 return {"CANCELLED"}
+            # Deferred, the exporter pulls in jinja2 and the export data model
+            from .exporter import ModExporter
+
             mod_exporter: ModExporter = ModExporter(
                 context=context,
                 operator=self,
@@ -466,6 +460,14 @@ class Export3DMigotoXXMI(Operator, ExportHelper):
                 normalize_weights=xxmi.normalize_weights,
                 write_ini=xxmi.write_ini,
                 write_buffers=xxmi.write_buffers,
+                export_shapekeys=xxmi.export_shapekeys,
+                shapekey_threshold=xxmi.shapekey_threshold,
+                merge_ini=xxmi.merge_ini,
+                split_draw_calls=xxmi.split_draw_calls,
+                pack_index_buffers=xxmi.pack_index_buffers,
+                use_16bit_indices=xxmi.use_16bit_indices,
+                optimize_vertex_cache=xxmi.optimize_vertex_cache,
+                remap_vertex_groups=xxmi.remap_vertex_groups,
             )
             mod_exporter.export()
         except Fatal as e:
@@ -566,44 +568,144 @@ class ExportAdvancedOperator(Operator):
     bl_options = {"REGISTER"}
     operations = []
 
-    def execute(self, context):
+    def create_exporter(self, context):
         scene = bpy.context.scene
         xxmi: XXMIProperties = scene.xxmi
         if not xxmi.use_custom_template:
             xxmi.template_path = ""
+        if xxmi.game == "":
+            raise Fatal("Please select a valid game before continuing.")
+        # Deferred, the exporter pulls in jinja2 and the export data model
+        from .exporter import ModExporter
+
+        return ModExporter(
+            context=context,
+            operator=self,
+            dump_path=Path(xxmi.dump_path),
+            destination=Path(xxmi.destination_path),
+            game=GameEnum[xxmi.game],
+            ignore_hidden=xxmi.ignore_hidden,
+            only_selected=xxmi.only_selected,
+            no_ramps=xxmi.no_ramps,
+            copy_textures=xxmi.copy_textures,
+            ignore_duplicate_textures=xxmi.ignore_duplicate_textures,
+            credit=xxmi.credit,
+            outline_optimization=xxmi.outline_optimization,
+            apply_modifiers=xxmi.apply_modifiers_and_shapekeys,
+            normalize_weights=xxmi.normalize_weights,
+            write_buffers=xxmi.write_buffers,
+            write_ini=xxmi.write_ini,
+            template=Path(xxmi.template_path)
+            if xxmi.use_custom_template != ""
+            else None,
+            export_shapekeys=xxmi.export_shapekeys,
+            shapekey_threshold=xxmi.shapekey_threshold,
+            merge_ini=xxmi.merge_ini,
+            split_draw_calls=xxmi.split_draw_calls,
+            pack_index_buffers=xxmi.pack_index_buffers,
+            use_16bit_indices=xxmi.use_16bit_indices,
+            optimize_vertex_cache=xxmi.optimize_vertex_cache,
+            remap_vertex_groups=xxmi.remap_vertex_groups,
+        )
+
+    def execute(self, context):
         try:
-            if xxmi.game == "":
-                self.report(
-                    {"ERROR"},
-                    "Please select a valid game before continuing.",
-                )
-                return {"CANCELLED"}
-            mod_exporter: ModExporter = ModExporter(
-                context=context,
-                operator=self,
-                dump_path=Path(xxmi.dump_path),
-                destination=Path(xxmi.destination_path),
-                game=GameEnum[xxmi.game],
-                ignore_hidden=xxmi.ignore_hidden,
-                only_selected=xxmi.only_selected,
-                no_ramps=xxmi.no_ramps,
-                copy_textures=xxmi.copy_textures,
-                ignore_duplicate_textures=xxmi.ignore_duplicate_textures,
-                credit=xxmi.credit,
-                outline_optimization=xxmi.outline_optimization,
-                apply_modifiers=xxmi.apply_modifiers_and_shapekeys,
-                normalize_weights=xxmi.normalize_weights,
-                write_buffers=xxmi.write_buffers,
-                write_ini=xxmi.write_ini,
-                template=Path(xxmi.template_path)
-                if xxmi.use_custom_template != ""
-                else None,
-            )
-            mod_exporter.export()
+            self.create_exporter(context).export()
         except Fatal as e:
             self.report({"ERROR"}, str(e))
         return {"FINISHED"}
 
+    def invoke(self, context, event):
+        # Runs modal: parts are read from Blender on timer ticks while a worker
+        # thread finishes the buffers and writes the files, so the UI stays
+        # responsive and ESC cancels the export
+        try:
+            self.exporter = self.create_exporter(context)
+            self.steps = self.exporter.export_steps()
+            step_count: int = self.exporter.export_step_count
+        except Fatal as e:
+            self.report({"ERROR"}, str(e))
+            return {"CANCELLED"}
+        self.exporter.deferred_reports = SimpleQueue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.jobs: list[Future] = []
+        self.error: Optional[Exception] = None
+        self.step: int = 0
+        self.start: float = time.time()
+        wm = context.window_manager
+        wm.progress_begin(0, step_count)
+        self.timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        self.pass_reports()
+        if event.type == "ESC" and event.value == "PRESS":
+            self.stop()
+            context.workspace.status_text_set("Cancelling export...")
+            return {"RUNNING_MODAL"}
+        if event.type != "TIMER":
+            # Input is held back until the export is done, editing or undoing
+            # would free the evaluated meshes the exporter holds on to
+            return {"RUNNING_MODAL"}
+        if self.steps is not None:
+            try:
+                message, job = next(self.steps)
+            except StopIteration:
+                self.steps = None
+            except Exception as e:
+                self.stop()
+                self.error = e
+            else:
+                self.step += 1
+                if job is not None:
+                    self.jobs.append(self.executor.submit(job))
+                context.window_manager.progress_update(self.step)
+                context.workspace.status_text_set(
+                    f"Exporting {self.exporter.mod_name}: {message} "
+                    f"({self.step}/{self.exporter.export_step_count}), ESC to cancel"
+                )
+            return {"RUNNING_MODAL"}
+        if not all(job.done() for job in self.jobs):
+            return {"RUNNING_MODAL"}
+        return self.finish(context)
+
+    def stop(self) -> None:
+        """Stops reading parts and drops the jobs that haven't started yet"""
+        self.exporter.cancel_event.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.steps = None
+
+    def pass_reports(self) -> None:
+        while not self.exporter.deferred_reports.empty():
+            self.report(*self.exporter.deferred_reports.get())
+
+    def finish(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        self.executor.shutdown(wait=True)
+        self.exporter.cleanup()
+        self.pass_reports()
+        self.exporter.deferred_reports = None
+        from .exporter import ExportCancelled
+
+        errors: list[BaseException] = [self.error] if self.error else []
+        errors += [job.exception() for job in self.jobs if not job.cancelled()]
+        for error in errors:
+            if error is None or isinstance(error, ExportCancelled):
+                continue
+            if isinstance(error, Fatal):
+                self.report({"ERROR"}, str(error))
+                return {"CANCELLED"}
+            raise error
+        if self.exporter.cancel_event.is_set() and not self.exporter.files_replaced:
+            self.report({"WARNING"}, "Export cancelled, no files were changed")
+            return {"CANCELLED"}
+        self.exporter.report_exported(time.time() - self.start)
+        return {"FINISHED"}
+
 
 class ExportAdvancedBatchedOperator(Operator):
     """Export operation base class"""
@@ -784,31 +886,108 @@ def write_ini_file(
     f.write(resource_section)
 
 
-def blender_vertex_to_3dmigoto_vertex(
+def fetch_blender_data(data_source, data_name: str, dtype, width: int = 1):
+    """foreach_get() a property of every item in data_source as a numpy array"""
+    return BlenderDataExtractor().fetch_data(
+        data_source, data_name, dtype if width == 1 else (dtype, width)
+    )
+
+
+def pad_columns(elem, data, val):
+    """Vectorised InputLayoutElement.pad(), val may be a scalar or per row"""
+    padding = elem.format_len - data.shape[1]
+    if padding < 0:
+        raise Fatal(
+            "%s has more components than its format %s can hold"
+            % (elem.name, elem.Format)
+        )
+    if padding == 0:
+        return data
+    pad = numpy.empty((len(data), padding), dtype=numpy.float64)
+    pad[:] = numpy.reshape(val, (-1, 1))
+    return numpy.hstack((data, pad))
+
+
+def blender_mesh_to_3dmigoto_columns(
     mesh: Mesh,
     obj: Object,
-    blender_loop_vertex,
-    layout,
-    texcoords,
-    blender_vertex,
+    layout: InputLayout,
+    vertex_ids,
+    loop_ids,
     translate_normal,
     translate_tangent,
-    export_outline=None,
 ):
-    if blender_loop_vertex is not None:
-        blender_vertex = mesh.vertices[blender_loop_vertex.vertex_index]
-    vertex = {}
-    blp_normal = list(blender_loop_vertex.normal)
+    """
+    Builds the data of every per-vertex element of the layout for all of the
+    exported vertices at once, as arrays of shape (vertices, components).
+    vertex_ids are the Blender vertex and loop_ids the Blender loop (None for
+    pointlist topology) each exported vertex comes from.
+
+    Values are kept as float64 until they are encoded, so that they are only
+    rounded once to the output format. Elements that cannot be filled are
+    left out.
+    """
+    num_vertices = len(vertex_ids)
+    float_attributes = custom_attributes_float(mesh)
+    int_attributes = custom_attributes_int(mesh)
+    semantic_translations = layout.get_semantic_remap()
+    cache = {}
+
+    def vertex_data(data_name, width):
+        if data_name not in cache:
+            cache[data_name] = fetch_blender_data(
+                mesh.vertices, data_name, numpy.float32, width
+            )
+        return cache[data_name][vertex_ids].astype(numpy.float64)
+
+    def loop_data(data_name, width, source=None):
+        key = (data_name, source and source.name)
+        if key not in cache:
+            cache[key] = fetch_blender_data(
+                mesh.loops if source is None else source.data,
+                data_name,
+                numpy.float32,
+                width,
+            )
+        return cache[key][loop_ids].astype(numpy.float64)
 
-    # TODO: Warn if vertex is in too many vertex groups for this layout,
-    # ignoring groups with weight=0.0
-    vertex_groups = sorted(blender_vertex.groups, key=lambda x: x.weight, reverse=True)
+    def attribute(layer, dtype):
+        values = fetch_blender_data(layer.data, "value", dtype)
+        return values[vertex_ids].astype(numpy.float64).reshape(-1, 1)
 
+    def texcoord(uv_name):
+        data = loop_data("uv", 2, mesh.uv_layers[uv_name])
+        try:
+            flip_texcoord_v = obj["3DMigoto:" + uv_name]["flip_v"]
+        except KeyError:
+            flip_texcoord_v = False
+        if flip_texcoord_v:
+            data[:, 1] = 1.0 - data[:, 1]
+        return data
+
+    def vertex_groups():
+        # Vertex groups are not reachable with foreach_get(), but at least
+        # only sort them once per vertex rather than once per loop:
+        if "groups" not in cache:
+            cache["groups"] = [
+                sorted(vertex.groups, key=attrgetter("weight"), reverse=True)
+                for vertex in mesh.vertices
+            ]
+        return cache["groups"]
+
+    def blend_data(index, attr):
+        groups = vertex_groups()
+        data = numpy.zeros((len(groups), 4), dtype=numpy.float64)
+        for i, vertex in enumerate(groups):
+            values = [getattr(x, attr) for x in vertex[index * 4 : index * 4 + 4]]
+            data[i, : len(values)] = values
+        return data[vertex_ids]
+
+    columns = collections.OrderedDict()
     for elem in layout:
         if elem.InputSlotClass != "per-vertex" or elem.reused_offset:
             continue
 
-        semantic_translations = layout.get_semantic_remap()
         translated_elem_name, translated_elem_index = semantic_translations.get(
             elem.name, (elem.name, elem.SemanticIndex)
         )
@@ -816,144 +995,234 @@ def blender_vertex_to_3dmigoto_vertex(
         # Some games don't follow the official DirectX UPPERCASE semantic naming convention:
         translated_elem_name = translated_elem_name.upper()
 
+        data = None
         if translated_elem_name == "POSITION":
-            if "POSITION.w" in custom_attributes_float(mesh):
-                vertex[elem.name] = list(blender_vertex.undeformed_co) + [
-                    custom_attributes_float(mesh)["POSITION.w"]
-                    .data[blender_vertex.index]
-                    .value
-                ]
+            data = vertex_data("undeformed_co", 3)
+            if "POSITION.w" in float_attributes:
+                data = numpy.hstack((data, attribute(float_attributes["POSITION.w"], numpy.float32)))
             else:
-                vertex[elem.name] = elem.pad(list(blender_vertex.undeformed_co), 1.0)
+                data = pad_columns(elem, data, 1.0)
         elif translated_elem_name.startswith("COLOR"):
-            if elem.name in mesh.vertex_colors:
-                vertex[elem.name] = elem.clip(
-                    list(
-                        mesh.vertex_colors[elem.name]
-                        .data[blender_loop_vertex.index]
-                        .color
+            if loop_ids is None:
+                pass
+            elif elem.name in mesh.vertex_colors:
+                data = loop_data("color", 4, mesh.vertex_colors[elem.name])
+                data = data[:, : elem.format_len]
+            else:
+                data = numpy.hstack(
+                    (
+                        loop_data("color", 4, mesh.vertex_colors[elem.name + ".RGB"])[
+                            :, :3
+                        ],
+                        loop_data("color", 4, mesh.vertex_colors[elem.name + ".A"])[
+                            :, :1
+                        ],
                     )
                 )
-            else:
-                vertex[elem.name] = list(
-                    mesh.vertex_colors[elem.name + ".RGB"]
-                    .data[blender_loop_vertex.index]
-                    .color
-                )[:3] + [
-                    mesh.vertex_colors[elem.name + ".A"]
-                    .data[blender_loop_vertex.index]
-                    .color[0]
-                ]
         elif translated_elem_name == "NORMAL":
-            if "NORMAL.w" in custom_attributes_float(mesh):
-                vertex[elem.name] = list(
-                    map(translate_normal, blender_loop_vertex.normal)
-                ) + [
-                    custom_attributes_float(mesh)["NORMAL.w"]
-                    .data[blender_vertex.index]
-                    .value
-                ]
-            elif blender_loop_vertex:
-                vertex[elem.name] = elem.pad(
-                    list(map(translate_normal, blender_loop_vertex.normal)), 0.0
-                )
+            if loop_ids is not None:
+                data = translate_normal(loop_data("normal", 3))
             else:
                 # XXX: point list topology, these normals are probably going to be pretty poor, but at least it's something to export
-                vertex[elem.name] = elem.pad(
-                    list(map(translate_normal, blender_vertex.normal)), 0.0
-                )
+                data = translate_normal(vertex_data("normal", 3))
+            if "NORMAL.w" in float_attributes:
+                data = numpy.hstack((data, attribute(float_attributes["NORMAL.w"], numpy.float32)))
+            else:
+                data = pad_columns(elem, data, 0.0)
         elif translated_elem_name.startswith("TANGENT"):
-            if export_outline:
-                # Genshin optimized outlines
-                vertex[elem.name] = elem.pad(
-                    list(
-                        map(
-                            translate_tangent,
-                            export_outline.get(
-                                blender_loop_vertex.vertex_index, blp_normal
-                            ),
-                        )
-                    ),
-                    blender_loop_vertex.bitangent_sign,
-                )
             # DOAXVV has +1/-1 in the 4th component. Not positive what this is,
             # but guessing maybe the bitangent sign? Not even sure it is used...
             # FIXME: Other games
-            elif blender_loop_vertex:
-                vertex[elem.name] = elem.pad(
-                    list(map(translate_tangent, blender_loop_vertex.tangent)),
-                    blender_loop_vertex.bitangent_sign,
+            if loop_ids is not None:
+                data = pad_columns(
+                    elem,
+                    translate_tangent(loop_data("tangent", 3)),
+                    loop_data("bitangent_sign", 1),
                 )
-            else:
-                # XXX Blender doesn't save tangents outside of loops, so unless
-                # we save these somewhere custom when importing they are
-                # effectively lost. We could potentially calculate a tangent
-                # from blender_vertex.normal, but there is probably little
-                # point given that normal will also likely be garbage since it
-                # wasn't imported from the mesh.
-                pass
+            # XXX Blender doesn't save tangents outside of loops, so unless
+            # we save these somewhere custom when importing they are
+            # effectively lost.
         elif translated_elem_name.startswith("BINORMAL"):
             # Some DOA6 meshes (skirts) use BINORMAL, but I'm not certain it is
             # actually the binormal. These meshes are weird though, since they
             # use 4 dimensional positions and normals, so they aren't something
-            # we can really deal with at all. Therefore, the below is untested,
-            # FIXME: So find a mesh where this is actually the binormal,
-            # uncomment the below code and test.
-            # normal = blender_loop_vertex.normal
-            # tangent = blender_loop_vertex.tangent
-            # binormal = numpy.cross(normal, tangent)
-            # XXX: Does the binormal need to be normalised to a unit vector?
-            # binormal = binormal / numpy.linalg.norm(binormal)
-            # vertex[elem.name] = elem.pad(list(map(translate_binormal, binormal)), 0.0)
+            # we can really deal with at all.
+            # FIXME: Find a mesh where this is actually the binormal and test.
             pass
         elif translated_elem_name.startswith("BLENDINDICES"):
-            i = translated_elem_index * 4
-            vertex[elem.name] = elem.pad([x.group for x in vertex_groups[i : i + 4]], 0)
+            data = blend_data(translated_elem_index, "group")
+            data = pad_columns(elem, data[:, : elem.format_len], 0).astype(int)
         elif translated_elem_name.startswith("BLENDWEIGHT"):
             # TODO: Warn if vertex is in too many vertex groups for this layout
-            i = translated_elem_index * 4
-            vertex[elem.name] = elem.pad(
-                [x.weight for x in vertex_groups[i : i + 4]], 0.0
-            )
+            data = blend_data(translated_elem_index, "weight")
+            data = pad_columns(elem, data[:, : elem.format_len], 0.0)
         elif translated_elem_name.startswith("TEXCOORD") and elem.is_float():
-            uvs = []
-            for uv_name in ("%s.xy" % elem.remapped_name, "%s.zw" % elem.remapped_name):
-                if uv_name in texcoords:
-                    uvs += list(texcoords[uv_name][blender_loop_vertex.index])
-            # Handle 1D + 3D TEXCOORDs. Order is important - 1D TEXCOORDs won't
-            # match anything in above loop so only .x below, 3D TEXCOORDS will
-            # have processed .xy part above, and .z part below
-            for uv_name in ("%s.x" % elem.remapped_name, "%s.z" % elem.remapped_name):
-                if uv_name in texcoords:
-                    uvs += [texcoords[uv_name][blender_loop_vertex.index].x]
-            vertex[elem.name] = uvs
+            if loop_ids is not None:
+                uvs = []
+                for uv_name in (
+                    "%s.xy" % elem.remapped_name,
+                    "%s.zw" % elem.remapped_name,
+                ):
+                    if uv_name in mesh.uv_layers:
+                        uvs.append(texcoord(uv_name))
+                # Handle 1D + 3D TEXCOORDs. Order is important - 1D TEXCOORDs won't
+                # match anything in above loop so only .x below, 3D TEXCOORDS will
+                # have processed .xy part above, and .z part below
+                for uv_name in ("%s.x" % elem.remapped_name, "%s.z" % elem.remapped_name):
+                    if uv_name in mesh.uv_layers:
+                        uvs.append(texcoord(uv_name)[:, :1])
+                data = numpy.hstack(uvs) if uvs else numpy.empty((num_vertices, 0))
         else:
             # Unhandled semantics are saved in vertex layers
             data = []
             for component in "xyzw":
                 layer_name = "%s.%s" % (elem.name, component)
-                if layer_name in custom_attributes_int(mesh):
-                    data.append(
-                        custom_attributes_int(mesh)[layer_name]
-                        .data[blender_vertex.index]
-                        .value
-                    )
-                elif layer_name in custom_attributes_float(mesh):
-                    data.append(
-                        custom_attributes_float(mesh)[layer_name]
-                        .data[blender_vertex.index]
-                        .value
-                    )
-            if data:
-                # print('Retrieved unhandled semantic %s %s from vertex layer' % (elem.name, elem.Format), data)
-                vertex[elem.name] = data
+                if layer_name in int_attributes:
+                    data.append(attribute(int_attributes[layer_name], numpy.int32))
+                elif layer_name in float_attributes:
+                    data.append(attribute(float_attributes[layer_name], numpy.float32))
+            data = numpy.hstack(data) if data else None
 
-        if elem.name not in vertex:
+        if data is None:
             print("NOTICE: Unhandled vertex element: %s" % elem.name)
-        # else:
-        #    print('%s: %s' % (elem.name, repr(vertex[elem.name])))
+            continue
+        columns[elem.name] = data.reshape(num_vertices, -1)
+
+    return columns
+
+
+def dedupe_3dmigoto_vertices(columns, num_vertices):
+    """
+    Finds identical vertices so they can be shared through the index buffer.
+    Returns the rows of the first occurrence of each distinct vertex in the
+    order they first appear, and for every row which of those it maps to.
+
+    Compares values the same way as the per-vertex dicts used to: -0.0 equals
+    0.0 and a vertex with a NaN anywhere is never equal to another.
+    """
+    keys = [data.astype(numpy.float64) + 0.0 for data in columns.values()]
+    keys = numpy.hstack(keys + [numpy.zeros((num_vertices, 1))])
+    nan_rows = numpy.isnan(keys).any(axis=1)
+    keys[:, -1] = numpy.where(nan_rows, numpy.arange(num_vertices), -1)
+    keys = numpy.ascontiguousarray(keys)
+    keys = keys.view(numpy.dtype((numpy.void, keys.dtype.itemsize * keys.shape[1])))
+    _, first, inverse = numpy.unique(
+        keys.ravel(), return_index=True, return_inverse=True
+    )
+    order = numpy.argsort(first)
+    remap = numpy.empty_like(order)
+    remap[order] = numpy.arange(len(order))
+    return first[order], remap[inverse.ravel()]
 
-    return vertex
+
+def encode_3dmigoto_columns(
+    layout: InputLayout, columns, num_vertices, vbuf_idx, stride
+):
+    """
+    Encodes the element columns belonging to one vertex buffer through a
+    NumpyBuffer, writing each element at its offset in layout order just like
+    InputLayout.encode() does per vertex.
+    """
+    semantics = []
+    fields = []
+    for i, (name, data) in enumerate(columns.items()):
+        elem = layout[name]
+        if vbuf_idx.isnumeric() and elem.InputSlot != int(vbuf_idx):
+            # Belongs to a different vertex buffer
+            continue
+        if data.shape[1] == 0:
+            continue
+        try:
+            fmt = DXGIFormat(elem.Format)
+        except ValueError:
+            raise Fatal("File uses an unsupported DXGI Format: %s" % elem.Format)
+        semantic = BufferSemantic(
+            AbstractSemantic(Semantic.RawData, i),
+            fmt,
+            stride=data.shape[1] * fmt.value_byte_width,
+            offset=elem.AlignedByteOffset,
+            input_slot=elem.InputSlot,
+            name=name,
+        )
+        if semantic.offset + semantic.stride > stride:
+            raise Fatal("%s does not fit in the vertex buffer stride" % name)
+        semantics.append(semantic)
+        fields.append(data)
+
+    buffer = NumpyBuffer(
+        BufferLayout(semantics, stride=stride, force_stride=True),
+        size=num_vertices,
+    )
+    for semantic, data in zip(semantics, fields):
+        set_3dmigoto_field(buffer, semantic, data)
+    return buffer
+
+
+def set_3dmigoto_field(buffer: NumpyBuffer, semantic: BufferSemantic, data):
+    if semantic.format.dxgi_type in (
+        DXGIType.UNORM16,
+        DXGIType.UNORM8,
+        DXGIType.SNORM16,
+        DXGIType.SNORM8,
+    ):
+        # Normalised formats are scaled from float32 like their encoders
+        data = data.astype(numpy.float32)
+    data = semantic.format.type_encoder(data)
+    if data.shape[1] == 1:
+        data = data.reshape(-1)
+    buffer.set_field(semantic.get_name(), data)
+
+
+def write_3dmigoto_vertex_buffers(operator, buffers, num_vertices, output_prefix):
+    for vbuf_idx, buffer in buffers.items():
+        path = str(output_prefix) + str(vbuf_idx)
+        with open(path, "wb") as output:
+            output.write(buffer.get_bytes())
+        operator.report({"INFO"}, "Wrote %i vertices to %s" % (num_vertices, path))
+
+
+def compile_vgmap(group_names, mapping, size):
+    """
+    Compiles a VGMap into a lookup table from the vertex group number found
+    in BLENDINDICES to the index it is exported as. The vertex group name
+    takes priority over its number, and unmapped groups keep their number.
+    """
+    table = numpy.arange(size)
+    for x in range(size):
+        if x < len(group_names) and group_names[x] in mapping:
+            table[x] = mapping[group_names[x]]
+        elif x in mapping:
+            table[x] = mapping[x]
+    return table
+
+
+def remap_3dmigoto_vertex_buffers(buffers, columns, table):
+    """
+    Applies a compiled VGMap to the encoded vertex buffers. Buffers without
+    BLENDINDICES are shared as is, the rest are copied and only the fields
+    from the first BLENDINDICES onwards are re-encoded (to keep the layout
+    order in which overlapping elements overwrite each other).
+    """
+    ret = {}
+    for vbuf_idx, buffer in buffers.items():
+        semantics = buffer.layout.semantics
+        first = next(
+            (
+                i
+                for i, semantic in enumerate(semantics)
+                if semantic.get_name().startswith("BLENDINDICES")
+            ),
+            None,
+        )
+        if first is not None:
+            buffer = buffer.copy()
+            for semantic in semantics[first:]:
+                data = columns[semantic.get_name()]
+                if semantic.get_name().startswith("BLENDINDICES"):
+                    data = table[data]
+                set_3dmigoto_field(buffer, semantic, data)
+        ret[vbuf_idx] = buffer
+    return ret
 
 
 def export_3dmigoto(
@@ -1003,24 +1272,6 @@ def export_3dmigoto(
             ),
         )
 
-    texcoord_layers = {}
-    for uv_layer in mesh.uv_layers:
-        texcoords = {}
-
-        try:
-            flip_texcoord_v = obj["3DMigoto:" + uv_layer.name]["flip_v"]
-            if flip_texcoord_v:
-                flip_uv = lambda uv: (uv[0], 1.0 - uv[1])
-            else:
-                flip_uv = lambda uv: uv
-        except KeyError:
-            flip_uv = lambda uv: uv
-
-        for loop in mesh.loops:
-            uv = flip_uv(uv_layer.data[loop.index].uv)
-            texcoords[loop.index] = uv
-        texcoord_layers[uv_layer.name] = texcoords
-
     translate_normal = normal_export_translation(
         layout, Semantic.Normal, operator.flip_normal
     )
@@ -1033,91 +1284,104 @@ def export_3dmigoto(
     # loops. To export back to DX we need these combined together such that
     # a vertex is a unique set of all attributes, but we don't want to
     # completely blow this out - we still want to reuse identical vertices
-    # via the index buffer. There might be a convenience function in
-    # Blender to do this, but it's easy enough to do this ourselves
-    indexed_vertices = collections.OrderedDict()
+    # via the index buffer. All of this is done on whole columns of data at
+    # a time rather than one dict per loop.
     vb = VertexBufferGroup(layout=layout, topology=topology)
     vb.flag_invalid_semantics()
+    faces = None
     if vb.topology == "trianglelist":
-        for poly in mesh.polygons:
-            face = []
-            for blender_lvertex in mesh.loops[
-                poly.loop_start : poly.loop_start + poly.loop_total
-            ]:
-                vertex = blender_vertex_to_3dmigoto_vertex(
-                    mesh,
-                    obj,
-                    blender_lvertex,
-                    layout,
-                    texcoord_layers,
-                    None,
-                    translate_normal,
-                    translate_tangent,
-                )
-                if ib is not None:
-                    face.append(
-                        indexed_vertices.setdefault(
-                            HashableVertex(vertex), len(indexed_vertices)
-                        )
-                    )
-                else:
-                    if operator.flip_winding:
-                        raise Fatal(
-                            "Flipping winding order without index buffer not implemented"
-                        )
-                    vb.append(vertex)
-            if ib is not None:
-                if operator.flip_winding:
-                    face.reverse()
-                ib.append(face)
-
-        if ib is not None:
-            for vertex in indexed_vertices:
-                vb.append(vertex)
+        # Loops in the order of the polygons they belong to:
+        loop_starts = fetch_blender_data(mesh.polygons, "loop_start", numpy.int32)
+        loop_totals = fetch_blender_data(mesh.polygons, "loop_total", numpy.int32)
+        loop_starts, loop_totals = loop_starts.astype(int), loop_totals.astype(int)
+        face_starts = numpy.cumsum(loop_totals) - loop_totals
+        loop_ids = numpy.arange(loop_totals.sum()) + numpy.repeat(
+            loop_starts - face_starts, loop_totals
+        )
+        if ib is None and operator.flip_winding and len(loop_ids):
+            raise Fatal("Flipping winding order without index buffer not implemented")
+        vertex_ids = fetch_blender_data(mesh.loops, "vertex_index", numpy.int32)
+        vertex_ids = vertex_ids[loop_ids].astype(int)
     elif vb.topology == "pointlist":
-        for index, blender_vertex in enumerate(mesh.vertices):
-            vb.append(
-                blender_vertex_to_3dmigoto_vertex(
-                    mesh,
-                    obj,
-                    None,
-                    layout,
-                    texcoord_layers,
-                    blender_vertex,
-                    translate_normal,
-                    translate_tangent,
-                )
-            )
-            if ib is not None:
-                ib.append((index,))
+        loop_ids = None
+        vertex_ids = numpy.arange(len(mesh.vertices))
     else:
         raise Fatal('topology "%s" is not supported for export' % vb.topology)
 
+    columns = blender_mesh_to_3dmigoto_columns(
+        mesh, obj, layout, vertex_ids, loop_ids, translate_normal, translate_tangent
+    )
+    num_vertices = len(vertex_ids)
+
+    if ib is not None and vb.topology == "trianglelist":
+        first, faces = dedupe_3dmigoto_vertices(columns, num_vertices)
+        columns = collections.OrderedDict(
+            (semantic, data[first]) for semantic, data in columns.items()
+        )
+        num_vertices = len(first)
+        if operator.flip_winding:
+            # Reverse each face in place:
+            offsets = numpy.arange(len(faces)) - numpy.repeat(face_starts, loop_totals)
+            faces = faces[
+                numpy.repeat(face_starts + loop_totals - 1, loop_totals) - offsets
+            ]
+    elif ib is not None:
+        faces = numpy.arange(num_vertices)
+
     vgmaps = {
         k[15:]: keys_to_ints(v)
         for k, v in obj.items()
         if k.startswith("3DMigoto:VGMap:")
     }
 
-    if "" not in vgmaps:
-        vb.write(vb_path, strides, operator=operator)
+    # Encoded once, each VGMap then only re-encodes the BLENDINDICES:
+    buffers = {
+        vbuf_idx: encode_3dmigoto_columns(
+            layout, columns, num_vertices, vbuf_idx, stride
+        )
+        for vbuf_idx, stride in strides.items()
+    }
 
+    if "" not in vgmaps:
+        write_3dmigoto_vertex_buffers(operator, buffers, num_vertices, vb_path)
+
+    group_names = [vg.name for vg in obj.vertex_groups]
+    num_groups = max(
+        [len(group_names)]
+        + [
+            int(data.max()) + 1
+            for semantic, data in columns.items()
+            if semantic.startswith("BLENDINDICES") and data.size
+        ]
+    )
     for suffix, vgmap in vgmaps.items():
-        ib_path = vb_path
+        vgmap_vb_path = Path(vb_path)
         if suffix:
-            ib_path = f"{vb_path.parent / vb_path.stem}-{suffix}{vb_path.suffix}"
-        vgmap_path = (ib_path.parent / ib_path.stem) + ".vgmap"
-        print("Exporting %s..." % ib_path)
-        vb.remap_blendindices(obj, vgmap)
-        vb.write(ib_path, strides, operator=operator)
-        vb.revert_blendindices_remap()
+            vgmap_vb_path = vgmap_vb_path.with_name(
+                f"{vgmap_vb_path.stem}-{suffix}{vgmap_vb_path.suffix}"
+            )
+        vgmap_path = vgmap_vb_path.with_suffix(".vgmap")
+        print("Exporting %s..." % vgmap_vb_path)
+        table = compile_vgmap(group_names, vgmap, num_groups)
+        write_3dmigoto_vertex_buffers(
+            operator,
+            remap_3dmigoto_vertex_buffers(buffers, columns, table),
+            num_vertices,
+            vgmap_vb_path,
+        )
         sorted_vgmap = collections.OrderedDict(
             sorted(vgmap.items(), key=lambda x: x[1])
         )
         json.dump(sorted_vgmap, open(vgmap_path, "w"), indent=2)
 
     if ib is not None:
-        ib.write(open(ib_path, "wb"), operator=operator)
+        try:
+            fmt = DXGIFormat(ib.format)
+        except ValueError:
+            raise Fatal("File uses an unsupported DXGI Format: %s" % ib.format)
+        with open(ib_path, "wb") as output:
+            output.write(fmt.type_encoder(faces).tobytes())
+        operator.report({"INFO"}, "Wrote %i indices to %s" % (len(faces), ib_path))
 
     # Write format reference file
     write_fmt_file(open(fmt_path, "w"), vb, ib, strides)
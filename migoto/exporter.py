@@ -1,17 +1,41 @@
+import functools
+import hashlib
+import os
+import re
 import shutil
+import threading
 import time
 import json
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Union
+from queue import SimpleQueue
+from typing import Callable, Iterator, Optional, Union
 
 import bpy
 import numpy
-from bpy.types import Collection, Context, Depsgraph, Mesh, Object, Operator, Scene
+from bpy.types import (
+    Collection,
+    Context,
+    Depsgraph,
+    Mesh,
+    Object,
+    Operator,
+    Scene,
+    ShapeKey,
+)
 from numpy.typing import NDArray
 
 from .. import bl_info
-from ..libs.jinja2 import Environment, FileSystemLoader
+from .. import __name__ as package_name
+from ..libs.jinja2 import (
+    BaseLoader,
+    ChoiceLoader,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    ModuleLoader,
+    TemplateSyntaxError,
+)
 from .data.byte_buffer import (
     BufferLayout,
     BufferSemantic,
@@ -20,12 +44,23 @@ from .data.byte_buffer import (
     AbstractSemantic,
 )
 from .data.data_model import DataModelXXMI
-from .data.ini_format import INI_file
+from .data.dxgi_format import DXGIFormat
+from .data.ini_format import INI_file, INI_Line, Section
+from .data.vertex_cache import (
+    count_cache_misses,
+    optimize_triangle_order,
+    vertex_fetch_order,
+)
+from .datahandling import get_cache_dir
 from .datastructures import GameEnum
-from .export_ops import mesh_triangulate
+from .export_ops import apply_modifiers_and_shapekeys, mesh_triangulate
 from .operators import Fatal
 
 
+class ExportCancelled(Exception):
+    pass
+
+
 @dataclass
 class SubObj:
     collection_name: str
@@ -45,6 +80,15 @@ class TextureData:
     hash: str
 
 
+@dataclass
+class DrawRange:
+    """A run of objects laid out back to back in a part's index buffer"""
+
+    objects: list[SubObj]
+    index_count: int
+    index_offset: int
+
+
 @dataclass
 class Part:
     fullname: str
@@ -52,6 +96,19 @@ class Part:
     textures: list[TextureData]
     first_index: int
     vertex_count: int = 0
+    # Where the part's indices start in its component's packed index buffer
+    index_offset: int = 0
+    ib_format: str = DXGIFormat.R32_UINT.get_format()
+    draw_ranges: list[DrawRange] = field(default_factory=list)
+
+
+@dataclass
+class ShapeKeyData:
+    name: str
+    variable: str
+    value: float
+    first_entry: int
+    entry_count: int
 
 
 @dataclass
@@ -66,6 +123,31 @@ class Component:
     ib: str
     vertex_count: int = 0
     strides: dict[str, int] = field(default_factory=dict)
+    shapekeys: list[ShapeKeyData] = field(default_factory=list)
+    shapekey_position_offset: int = 0
+    packed_ib: bool = False
+    ib_format: str = DXGIFormat.R32_UINT.get_format()
+
+
+@dataclass
+class ComponentBuffers:
+    """Buffers of a component read from Blender, waiting to be finished"""
+
+    component: Component
+    data_model: DataModelXXMI
+    out_buffers: dict[str, NumpyBuffer]
+    component_ib: NumpyBuffer
+    excluded_buffers: list[str]
+    shapekey_entries: dict[str, list[NDArray]] = field(default_factory=dict)
+    shapekey_values: dict[str, float] = field(default_factory=dict)
+    part_ibs: list[tuple[Part, NumpyBuffer]] = field(default_factory=list)
+    vb_offset: int = 0
+
+
+# One entry per vertex moved by a shapekey, matching ShapeKeyEntry in ShapeKeys.hlsl
+shapekey_entry_dtype = numpy.dtype(
+    [("VERTEX", numpy.uint32), ("DELTA", numpy.float32, (3,))]
+)
 
 
 @dataclass
@@ -77,6 +159,84 @@ class ModFile:
     credit: str = ""
 
 
+bundled_templates_path: Path = Path(__file__).parent.parent / "templates"
+
+# Environments are reused by every export of the session, see get_template_environment()
+template_environments: dict[tuple, Environment] = {}
+
+
+def make_template_environment(loader: BaseLoader, **options) -> Environment:
+    return Environment(loader=loader, trim_blocks=True, lstrip_blocks=True, **options)
+
+
+def get_precompiled_templates(templates_path: Path) -> Optional[str]:
+    """
+    Compiles the templates in templates_path into importable modules, once for
+    every revision of them, and returns the folder holding the modules.
+    """
+    stamp = [
+        (file.name, file.stat().st_size, file.stat().st_mtime_ns)
+        for file in sorted(templates_path.glob("*.j2"))
+    ]
+    key = hashlib.sha1(json.dumps(stamp).encode("utf-8")).hexdigest()
+    cache_dir = get_cache_dir("compiled_templates")
+    compiled_path = os.path.join(cache_dir, key)
+    if os.path.isdir(compiled_path):
+        return compiled_path
+    start = time.time()
+    env = make_template_environment(FileSystemLoader(searchpath=templates_path))
+    tmp_path = compiled_path + ".tmp"
+    try:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        env.compile_templates(
+            tmp_path, extensions=["j2"], zip=None, ignore_errors=False
+        )
+        os.replace(tmp_path, compiled_path)
+    except (OSError, TemplateSyntaxError) as e:
+        print(f"Unable to precompile templates: {e}")
+        return None
+    # Drop the modules compiled from previous revisions of the templates
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.name != key:
+                shutil.rmtree(entry.path, ignore_errors=True)
+    print(f"Precompiled templates in {time.time() - start:.3f}s")
+    return compiled_path
+
+
+def get_template_environment(templates_paths: list[Path]) -> Environment:
+    """
+    Returns the Environment loading templates from templates_paths, in order.
+    Templates compiled from source are kept in a bytecode cache in the add-on
+    config folder, so they are only parsed again when they change. With the
+    precompile_templates preference enabled, the bundled templates are loaded
+    from modules precompiled into that folder instead.
+    """
+    precompile = True
+    addon = bpy.context.preferences.addons.get(package_name)
+    if addon is not None and addon.preferences is not None:
+        precompile = addon.preferences.precompile_templates
+    key = (tuple(templates_paths), precompile)
+    env = template_environments.get(key)
+    if env is not None:
+        return env
+    loaders: list[BaseLoader] = [
+        FileSystemLoader(searchpath=path) for path in templates_paths
+    ]
+    if precompile and bundled_templates_path in templates_paths:
+        compiled_path = get_precompiled_templates(bundled_templates_path)
+        if compiled_path is not None:
+            loaders[templates_paths.index(bundled_templates_path)] = ModuleLoader(
+                compiled_path
+            )
+    env = make_template_environment(
+        ChoiceLoader(loaders),
+        bytecode_cache=FileSystemBytecodeCache(get_cache_dir("template_cache")),
+    )
+    template_environments[key] = env
+    return env
+
+
 @dataclass
 class ModExporter:
     # Input
@@ -98,6 +258,14 @@ class ModExporter:
     write_ini: bool
     template: Optional[Path] = None
     outline_rounding_precision: int = 3
+    export_shapekeys: bool = False
+    shapekey_threshold: float = 1e-5
+    merge_ini: bool = False
+    split_draw_calls: bool = False
+    pack_index_buffers: bool = False
+    use_16bit_indices: bool = False
+    optimize_vertex_cache: bool = False
+    remap_vertex_groups: bool = False
     # Internal / not implemented
     ignore_muted_shape_keys: bool = False
     # Output
@@ -107,10 +275,18 @@ class ModExporter:
     ini_content: str = field(init=False)
     files_to_write: dict[Path, Union[str, NDArray]] = field(init=False)
     files_to_copy: dict[Path, Path] = field(init=False)
+    ib_bytes_saved: int = field(init=False, default=0)
+    # Set from another thread to stop an export running through export_steps()
+    cancel_event: threading.Event = field(init=False, default_factory=threading.Event)
+    # Set once write_files() starts moving files in place, a cancel can't undo it anymore
+    files_replaced: bool = field(init=False, default=False)
+    # Reports of stages running on a worker thread, see report()
+    deferred_reports: Optional[SimpleQueue] = field(init=False, default=None)
 
     def __post_init__(self) -> None:
         print("Initializing data for export...")
         self.__objs_to_cleanup: list[Object] = []
+        self.__meshes_to_cleanup: list[Mesh] = []
         self.__depsgraph: Depsgraph = bpy.context.evaluated_depsgraph_get()
         if self.dump_path == Path(""):
             raise Fatal("Dump path not set")
@@ -121,7 +297,7 @@ class ModExporter:
 
         if self.destination == Path(""):
             self.destination = self.dump_path.parent / f"{self.mod_name}Mod"
-            self.operator.report(
+            self.report(
                 {"WARNING"},
                 f"Destination path not set, defaulting to {self.destination}",
             )
@@ -134,6 +310,14 @@ class ModExporter:
         self.hash_data = self.load_hashes(self.dump_path / "hash.json")
         if not self.hash_data:
             raise Fatal("ERROR", "Hash data is empty or invalid!")
+        if self.export_shapekeys and self.game == GameEnum.HonkaiStarRail:
+            # The compute skinning path (PositionCS) reads the position buffer
+            # straight from its file, so the shaped copy would never be used
+            self.report(
+                {"WARNING"},
+                "Shape keys are not supported for Honkai Star Rail, exporting without them.",
+            )
+            self.export_shapekeys = False
 
         scene: Scene = bpy.context.scene
         if not [
@@ -239,6 +423,20 @@ class ModExporter:
                 )
             self.mod_file.components.append(component_entry)
 
+    def report(self, level: set[str], message: str) -> None:
+        """
+        Reports through the operator, or queues the report for the main thread
+        to pass on when stages run on a worker thread.
+        """
+        if self.deferred_reports is not None:
+            self.deferred_reports.put((level, message))
+            return
+        self.operator.report(level, message)
+
+    def check_cancelled(self) -> None:
+        if self.cancel_event.is_set():
+            raise ExportCancelled("Export cancelled")
+
     def obj_from_col(
         self,
         main_obj: Object,
@@ -272,18 +470,26 @@ class ModExporter:
 
     def process_mesh(self, main_obj: Object, obj: Object) -> Mesh:
         """Process the mesh of the object."""
-        # TODO: Add moddifier application for SK'd meshes here
-        final_mesh: Mesh = (
-            obj.evaluated_get(self.__depsgraph).to_mesh()
-            if self.apply_modifiers
-            else obj.to_mesh()
-        )
+        if self.export_shapekeys and self.get_exported_shapekeys(obj.data):
+            # Keep the shapekeys on the exported mesh so their deltas match its vertices
+            final_mesh: Mesh = (
+                apply_modifiers_and_shapekeys(self.context, obj)
+                if self.apply_modifiers
+                else obj.data.copy()
+            )
+            self.__meshes_to_cleanup.append(final_mesh)
+        else:
+            final_mesh: Mesh = (
+                obj.evaluated_get(self.__depsgraph).to_mesh()
+                if self.apply_modifiers
+                else obj.to_mesh()
+            )
         if main_obj != obj:
             # Matrix world seems to be the summatory of all transforms parents included
             # Might need to test for more edge cases and to confirm these suspicious,
             # other available options: matrix_local, matrix_basis, matrix_parent_inverse
-            final_mesh.transform(obj.matrix_world)
-            final_mesh.transform(main_obj.matrix_world.inverted())
+            final_mesh.transform(obj.matrix_world, shape_keys=True)
+            final_mesh.transform(main_obj.matrix_world.inverted(), shape_keys=True)
         mesh_triangulate(final_mesh)
         masked_vgs = [
             vg.index for vg in obj.vertex_groups if vg.name.startswith("MASK")
@@ -297,114 +503,400 @@ class ModExporter:
         self.__objs_to_cleanup.append(obj)
         return final_mesh
 
+    def get_vertex_group_remap(self, obj: Object) -> NDArray:
+        """
+        Maps the vertex groups of obj to the bone index in their name, as if
+        the missing numbers were filled with empty groups and the groups were
+        sorted by name. Groups not named after a number come after the highest
+        numbered one, in natural order.
+        """
+        numbered: dict[int, int] = {
+            vg.index: int(vg.name) for vg in obj.vertex_groups if vg.name.isdigit()
+        }
+        others = sorted(
+            (vg for vg in obj.vertex_groups if not vg.name.isdigit()),
+            key=lambda vg: [
+                int(part) if part.isdigit() else part
+                for part in re.split(r"(\d+)", vg.name.lower())
+            ],
+        )
+        # Vertices with fewer groups than the format holds are padded with 0
+        remap: NDArray = numpy.zeros(
+            max(len(obj.vertex_groups), 1), dtype=numpy.uint32
+        )
+        for index, number in numbered.items():
+            remap[index] = number
+        first_other: int = max(numbered.values(), default=-1) + 1
+        for i, vg in enumerate(others):
+            remap[vg.index] = first_other + i
+        return remap
+
+    def get_exported_shapekeys(self, mesh: Mesh) -> list[ShapeKey]:
+        """Shapekeys marked for export, named Deform like the ones kept by apply_modifiers_and_shapekeys"""
+        if mesh.shape_keys is None:
+            return []
+        return [
+            sk
+            for sk in mesh.shape_keys.key_blocks[1:]
+            if "deform" in sk.name.lower()
+            and not (self.ignore_muted_shape_keys and sk.mute)
+        ]
+
     def generate_buffers(self) -> None:
         """Generate buffers for the objects."""
         self.files_to_write = {}
         self.files_to_copy = {}
         for component in self.mod_file.components:
-            if component.draw_vb == "":
-                for part in component.parts:
-                    print(f"Processing {part.fullname} " + "-" * 10)
-                    for t in part.textures:
-                        tex_name = part.fullname + t.name + t.extension
-                        self.files_to_copy[self.dump_path / tex_name] = (
-                            self.destination / tex_name
-                        )
+            buffers: Optional[ComponentBuffers] = self.begin_component(component)
+            if buffers is None:
                 continue
-            data_model: DataModelXXMI = DataModelXXMI.from_obj(
-                component.parts[0].objects[0].obj,
-                game=self.game,
-                normalize_weights=self.normalize_weights,
-                is_posed_mesh=component.blend_vb != "",
-            )
-            excluded_buffers: list[str] = []
-            out_buffers: dict[str, NumpyBuffer] = {
-                key: NumpyBuffer(layout=entry)
-                for key, entry in data_model.buffers_format.items()
-                if key != "IB"
-            }
-            component_ib: NumpyBuffer = NumpyBuffer(
-                layout=data_model.buffers_format["IB"]
-            )
-            if self.write_buffers is False:
-                for key in out_buffers.keys():
-                    excluded_buffers.append(key)
-            vb_offset: int = 0
+            for part in component.parts:
+                self.snapshot_part(buffers, part)
+            self.finish_component(buffers)
+
+    def copy_part_textures(self, part: Part) -> None:
+        for t in part.textures:
+            tex_name = part.fullname + t.name + t.extension
+            self.files_to_copy[self.dump_path / tex_name] = self.destination / tex_name
+
+    def begin_component(self, component: Component) -> Optional[ComponentBuffers]:
+        """
+        Sets up the buffers a component is gathered into, or only queues the
+        textures of components without buffers and returns None.
+        """
+        if component.draw_vb == "":
             for part in component.parts:
                 print(f"Processing {part.fullname} " + "-" * 10)
-                part_ib: NumpyBuffer = NumpyBuffer(
-                    layout=data_model.buffers_format["IB"]
+                self.copy_part_textures(part)
+            return None
+        data_model: DataModelXXMI = DataModelXXMI.from_obj(
+            component.parts[0].objects[0].obj,
+            game=self.game,
+            normalize_weights=self.normalize_weights,
+            is_posed_mesh=component.blend_vb != "",
+        )
+        out_buffers: dict[str, NumpyBuffer] = {
+            key: NumpyBuffer(layout=entry)
+            for key, entry in data_model.buffers_format.items()
+            if key != "IB"
+        }
+        return ComponentBuffers(
+            component=component,
+            data_model=data_model,
+            out_buffers=out_buffers,
+            component_ib=NumpyBuffer(layout=data_model.buffers_format["IB"]),
+            excluded_buffers=list(out_buffers.keys())
+            if self.write_buffers is False
+            else [],
+        )
+
+    def snapshot_part(self, buffers: ComponentBuffers, part: Part) -> None:
+        """
+        Reads the objects of a part from Blender into the component buffers.
+        This is the only stage of the buffer generation that uses bpy.
+        """
+        component: Component = buffers.component
+        data_model: DataModelXXMI = buffers.data_model
+        print(f"Processing {part.fullname} " + "-" * 10)
+        part_ib: NumpyBuffer = NumpyBuffer(layout=data_model.buffers_format["IB"])
+        ib_offset: int = 0
+        misses_before: int = 0
+        misses_after: int = 0
+        self.copy_part_textures(part)
+        for entry in part.objects:
+            print(f"Processing {entry.name}...")
+            v_count: int = 0
+            if len(entry.obj.data.polygons) == 0:
+                continue
+            self.verify_mesh_requirements(
+                part.objects[0].obj,
+                entry.obj,
+                entry.mesh,
+                data_model.buffers_format,
+                buffers.excluded_buffers,
+            )
+            gen_buffers, vertex_ids = data_model.get_data(
+                bpy.context,
+                None,
+                entry.obj,
+                entry.mesh,
+                buffers.excluded_buffers,
+                data_model.mirror_mesh,
+                self.get_vertex_group_remap(entry.obj)
+                if self.remap_vertex_groups
+                else None,
+            )
+            v_count = len(vertex_ids)
+            if self.export_shapekeys:
+                self.collect_shapekey_entries(
+                    data_model,
+                    entry.mesh,
+                    vertex_ids,
+                    buffers.vb_offset,
+                    buffers.shapekey_entries,
+                    buffers.shapekey_values,
                 )
-                ib_offset: int = 0
-                for t in part.textures:
-                    tex_name = part.fullname + t.name + t.extension
-                    self.files_to_copy[self.dump_path / tex_name] = (
-                        self.destination / tex_name
-                    )
-                if component.draw_vb == "":
-                    continue
-                for entry in part.objects:
-                    print(f"Processing {entry.name}...")
-                    v_count: int = 0
-                    if len(entry.obj.data.polygons) == 0:
-                        continue
-                    self.verify_mesh_requirements(
-                        part.objects[0].obj,
-                        entry.obj,
-                        entry.mesh,
-                        data_model.buffers_format,
-                        excluded_buffers,
-                    )
-                    gen_buffers, v_count = data_model.get_data(
-                        bpy.context,
-                        None,
-                        entry.obj,
-                        entry.mesh,
-                        excluded_buffers,
-                        data_model.mirror_mesh,
-                    )
-                    gen_buffers["IB"].data["INDEX"] += vb_offset
-                    for k, v in out_buffers.items():
-                        if k not in gen_buffers:
-                            continue
-                        v.append(gen_buffers[k])
-                    part_ib.append(gen_buffers["IB"])
-                    vb_offset += v_count
-                    entry.vertex_count = v_count
-                    part.vertex_count += v_count
-                    component.vertex_count += v_count
-                    entry.index_count = len(gen_buffers["IB"].data)
-                    entry.index_offset = ib_offset
-                    ib_offset += entry.index_count
-                if len(part_ib) == 0:
-                    print(f"Skipping {part.fullname}.ib due to no index data.")
+            if self.optimize_vertex_cache:
+                before, after = self.reorder_triangles(gen_buffers["IB"], v_count)
+                misses_before += before
+                misses_after += after
+            gen_buffers["IB"].data["INDEX"] += buffers.vb_offset
+            for k, v in buffers.out_buffers.items():
+                if k not in gen_buffers:
                     continue
-                component_ib.append(part_ib.copy())
+                v.append(gen_buffers[k])
+            part_ib.append(gen_buffers["IB"])
+            buffers.vb_offset += v_count
+            entry.vertex_count = v_count
+            part.vertex_count += v_count
+            component.vertex_count += v_count
+            entry.index_count = len(gen_buffers["IB"].data)
+            entry.index_offset = ib_offset
+            ib_offset += entry.index_count
+        if len(part_ib) == 0:
+            print(f"Skipping {part.fullname}.ib due to no index data.")
+            return
+        if self.optimize_vertex_cache:
+            triangle_count: int = max(len(part_ib) // 3, 1)
+            print(
+                f"Vertex cache of {part.fullname}: "
+                f"ACMR {misses_before / triangle_count:.3f} -> {misses_after / triangle_count:.3f}, "
+                f"ATVR {misses_before / part.vertex_count:.3f} -> {misses_after / part.vertex_count:.3f}"
+            )
+        if self.pack_index_buffers:
+            part.index_offset = len(buffers.component_ib)
+        part.draw_ranges = self.build_draw_ranges(part)
+        buffers.component_ib.append(part_ib.copy())
+        buffers.part_ibs.append((part, part_ib))
+
+    def finish_component(self, buffers: ComponentBuffers) -> None:
+        """
+        Optimizes and encodes the gathered buffers of a component and queues
+        them for writing. Doesn't touch bpy, so it may run on a worker thread.
+        """
+        component: Component = buffers.component
+        out_buffers: dict[str, NumpyBuffer] = buffers.out_buffers
+        component_ib: NumpyBuffer = buffers.component_ib
+        part_ibs: list[tuple[Part, NumpyBuffer]] = buffers.part_ibs
+        shapekey_entries: dict[str, list[NDArray]] = buffers.shapekey_entries
+        if self.optimize_vertex_cache and len(component_ib) > 0:
+            self.optimize_vertex_order(
+                component.vertex_count,
+                out_buffers,
+                [component_ib] + [part_ib for _, part_ib in part_ibs],
+                shapekey_entries,
+            )
+        if not self.pack_index_buffers:
+            for part, part_ib in part_ibs:
+                ib_data, ib_format = self.encode_index_buffer(part_ib)
+                part.ib_format = ib_format.get_format()
                 self.files_to_write[self.destination / (part.fullname + ".ib")] = (
-                    part_ib.data
+                    ib_data
                 )
-            if self.outline_optimization:
-                self.optimize_outlines(out_buffers, component_ib)
-            if component.blend_vb != "":
-                self.files_to_write[
-                    self.destination / (component.fullname + "Position.buf")
-                ] = out_buffers["Position"].data
-                self.files_to_write[
-                    self.destination / (component.fullname + "Blend.buf")
-                ] = out_buffers["Blend"].data
-                self.files_to_write[
-                    self.destination / (component.fullname + "Texcoord.buf")
-                ] = out_buffers["TexCoord"].data
-                component.strides = {
-                    k.lower(): v.stride
-                    for k, v in data_model.buffers_format.items()
-                    if k != "IB"
-                }
+        elif len(component_ib) > 0:
+            component.packed_ib = True
+            ib_data, ib_format = self.encode_index_buffer(component_ib)
+            component.ib_format = ib_format.get_format()
+            self.files_to_write[self.destination / (component.fullname + ".ib")] = (
+                ib_data
+            )
+        if self.outline_optimization:
+            self.optimize_outlines(out_buffers, component_ib)
+        if shapekey_entries:
+            self.build_shapekeys(
+                component,
+                out_buffers["Position"],
+                shapekey_entries,
+                buffers.shapekey_values,
+            )
+        if component.blend_vb != "":
+            self.files_to_write[
+                self.destination / (component.fullname + "Position.buf")
+            ] = out_buffers["Position"].data
+            self.files_to_write[
+                self.destination / (component.fullname + "Blend.buf")
+            ] = out_buffers["Blend"].data
+            self.files_to_write[
+                self.destination / (component.fullname + "Texcoord.buf")
+            ] = out_buffers["TexCoord"].data
+            component.strides = {
+                k.lower(): v.stride
+                for k, v in buffers.data_model.buffers_format.items()
+                if k != "IB"
+            }
+            return
+        self.files_to_write[self.destination / (component.fullname + ".buf")] = (
+            out_buffers["Position"].data
+        )
+        component.strides = {"position": out_buffers["Position"].data.itemsize}
+
+    def encode_index_buffer(self, ib: NumpyBuffer) -> tuple[NDArray, DXGIFormat]:
+        """
+        Encodes the index buffer as R16_UINT when every index it holds fits,
+        halving its size, and returns the data to write along with its format.
+        """
+        ib_format: DXGIFormat = ib.layout.semantics[0].format
+        if not self.use_16bit_indices or ib_format != DXGIFormat.R32_UINT:
+            return ib.data, ib_format
+        indices: NDArray = ib.get_field(ib.layout.semantics[0].get_name())
+        # 0xFFFF is the strip cut value, so it is left for 32-bit buffers
+        if len(indices) == 0 or indices.max() >= 0xFFFF:
+            return ib.data, ib_format
+        ib_format = DXGIFormat.R16_UINT
+        ib_data: NDArray = ib_format.type_encoder(indices)
+        self.ib_bytes_saved += ib.data.nbytes - ib_data.nbytes
+        return ib_data, ib_format
+
+    def reorder_triangles(self, ib: NumpyBuffer, vertex_count: int) -> tuple[int, int]:
+        """
+        Reorders the triangles of an object's index buffer for the vertex
+        cache, returning the cache misses before and after. Triangles stay
+        within the object, so its drawindexed range is unaffected.
+        """
+        indices: NDArray = ib.get_field(ib.layout.semantics[0].get_name())
+        before: int = count_cache_misses(indices, vertex_count)
+        if len(indices) % 3 != 0:
+            return before, before
+        order: NDArray = optimize_triangle_order(indices, vertex_count)
+        ib.set_data(ib.data.reshape(-1, 3)[order].reshape(-1))
+        after: int = count_cache_misses(
+            ib.get_field(ib.layout.semantics[0].get_name()), vertex_count
+        )
+        return before, after
+
+    def optimize_vertex_order(
+        self,
+        vertex_count: int,
+        out_buffers: dict[str, NumpyBuffer],
+        index_buffers: list[NumpyBuffer],
+        shapekey_entries: dict[str, list[NDArray]],
+    ) -> None:
+        """
+        Renumbers the vertices of a component in the order its index buffer
+        first uses them, moving them in every vertex buffer and remapping the
+        index buffers and shape key entries referring to them.
+        """
+        index_field: str = index_buffers[0].layout.semantics[0].get_name()
+        order, remap = vertex_fetch_order(
+            index_buffers[0].get_field(index_field), vertex_count
+        )
+        for buffer in out_buffers.values():
+            if len(buffer) == vertex_count:
+                buffer.set_data(buffer.data[order])
+        for ib in index_buffers:
+            ib.set_field(index_field, remap[ib.get_field(index_field)])
+        for sk_entries in shapekey_entries.values():
+            for entries in sk_entries:
+                entries["VERTEX"] = remap[entries["VERTEX"]]
+
+    def build_draw_ranges(self, part: Part) -> list[DrawRange]:
+        """
+        Groups the objects of a part into the drawindexed calls issued for it.
+        Objects are laid out contiguously in the part's index buffer, so unless
+        they are meant to be toggled one by one they all merge into one draw.
+        Offsets are relative to the index buffer bound for the part, which
+        starts at part.index_offset when index buffers are packed. Drawing
+        objects separately keeps one range per object, empty ones included.
+        """
+        draw_ranges: list[DrawRange] = []
+        for entry in part.objects:
+            if entry.vertex_count == 0 and not self.split_draw_calls:
+                continue
+            index_offset: int = part.index_offset + entry.index_offset
+            if (
+                not self.split_draw_calls
+                and draw_ranges
+                and draw_ranges[-1].index_offset + draw_ranges[-1].index_count
+                == index_offset
+            ):
+                draw_ranges[-1].objects.append(entry)
+                draw_ranges[-1].index_count += entry.index_count
                 continue
-            self.files_to_write[self.destination / (component.fullname + ".buf")] = (
-                out_buffers["Position"].data
+            draw_ranges.append(DrawRange([entry], entry.index_count, index_offset))
+        object_count: int = sum(len(draw.objects) for draw in draw_ranges)
+        if len(draw_ranges) < object_count:
+            print(
+                f"Merged {object_count} objects of {part.fullname} into {len(draw_ranges)} drawindexed calls"
             )
-            component.strides = {"position": out_buffers["Position"].data.itemsize}
+        return draw_ranges
+
+    def collect_shapekey_entries(
+        self,
+        data_model: DataModelXXMI,
+        mesh: Mesh,
+        vertex_ids: NDArray,
+        vb_offset: int,
+        entries: dict[str, list[NDArray]],
+        values: dict[str, float],
+    ) -> None:
+        """Collects an entry for every exported vertex a marked shapekey moves further than the threshold"""
+        shapekeys: list[ShapeKey] = self.get_exported_shapekeys(mesh)
+        if len(shapekeys) == 0:
+            return
+        deltas: NDArray = data_model.get_shapekey_data(
+            mesh, [sk.name for sk in shapekeys], vertex_ids, data_model.mirror_mesh
+        )
+        moved: NDArray = numpy.abs(deltas).max(axis=2) > self.shapekey_threshold
+        for sk, sk_deltas, sk_moved in zip(shapekeys, deltas, moved):
+            indices: NDArray = numpy.flatnonzero(sk_moved)
+            sk_entries: NDArray = numpy.empty(len(indices), dtype=shapekey_entry_dtype)
+            sk_entries["VERTEX"] = indices + vb_offset
+            sk_entries["DELTA"] = sk_deltas[indices]
+            entries.setdefault(sk.name, []).append(sk_entries)
+            values.setdefault(sk.name, sk.value)
+
+    def build_shapekeys(
+        self,
+        component: Component,
+        position_buffer: NumpyBuffer,
+        entries: dict[str, list[NDArray]],
+        values: dict[str, float],
+    ) -> None:
+        """Packs the shapekey entries of a component in a single buffer, grouped per shapekey"""
+        position: BufferSemantic | None = position_buffer.layout.get_element(
+            AbstractSemantic(Semantic.Position)
+        )
+        if position is None or position.format not in [
+            DXGIFormat.R32G32B32_FLOAT,
+            DXGIFormat.R32G32B32A32_FLOAT,
+        ]:
+            self.report(
+                {"WARNING"},
+                f"Skipping shape keys of {component.fullname}, they can only be applied to a 32-bit float POSITION.",
+            )
+            return
+        component.shapekey_position_offset = position.offset
+        packed: list[NDArray] = []
+        first_entry: int = 0
+        for name, sk_entries in entries.items():
+            sk_entries = numpy.concatenate(sk_entries)
+            if len(sk_entries) == 0:
+                print(f"Skipping shape key {name}, it doesn't move any vertex.")
+                continue
+            variable: str = re.sub(r"[^0-9A-Za-z_]", "_", f"{component.fullname}_{name}")
+            while variable in [sk.variable for sk in component.shapekeys]:
+                variable += "_"
+            component.shapekeys.append(
+                ShapeKeyData(
+                    name=name,
+                    variable=variable,
+                    value=values[name],
+                    first_entry=first_entry,
+                    entry_count=len(sk_entries),
+                )
+            )
+            packed.append(sk_entries)
+            first_entry += len(sk_entries)
+        if len(packed) == 0:
+            return
+        data: NDArray = numpy.concatenate(packed)
+        self.files_to_write[
+            self.destination / (component.fullname + "ShapeKeys.buf")
+        ] = data
+        full_size: int = len(component.shapekeys) * component.vertex_count * 12
+        print(
+            f"Packed {len(component.shapekeys)} shape keys of {component.fullname} in {len(data)} entries ({data.nbytes} bytes, {full_size} bytes as full vertex deltas)"
+        )
 
     def verify_mesh_requirements(
         self,
@@ -432,7 +924,7 @@ class ModExporter:
                 missing_uvs.append(abs_name)
             if abs_enum == Semantic.Blendweight:
                 if len(mesh.vertices) > 0 and len(obj.vertex_groups) == 0:
-                    self.operator.report(
+                    self.report(
                         {"WARNING"},
                         (
                             f"Mesh({obj.name}) requires vertex groups to be posed. "
@@ -442,7 +934,7 @@ class ModExporter:
                 max_groups: int = sem.format.get_num_values()
                 for vertex in mesh.vertices:
                     if len(vertex.groups) > max_groups:
-                        self.operator.report(
+                        self.report(
                             {"WARNING"},
                             (
                                 f"Mesh({obj.name}) has some vertex with more VGs than the amount supported by the buffer format ({max_groups}). "
@@ -464,16 +956,16 @@ class ModExporter:
                 f"Please add them to the mesh before exporting."
             )
 
-    def generate_ini(
+    def get_ini_template(
         self,
         template_name: str = "default.ini.j2",
-    ) -> None:
+    ) -> tuple[Environment, str]:
+        """
+        Returns the environment and name of the template the ini is rendered
+        from. Reads the add-on preferences, so it must run on the main thread.
+        """
         # Extensions handle modifiable paths differently. If we ever move to them we should make modifications in here
-        if self.write_ini is False:
-            return
-        print("Generating .ini file")
-        addon_path: Path = Path(__file__).parent.parent
-        templates_paths: list[Path] = [addon_path / "templates"]
+        templates_paths: list[Path] = [bundled_templates_path]
         if (
             self.template != Path("")
             and isinstance(self.template, Path)
@@ -481,11 +973,13 @@ class ModExporter:
         ):
             templates_paths.insert(0, self.template.parent)
             template_name = self.template.name
-        env: Environment = Environment(
-            loader=FileSystemLoader(searchpath=templates_paths),
-            trim_blocks=True,
-            lstrip_blocks=True,
-        )
+        return get_template_environment(templates_paths), template_name
+
+    def generate_ini(self, template: Optional[tuple[Environment, str]] = None) -> None:
+        if self.write_ini is False:
+            return
+        print("Generating .ini file")
+        env, template_name = template if template is not None else self.get_ini_template()
         print(f"Using template {template_name}")
         ini_file: INI_file = INI_file(
             env.get_template(template_name).render(
@@ -497,8 +991,76 @@ class ModExporter:
             )
         )
         ini_file.clean_up_indentation()
-        ini_body: str = str(ini_file)
-        self.files_to_write[self.destination / (self.mod_name + ".ini")] = ini_body
+        ini_path: Path = self.destination / (self.mod_name + ".ini")
+        if self.merge_ini and ini_path.is_file():
+            ini_body: Optional[str] = self.merge_into_ini(ini_path, ini_file)
+        else:
+            ini_body = str(ini_file)
+        if ini_body is not None:
+            self.files_to_write[ini_path] = ini_body
+        if any(component.shapekeys for component in self.mod_file.components):
+            shader_path: Path = bundled_templates_path / "ShapeKeys.hlsl"
+            self.files_to_write[self.destination / shader_path.name] = (
+                shader_path.read_text(encoding="utf-8")
+            )
+
+    def merge_into_ini(self, ini_path: Path, ini_file: INI_file) -> Optional[str]:
+        """
+        Merges the generated ini into the one already at ini_path, replacing
+        only the sections generated for the exported components and keeping
+        anything else the user added. In the shared [Constants] and [Present]
+        sections only the shape key variables and CommandList runs of the
+        exported components are replaced. Returns None if nothing changed.
+        """
+        try:
+            with open(ini_path, "r", encoding="utf-8") as f:
+                existing_body: str = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            raise Fatal(f"Error reading {ini_path} to merge into: {e}")
+        prefixes: tuple[str, ...] = tuple(
+            f"{kind}{component.fullname}".lower()
+            for component in self.mod_file.components
+            for kind in ("textureoverride", "resource", "commandlist", "customshader")
+        )
+
+        def is_owned(name: str) -> bool:
+            return name.startswith(prefixes)
+
+        variables: tuple[str, ...] = tuple(
+            "global $" + re.sub(r"[^0-9A-Za-z_]", "_", component.fullname).lower() + "_"
+            for component in self.mod_file.components
+        )
+        runs: set[str] = {
+            f"commandlist{component.fullname}shapekeys".lower()
+            for component in self.mod_file.components
+        }
+
+        def owns_line(section: str, line: INI_Line) -> bool:
+            if section == "constants":
+                return line.is_value_pair and line.normalized_key.startswith(variables)
+            if section == "present":
+                return line.has_key("run") and line.value.strip().lower() in runs
+            return False
+
+        existing: INI_file = INI_file(existing_body)
+        generated_names: dict[str, Section] = ini_file.section_index()
+        stale: list[str] = [
+            section.name.strip()
+            for name, section in existing.section_index().items()
+            if is_owned(name) and name not in generated_names
+        ]
+        if stale:
+            self.report(
+                {"WARNING"},
+                f"Kept sections no longer generated in {ini_path.name}: {', '.join(stale)}",
+            )
+        changed: list[str] = existing.merge(ini_file, is_owned, owns_line)
+        ini_body: str = str(existing)
+        if ini_body == existing_body:
+            print(f"{ini_path.name} is up to date")
+            return None
+        print(f"Merged {len(changed)} sections into {ini_path.name}")
+        return ini_body
 
     def optimize_outlines(
         self, output_buffs: dict[str, NumpyBuffer], ib_buf: NumpyBuffer
@@ -586,7 +1148,7 @@ class ModExporter:
                 AbstractSemantic(Semantic.Tangent)
             )
             if tangent_element is None:
-                self.operator.report(
+                self.report(
                     {"WARNING"},
                     "Tangent semantic not found in the buffer layout. Skipping outline optimization.",
                 )
@@ -601,7 +1163,7 @@ class ModExporter:
                 AbstractSemantic(Semantic.Color)
             )
             if color_element is None:
-                self.operator.report(
+                self.report(
                     {"WARNING"},
                     "Color semantic not found in the position buffer layout. Skipping outline optimization.",
                 )
@@ -627,7 +1189,7 @@ class ModExporter:
             )
             if texcoord1_element is None:
                 # TODO: might want to force add anyways
-                self.operator.report(
+                self.report(
                     {"WARNING"},
                     "TEXCOORD1 semantic not found in the texcoord buffer layout. Skipping outline optimization.",
                 )
@@ -650,39 +1212,72 @@ class ModExporter:
         print(f"Optimized outlines in {time.time() - start_time:.4f} seconds")
 
     def write_files(self) -> None:
-        """Write the files to the destination."""
+        """
+        Write the files to the destination. Every file is written next to its
+        destination first and only moved in place once all of them are, so an
+        export failing or cancelled halfway leaves the previous files as they were.
+        """
         self.destination.mkdir(parents=True, exist_ok=True)
         print("Writen files: ")
-        for file_path, content in self.files_to_write.items():
+        staged: list[tuple[Path, Path]] = []
+        try:
+            for file_path, content in self.files_to_write.items():
+                self.check_cancelled()
+                temp_path: Path = file_path.with_name(file_path.name + ".tmp")
+                try:
+                    print(f" - {file_path.name}")
+                    if isinstance(content, str) and self.write_ini:
+                        staged.append((temp_path, file_path))
+                        with open(temp_path, "w", encoding="utf-8") as file:
+                            file.write(content)
+                    elif isinstance(content, numpy.ndarray) and self.write_buffers:
+                        staged.append((temp_path, file_path))
+                        content.tofile(temp_path)
+                except (OSError, IOError) as e:
+                    raise Fatal(f"Error writing file {file_path}: {e}")
+            if self.copy_textures:
+                for src, dest in self.files_to_copy.items():
+                    self.check_cancelled()
+                    try:
+                        print(f" - {dest.name}")
+                        if not dest.exists():
+                            dest.parent.mkdir(parents=True, exist_ok=True)
+                        if dest.exists():
+                            continue
+                        temp_path = dest.with_name(dest.name + ".tmp")
+                        staged.append((temp_path, dest))
+                        shutil.copy(src, temp_path)
+                    except (OSError, IOError) as e:
+                        raise Fatal(f"Error copying file {src} to {dest}: {e}")
+            self.check_cancelled()
+        except BaseException:
+            for temp_path, _ in staged:
+                temp_path.unlink(missing_ok=True)
+            raise
+        self.files_replaced = True
+        for temp_path, file_path in staged:
             try:
-                print(f" - {file_path.name}")
-                if isinstance(content, str) and self.write_ini:
-                    with open(file_path, "w", encoding="utf-8") as file:
-                        file.write(content)
-                elif isinstance(content, numpy.ndarray) and self.write_buffers:
-                    content.tofile(file_path)
-            except (OSError, IOError) as e:
+                os.replace(temp_path, file_path)
+            except OSError as e:
                 raise Fatal(f"Error writing file {file_path}: {e}")
-        if not self.copy_textures:
-            return
-        for src, dest in self.files_to_copy.items():
-            try:
-                print(f" - {dest.name}")
-                if not dest.exists():
-                    dest.parent.mkdir(parents=True, exist_ok=True)
-                if dest.exists():
-                    continue
-                shutil.copy(src, dest)
-            except (OSError, IOError) as e:
-                raise Fatal(f"Error copying file {src} to {dest}: {e}")
 
     def cleanup(self) -> None:
         """Cleanup after the exporter."""
+        # Objects and meshes may have been removed meanwhile, e.g. by an undo
+        # while a modal export was running
         for obj in self.__objs_to_cleanup:
-            obj.to_mesh_clear()
-            if not isinstance(obj.data, Mesh):
-                continue
-            obj.data.update()
+            try:
+                obj.to_mesh_clear()
+                if not isinstance(obj.data, Mesh):
+                    continue
+                obj.data.update()
+            except ReferenceError:
+                pass
+        for mesh in self.__meshes_to_cleanup:
+            try:
+                bpy.data.meshes.remove(mesh)
+            except ReferenceError:
+                pass
 
     def export(self) -> None:
         """Export the mod file."""
@@ -694,11 +1289,69 @@ class ModExporter:
         self.generate_ini()
         self.write_files()
         self.cleanup()
-        print()
-        self.operator.report(
-            {"INFO"},
-            f"Exported {self.mod_name} to {self.destination} in {(time.time() - start):2f} seconds",
+        self.report_exported(time.time() - start)
+
+    @property
+    def export_step_count(self) -> int:
+        """Number of steps export_steps() yields"""
+        return 1 + sum(
+            len(component.parts)
+            for component in self.mod_file.components
+            if component.draw_vb != ""
+        )
+
+    def export_steps(self) -> Iterator[tuple[str, Optional[Callable[[], None]]]]:
+        """
+        Export split in steps for a modal operator. Each step reads one part
+        from Blender and yields a progress message, along with the work it
+        leaves for a worker thread: finishing a component once its last part
+        is read, then the ini and the files. Jobs must be run in order, and
+        cleanup() called on the main thread once they are done.
+        """
+        if len(self.mod_file.components) == 0:
+            raise Fatal("No components found to export. Aborting export.")
+        print(f"Exporting {self.mod_name} to {self.destination}")
+        self.files_to_write = {}
+        self.files_to_copy = {}
+        for component in self.mod_file.components:
+            buffers: Optional[ComponentBuffers] = self.begin_component(component)
+            if buffers is None:
+                continue
+            for i, part in enumerate(component.parts):
+                self.check_cancelled()
+                self.snapshot_part(buffers, part)
+                job: Optional[Callable[[], None]] = None
+                if i == len(component.parts) - 1:
+                    job = functools.partial(self.run_job, self.finish_component, buffers)
+                yield f"Read {part.fullname}", job
+        # The environment reads the add-on preferences and config folder
+        # through bpy, the worker only renders and writes
+        template: Optional[tuple[Environment, str]] = (
+            self.get_ini_template() if self.write_ini else None
         )
+        yield "Writing files", functools.partial(
+            self.run_job, self.write_output, template
+        )
+
+    def run_job(self, job: Callable, *args) -> None:
+        self.check_cancelled()
+        try:
+            job(*args)
+        except BaseException:
+            # Later jobs must not write out an export that failed halfway
+            self.cancel_event.set()
+            raise
+
+    def write_output(self, template: Optional[tuple[Environment, str]]) -> None:
+        self.generate_ini(template)
+        self.write_files()
+
+    def report_exported(self, elapsed: float) -> None:
+        print()
+        message: str = f"Exported {self.mod_name} to {self.destination} in {elapsed:2f} seconds"
+        if self.write_buffers and self.ib_bytes_saved > 0:
+            message += f", saved {self.ib_bytes_saved} bytes with 16-bit index buffers"
+        self.report({"INFO"}, message)
 
     def load_hashes(self, path: Path) -> list[dict]:
         """Load the hash data from the hash.json file."""
@@ -0,0 +1,142 @@
+"""
+On disk cache of parsed frame analysis buffers, so that re-importing the same
+draw calls (e.g. to try different flip options) can go straight to building
+the mesh instead of parsing every .txt / .buf again.
+
+Each imported mesh is stored as one .npz holding the VertexBufferGroup and
+IndexBuffer columns (see VertexBufferGroup.to_columns()) and a JSON metadata
+entry with the InputLayout and the remaining buffer state. Entries are keyed
+by the path, size and mtime of every file they were parsed from, and evicted
+least recently used first once the cache grows past its size cap.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy
+
+
+class ImportCache(object):
+    version = 1
+    extension = ".npz"
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    @staticmethod
+    def task_files(task):
+        """All files an import task (list of ImportPaths) will be parsed from"""
+        ret = []
+
+        def collect(paths):
+            if isinstance(paths, str):
+                ret.append(paths)
+            elif isinstance(paths, (tuple, list)):
+                for path in paths:
+                    collect(path)
+
+        for paths in task:
+            collect(paths.vb_paths)
+            collect(paths.ib_paths)
+            collect(paths.pose_path)
+        return ret
+
+    def key(self, task, options):
+        files = []
+        for path in self.task_files(task):
+            stat = os.stat(path)
+            path = os.path.normcase(os.path.abspath(path))
+            files.append((path, stat.st_size, stat.st_mtime_ns))
+        key = json.dumps([self.version, files, list(task), sorted(options.items())])
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + self.extension)
+
+    def load(self, task, options):
+        """
+        Returns ((vb columns, ib columns, name, pose_path), reports) for a
+        previously parsed task, or None on a cache miss.
+        """
+        try:
+            path = self.path(self.key(task, options))
+            with numpy.load(path, allow_pickle=False) as npz:
+                meta = json.loads(str(npz["meta"]))
+                vb = meta["vb"]
+                vb["columns"] = {
+                    semantic: npz["vb_%i" % i]
+                    for i, semantic in enumerate(meta["vb_semantics"])
+                }
+                ib = meta["ib"]
+                if ib is not None:
+                    ib["faces"] = npz["ib_faces"]
+        except (OSError, KeyError, ValueError):
+            return None
+        # Bump the mtime so eviction drops the least recently *used* entries:
+        os.utime(path)
+        reports = [(set(type), message) for type, message in meta["reports"]]
+        return (vb, ib, meta["name"], meta["pose_path"]), reports
+
+    def save(self, task, options, result, reports):
+        vb, ib, name, pose_path = result
+        arrays = {}
+        semantics = list(vb["columns"])
+        for i, semantic in enumerate(semantics):
+            arrays["vb_%i" % i] = vb["columns"][semantic]
+        vb = {k: v for k, v in vb.items() if k != "columns"}
+        if ib is not None:
+            arrays["ib_faces"] = ib["faces"]
+            ib = {k: v for k, v in ib.items() if k != "faces"}
+        meta = {
+            "vb": vb,
+            "vb_semantics": semantics,
+            "ib": ib,
+            "name": name,
+            "pose_path": pose_path,
+            "reports": [(sorted(type), message) for type, message in reports],
+        }
+        arrays["meta"] = numpy.array(json.dumps(meta))
+
+        path = self.path(self.key(task, options))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            numpy.savez(f, **arrays)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def entries(self):
+        ret = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(self.extension) and entry.is_file():
+                    stat = entry.stat()
+                    ret.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return ret
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """Removes every cached entry, returning the number of bytes freed"""
+        freed = 0
+        for _, size, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            freed += size
+        return freed
@@ -27,7 +27,9 @@ from bpy_extras.io_utils import (
 
 from .datahandling import (
     find_stream_output_vertex_buffers,
-    open_frame_analysis_log_file,
+    get_import_cache,
+    open_frame_analysis_dump_index,
+    open_frame_analysis_log,
     apply_vgmap,
     new_custom_attribute_float,
     new_custom_attribute_int,
@@ -36,6 +38,7 @@ from .datahandling import (
 )
 from .datastructures import (
     Fatal,
+    FrameAnalysisDumpIndex,
     ImportPaths,
     IOOBJOrientationHelper,
     VBSOMapEntry,
@@ -46,78 +49,6 @@ from .datastructures import (
 from .export_ops import XXMIProperties
 
 
-def load_3dmigoto_mesh_bin(operator: Operator, vb_paths, ib_paths, pose_path):
-    if len(vb_paths) != 1 or len(ib_paths) > 1:
-        raise Fatal("Cannot merge meshes loaded from binary files")
-
-    # Loading from binary files, but still need to use the .txt files as a
-    # reference for the format:
-    ib_bin_path, ib_txt_path = ib_paths[0]
-
-    use_drawcall_range = False
-    if hasattr(operator, "load_buf_limit_range"):  # Frame analysis import only
-        use_drawcall_range = operator.load_buf_limit_range
-
-    vb = VertexBufferGroup()
-    vb.parse_vb_bin(vb_paths[0], use_drawcall_range)
-
-    ib = None
-    if ib_bin_path:
-        ib = IndexBuffer(open(ib_txt_path, "r"), load_indices=False)
-        if ib.used_in_drawcall is False:
-            operator.report(
-                {"WARNING"},
-                "{}: Discarding index buffer not used in draw call".format(
-                    os.path.basename(ib_bin_path)
-                ),
-            )
-            ib = None
-        else:
-            ib.parse_ib_bin(open(ib_bin_path, "rb"), use_drawcall_range)
-
-    return vb, ib, os.path.basename(vb_paths[0][0][0]), pose_path
-
-
-def load_3dmigoto_mesh(operator: Operator, paths: ImportPaths):
-    vb_paths, ib_paths, use_bin, pose_path = zip(*paths)
-    pose_path = pose_path[0]
-
-    if use_bin[0]:
-        return load_3dmigoto_mesh_bin(operator, vb_paths, ib_paths, pose_path)
-
-    vb = VertexBufferGroup(vb_paths[0])
-    # Merge additional vertex buffers for meshes split over multiple draw calls:
-    for vb_path in vb_paths[1:]:
-        tmp = VertexBufferGroup(vb_path)
-        vb.merge(tmp)
-
-    # For quickly testing how importent any unsupported semantics may be:
-    # vb.wipe_semantic_for_testing('POSITION.w', 1.0)
-    # vb.wipe_semantic_for_testing('TEXCOORD.w', 0.0)
-    # vb.wipe_semantic_for_testing('TEXCOORD5', 0)
-    # vb.wipe_semantic_for_testing('BINORMAL')
-    # vb.wipe_semantic_for_testing('TANGENT')
-    # vb.write(open(os.path.join(os.path.dirname(vb_paths[0]), 'TEST.vb'), 'wb'), operator=operator)
-
-    ib = None
-    if ib_paths and ib_paths != (None,):
-        ib = IndexBuffer(open(ib_paths[0], "r"))
-        # Merge additional vertex buffers for meshes split over multiple draw calls:
-        for ib_path in ib_paths[1:]:
-            tmp = IndexBuffer(open(ib_path, "r"))
-            ib.merge(tmp)
-        if ib.used_in_drawcall is False:
-            operator.report(
-                {"WARNING"},
-                "{}: Discarding index buffer not used in draw call".format(
-                    os.path.basename(ib_paths[0])
-                ),
-            )
-            ib = None
-
-    return vb, ib, os.path.basename(vb_paths[0][0]), pose_path
-
-
 def normal_import_translation(elem, flip):
     unorm = elem.Format.endswith("_UNORM")
     if unorm:
@@ -506,8 +437,13 @@ def import_3dmigoto_vb_ib(
     merge_verts: bool = False,
     tris_to_quads: bool = False,
     clean_loose: bool = False,
+    mesh_data=None,
 ):
-    vb, ib, name, pose_path = load_3dmigoto_mesh(operator, paths)
+    if mesh_data is None:
+        from .import_worker import load_3dmigoto_mesh
+
+        mesh_data = load_3dmigoto_mesh(operator, paths)
+    vb, ib, name, pose_path = mesh_data
 
     mesh = bpy.data.meshes.new(name)
     obj = bpy.data.objects.new(mesh.name, mesh)
@@ -633,13 +569,36 @@ def import_3dmigoto(
     merge_meshes: bool = True,
     **kwargs,
 ):
+    # Parsing doesn't need bpy, so it may happen in worker processes (or be
+    # skipped entirely for cached buffers) while meshes are only ever created
+    # here on the main thread:
+    options = {}
+    if hasattr(operator, "load_buf_limit_range"):  # Frame analysis import only
+        options["load_buf_limit_range"] = operator.load_buf_limit_range
+    from .import_worker import parse_in_workers
+
+    cache = get_import_cache()
     if merge_meshes:
-        return import_3dmigoto_vb_ib(operator, context, paths, **kwargs)
+        tasks = [list(paths)]
+        for task, mesh_data, error in parse_in_workers(operator, tasks, options, cache):
+            if error is not None:
+                raise Fatal(error)
+            return import_3dmigoto_vb_ib(
+                operator, context, task, mesh_data=mesh_data, **kwargs
+            )
     else:
         obj = []
-        for p in paths:
+        tasks = [[p] for p in paths]
+        for task, mesh_data, error in parse_in_workers(operator, tasks, options, cache):
+            p = task[0]
             try:
-                obj.append(import_3dmigoto_vb_ib(operator, context, [p], **kwargs))
+                if error is not None:
+                    raise Fatal(error)
+                obj.append(
+                    import_3dmigoto_vb_ib(
+                        operator, context, task, mesh_data=mesh_data, **kwargs
+                    )
+                )
             except Fatal as e:
                 operator.report({"ERROR"}, str(e) + ": " + str(p[:2]))
         # FIXME: Group objects together
@@ -778,6 +737,8 @@ class PrefillSemanticRemapList(Operator):
 
         paths = import_operator.get_vb_ib_paths(load_related=False)
 
+        from .import_worker import load_3dmigoto_mesh
+
         for p in paths:
             vb, ib, name, pose_path = load_3dmigoto_mesh(import_operator, [p])
             valid_semantics = vb.get_valid_semantics()
@@ -914,29 +875,31 @@ class Import3DMigotoFrameAnalysis(Operator, ImportHelper, IOOBJOrientationHelper
     )
 
     def get_vb_ib_paths(self, load_related=None):
-        buffer_pattern = re.compile(
-            r"""-(?:ib|vb[0-9]+)(?P<hash>=[0-9a-f]+)?(?=[^0-9a-f=])"""
-        )
+        buffer_pattern = FrameAnalysisDumpIndex.buffer_pattern
         vb_regex = re.compile(
-            r"""^(?P<draw_call>[0-9]+)-vb(?P<slot>[0-9]+)="""
-        )  # TODO: Combine with above? (careful not to break hold type frame analysis)
+            r"""^(?:(?P<frame>[0-9]+)\.)?(?P<draw_call>[0-9]+)-vb(?P<slot>[0-9]+)="""
+        )  # TODO: Combine with above?
 
         dirname = os.path.dirname(self.filepath)
+        # Single scan of the dump folder, everything below is a dict lookup:
+        index = open_frame_analysis_dump_index(dirname)
         ret = set()
         if load_related is None:
             load_related = self.load_related
 
-        vb_so_map = {}
+        fa_log = None
+        # (context, frame) -> vb_so_map, each frame's log is only parsed once
+        # one of its vertex buffers is actually being imported:
+        vb_so_maps = {}
+        reported_hashes = set()
         if self.load_related_so_vb:
             try:
-                fa_log = open_frame_analysis_log_file(dirname)
+                fa_log, context = open_frame_analysis_log(dirname)
             except FileNotFoundError:
                 self.report(
                     {"WARNING"},
                     "Frame Analysis Log File not found, loading unposed meshes from GPU Stream Output pre-skinning passes will be unavailable",
                 )
-            else:
-                vb_so_map = find_stream_output_vertex_buffers(fa_log)
 
         files = set()
         if load_related:
@@ -944,12 +907,9 @@ class Import3DMigotoFrameAnalysis(Operator, ImportHelper, IOOBJOrientationHelper
                 match = buffer_pattern.search(filename.name)
                 if match is None or not match.group("hash"):
                     continue
-                paths = glob(
-                    os.path.join(
-                        dirname, "*%s*.txt" % filename.name[match.start() : match.end()]
-                    )
+                files.update(
+                    index.find_related(filename.name[match.start() : match.end()])
                 )
-                files.update([os.path.basename(x) for x in paths])
         if not files:
             files = [x.name for x in self.files]
             if files == [""]:
@@ -991,31 +951,81 @@ class Import3DMigotoFrameAnalysis(Operator, ImportHelper, IOOBJOrientationHelper
                 )
                 use_bin = True  # FIXME: Ask
 
-            ib_pattern = filename[: match.start()] + "-ib*" + filename[match.end() :]
-            vb_pattern = filename[: match.start()] + "-vb*" + filename[match.end() :]
-            ib_paths = glob(os.path.join(dirname, ib_pattern))
-            vb_paths = glob(os.path.join(dirname, vb_pattern))
-            done.update(map(os.path.basename, itertools.chain(vb_paths, ib_paths)))
+            prefix, suffix = filename[: match.start()], filename[match.end() :]
+            ib_names = index.find_buffers(prefix, suffix, "ib")
+            vb_names = index.find_buffers(prefix, suffix, "vb")
+            ib_paths = list(map(index.path, ib_names))
+            vb_paths = list(map(index.path, vb_names))
+            done.update(itertools.chain(vb_names, ib_names))
 
-            if vb_so_map:
+            if fa_log is not None:
                 vb_so_paths = set()
                 for vb_path in vb_paths:
-                    vb_match = vb_regex.match(os.path.basename(vb_path))
+                    vb_name = os.path.basename(vb_path)
+                    vb_match = vb_regex.match(vb_name)
                     if vb_match:
+                        frame = vb_match.group("frame")
+                        frame = frame and int(frame)
                         draw_call, slot = map(int, vb_match.group("draw_call", "slot"))
+                        if (context, frame) not in vb_so_maps:
+                            try:
+                                log = fa_log.get(context, frame)
+                            except KeyError:
+                                vb_so_maps[(context, frame)] = {}
+                            else:
+                                vb_so_maps[(context, frame)] = (
+                                    find_stream_output_vertex_buffers(log)
+                                )
+                        vb_so_map = vb_so_maps[(context, frame)]
                         so = vb_so_map.get(VBSOMapEntry(draw_call, slot))
                         if so:
                             # No particularly good way to determine which input
                             # vertex buffers we need from the stream-output
                             # pass, so for now add them all:
-                            vb_so_pattern = f"{so.draw_call:06}-vb*.txt"
-                            glob_result = glob(os.path.join(dirname, vb_so_pattern))
-                            if not glob_result:
+                            so_prefix = f"{so.draw_call:06}"
+                            if frame is not None:
+                                so_prefix = f"{frame}.{so_prefix}"
+                            so_names = index.find_slot(
+                                so_prefix, "vb", ".txt", startswith=True
+                            )
+                            if not so_names:
                                 self.report(
                                     {"WARNING"},
-                                    f"{vb_so_pattern} not found, loading unposed meshes from GPU Stream Output pre-skinning passes will be unavailable",
+                                    f"{so_prefix}-vb*.txt not found, loading unposed meshes from GPU Stream Output pre-skinning passes will be unavailable",
+                                )
+                            vb_so_paths.update(map(index.path, so_names))
+                        elif not vb_so_map and len(fa_log.sections) > 1:
+                            # No stream output in this frame / context, point
+                            # the user at any others that used this buffer:
+                            # Names may carry other markers than a hash after
+                            # the =, e.g. =!U!=, there is nothing to look up then
+                            hash_match = re.match(r"[0-9a-f]+", vb_name[vb_match.end() :])
+                            if hash_match is None:
+                                continue
+                            vb_hash = hash_match.group()
+                            if vb_hash in reported_hashes:
+                                continue
+                            reported_hashes.add(vb_hash)
+                            others = []
+                            for use in fa_log.find_hash(vb_hash, "vb"):
+                                if (use.context, use.frame) == (context, frame):
+                                    continue
+                                where = []
+                                if use.context is not None:
+                                    where.append(f"context 0x{use.context}")
+                                if use.frame is not None:
+                                    where.append(f"frame {use.frame}")
+                                if " ".join(where) not in others:
+                                    others.append(" ".join(where))
+                            if others:
+                                self.report(
+                                    {"INFO"},
+                                    "{}: vertex buffer hash {} also used in {}".format(
+                                        os.path.basename(vb_path),
+                                        vb_hash,
+                                        ", ".join(others),
+                                    ),
                                 )
-                            vb_so_paths.update(glob_result)
                 # FIXME: Not sure yet whether the extra vertex buffers from the
                 # stream output pre-skinning passes are best lumped in with the
                 # existing vb_paths or added as a separate set of paths. Advantages
@@ -1027,7 +1037,7 @@ class Import3DMigotoFrameAnalysis(Operator, ImportHelper, IOOBJOrientationHelper
                 ib_bin_paths = [os.path.splitext(x)[0] + ".buf" for x in ib_paths]
                 if all(
                     [
-                        os.path.exists(x)
+                        index.exists(os.path.basename(x))
                         for x in itertools.chain(vb_bin_paths, ib_bin_paths)
                     ]
                 ):
@@ -1044,13 +1054,9 @@ class Import3DMigotoFrameAnalysis(Operator, ImportHelper, IOOBJOrientationHelper
 
             pose_path = None
             if self.pose_cb:
-                pose_pattern = (
-                    filename[: match.start()] + "*-" + self.pose_cb + "=*.txt"
-                )
-                try:
-                    pose_path = glob(os.path.join(dirname, pose_pattern))[0]
-                except IndexError:
-                    pass
+                pose_names = index.find_slot(prefix, self.pose_cb, ".txt")
+                if pose_names:
+                    pose_path = index.path(pose_names[0])
 
             if len(ib_paths) > 1:
                 raise Fatal("Error: excess index buffers in dump?")
@@ -1227,22 +1233,18 @@ class Import3DMigotoReferenceInputFormat(Operator, ImportHelper):
         if os.path.splitext(self.filepath)[1].lower() == ".fmt":
             return (self.filepath, self.filepath)
 
-        buffer_pattern = re.compile(
-            r"""-(?:ib|vb[0-9]+)(?P<hash>=[0-9a-f]+)?(?=[^0-9a-f=])"""
-        )
-
         dirname = os.path.dirname(self.filepath)
         filename = os.path.basename(self.filepath)
 
-        match = buffer_pattern.search(filename)
+        match = FrameAnalysisDumpIndex.buffer_pattern.search(filename)
         if match is None:
             raise Fatal(
                 "Reference .txt filename does not look like a 3DMigoto timestamped Frame Analysis Dump"
             )
-        ib_pattern = filename[: match.start()] + "-ib*" + filename[match.end() :]
-        vb_pattern = filename[: match.start()] + "-vb*" + filename[match.end() :]
-        ib_paths = glob(os.path.join(dirname, ib_pattern))
-        vb_paths = glob(os.path.join(dirname, vb_pattern))
+        index = open_frame_analysis_dump_index(dirname)
+        prefix, suffix = filename[: match.start()], filename[match.end() :]
+        ib_paths = list(map(index.path, index.find_buffers(prefix, suffix, "ib")))
+        vb_paths = list(map(index.path, index.find_buffers(prefix, suffix, "vb")))
         if len(ib_paths) < 1 or len(vb_paths) < 1:
             raise Fatal(
                 "Unable to locate reference files for both vertex buffer and index buffer format descriptions"
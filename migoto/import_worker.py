@@ -0,0 +1,232 @@
+"""
+Parsing of frame analysis buffers, usable both on Blender's main thread and in
+worker processes. Parsing the .txt / .buf dumps does not need bpy at all, so
+when importing many draw calls at once it is farmed out to a process pool and
+only the mesh and object creation is left to the main thread.
+
+Worker processes are spawned with Blender's bundled Python, which cannot run
+the add-on's __init__ (it imports bpy), so this module bootstraps the parent
+packages by path before any task is unpickled. That also means nothing
+imported here may depend on bpy or mathutils.
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import runpy
+
+if __name__ == "__xxmi_import_worker__":
+    # Running via runpy.run_path() as the initializer of a worker process, see
+    # parse_in_workers(). worker_packages is passed in through init_globals.
+    import types
+
+    for package_name, package_path in worker_packages:  # noqa: F821
+        if package_name not in sys.modules:
+            package = types.ModuleType(package_name)
+            package.__path__ = package_path
+            sys.modules[package_name] = package
+else:
+    from .datastructures import Fatal, ImportPaths, IndexBuffer, VertexBufferGroup
+
+# Spawning processes and importing numpy in each costs more than parsing a few
+# small buffers, so only go parallel when there is enough work to share:
+parallel_threshold = 4
+
+
+class WorkerOperator(object):
+    """
+    Stands in for the import operator inside worker processes, recording any
+    reports so they can be replayed on the real operator afterwards.
+    """
+
+    def __init__(self, **options):
+        self.reports = []
+        for name, value in options.items():
+            setattr(self, name, value)
+
+    def report(self, type, message):
+        self.reports.append((set(type), message))
+
+
+def load_3dmigoto_mesh_bin(operator, vb_paths, ib_paths, pose_path):
+    if len(vb_paths) != 1 or len(ib_paths) > 1:
+        raise Fatal("Cannot merge meshes loaded from binary files")
+
+    # Loading from binary files, but still need to use the .txt files as a
+    # reference for the format:
+    ib_bin_path, ib_txt_path = ib_paths[0]
+
+    use_drawcall_range = False
+    if hasattr(operator, "load_buf_limit_range"):  # Frame analysis import only
+        use_drawcall_range = operator.load_buf_limit_range
+
+    vb = VertexBufferGroup()
+    vb.parse_vb_bin(vb_paths[0], use_drawcall_range)
+
+    ib = None
+    if ib_bin_path:
+        ib = IndexBuffer(open(ib_txt_path, "r"), load_indices=False)
+        if ib.used_in_drawcall is False:
+            operator.report(
+                {"WARNING"},
+                "{}: Discarding index buffer not used in draw call".format(
+                    os.path.basename(ib_bin_path)
+                ),
+            )
+            ib = None
+        else:
+            ib.parse_ib_bin(open(ib_bin_path, "rb"), use_drawcall_range)
+
+    return vb, ib, os.path.basename(vb_paths[0][0][0]), pose_path
+
+
+def load_3dmigoto_mesh(operator, paths: "list[ImportPaths]"):
+    vb_paths, ib_paths, use_bin, pose_path = zip(*paths)
+    pose_path = pose_path[0]
+
+    if use_bin[0]:
+        return load_3dmigoto_mesh_bin(operator, vb_paths, ib_paths, pose_path)
+
+    vb = VertexBufferGroup(vb_paths[0])
+    # Merge additional vertex buffers for meshes split over multiple draw calls:
+    for vb_path in vb_paths[1:]:
+        tmp = VertexBufferGroup(vb_path)
+        vb.merge(tmp)
+
+    # For quickly testing how importent any unsupported semantics may be:
+    # vb.wipe_semantic_for_testing('POSITION.w', 1.0)
+    # vb.wipe_semantic_for_testing('TEXCOORD.w', 0.0)
+    # vb.wipe_semantic_for_testing('TEXCOORD5', 0)
+    # vb.wipe_semantic_for_testing('BINORMAL')
+    # vb.wipe_semantic_for_testing('TANGENT')
+    # vb.write(open(os.path.join(os.path.dirname(vb_paths[0]), 'TEST.vb'), 'wb'), operator=operator)
+
+    ib = None
+    if ib_paths and ib_paths != (None,):
+        ib = IndexBuffer(open(ib_paths[0], "r"))
+        # Merge additional vertex buffers for meshes split over multiple draw calls:
+        for ib_path in ib_paths[1:]:
+            tmp = IndexBuffer(open(ib_path, "r"))
+            ib.merge(tmp)
+        if ib.used_in_drawcall is False:
+            operator.report(
+                {"WARNING"},
+                "{}: Discarding index buffer not used in draw call".format(
+                    os.path.basename(ib_paths[0])
+                ),
+            )
+            ib = None
+
+    return vb, ib, os.path.basename(vb_paths[0][0]), pose_path
+
+
+def parse_mesh(paths, options):
+    """
+    Worker process entry point. Returns the parsed buffers as numpy columns,
+    or the message of the Fatal error that stopped parsing, along with any
+    reports raised on the way.
+    """
+    operator = WorkerOperator(**options)
+    try:
+        vb, ib, name, pose_path = load_3dmigoto_mesh(operator, paths)
+    except Fatal as e:
+        return None, str(e), operator.reports
+    ib = ib.to_columns() if ib is not None else None
+    return (vb.to_columns(), ib, name, pose_path), None, operator.reports
+
+
+def mesh_from_columns(result):
+    vb, ib, name, pose_path = result
+    vb = VertexBufferGroup.from_columns(vb)
+    ib = IndexBuffer.from_columns(ib) if ib is not None else None
+    return vb, ib, name, pose_path
+
+
+def worker_packages():
+    """Parent packages of this module and where to find them on disk"""
+    ret = []
+    parts = __name__.split(".")[:-1]
+    for i in range(1, len(parts) + 1):
+        package_name = ".".join(parts[:i])
+        ret.append((package_name, list(sys.modules[package_name].__path__)))
+    return ret
+
+
+def parse_in_workers(operator, tasks, options, cache=None):
+    """
+    Parses each list of ImportPaths in tasks, yielding the task, the parsed
+    (vb, ib, name, pose_path) tuple or None, and the Fatal error message if
+    parsing failed, in the same order as tasks. Reports raised while parsing
+    are replayed on operator before each result is yielded.
+
+    Tasks found in the ImportCache are not parsed at all, and newly parsed
+    ones are added to it. The rest are parsed in worker processes, falling
+    back to the calling thread for small batches or if the process pool
+    cannot be started.
+    """
+    # Each result is (columns, error, reports) as returned by parse_mesh()
+    results = [None] * len(tasks)
+    cached = set()
+    if cache is not None:
+        for i, task in enumerate(tasks):
+            hit = cache.load(task, options)
+            if hit is not None:
+                columns, reports = hit
+                results[i] = (columns, None, reports)
+                cached.add(i)
+        if cached:
+            print(f"Loaded {len(cached)} of {len(tasks)} meshes from the import cache")
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    if len(pending) >= parallel_threshold and (os.cpu_count() or 1) > 1:
+        start = time.time()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(len(pending), os.cpu_count()),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=runpy.run_path,
+                initargs=(
+                    __file__,
+                    {"worker_packages": worker_packages()},
+                    "__xxmi_import_worker__",
+                ),
+            ) as executor:
+                futures = {
+                    i: executor.submit(parse_mesh, tasks[i], options) for i in pending
+                }
+                for i, future in futures.items():
+                    results[i] = future.result()
+            print(
+                f"Parsed {len(pending)} meshes in worker processes in {time.time() - start:.3f}s"
+            )
+        except (BrokenProcessPool, OSError) as e:
+            print(f"Unable to parse in worker processes, parsing serially: {e}")
+
+    for i, task in enumerate(tasks):
+        if results[i] is None:
+            worker = WorkerOperator(**options)
+            try:
+                mesh = load_3dmigoto_mesh(worker, task)
+            except Fatal as e:
+                mesh, columns, error = None, None, str(e)
+            else:
+                vb, ib, name, pose_path = mesh
+                error = None
+                if cache is not None:
+                    ib = ib.to_columns() if ib is not None else None
+                    columns = (vb.to_columns(), ib, name, pose_path)
+            reports = worker.reports
+        else:
+            columns, error, reports = results[i]
+            mesh = columns and mesh_from_columns(columns)
+        if cache is not None and i not in cached and error is None:
+            try:
+                cache.save(task, options, columns, reports)
+            except OSError as e:
+                print(f"Unable to save {mesh[2]} to the import cache: {e}")
+        for type, message in reports:
+            operator.report(type, message)
+        yield task, mesh, error
@@ -8,6 +8,7 @@ from .. import addon_updater_ops
 from .datahandling import (
     Fatal,
     apply_vgmap,
+    get_cache_dir,
     import_pose,
     merge_armatures,
     update_vgmap,
@@ -178,6 +179,23 @@ class DeleteNonNumericVertexGroups(Operator):
         return {"FINISHED"}
 
 
+class ClearImportCache(Operator):
+    """Delete all cached parsed buffers from previous imports"""
+
+    bl_idname = "import_mesh.migoto_clear_cache"
+    bl_label = "Clear Import Cache"
+
+    def execute(self, context):
+        from .import_cache import ImportCache
+
+        # Not through get_import_cache(), entries left from before the cache
+        # was disabled in the preferences must still be cleared
+        cache = ImportCache(get_cache_dir("import_cache"), 0)
+        freed = cache.clear()
+        self.report({"INFO"}, f"Cleared {freed / 1024 / 1024:.1f} MB import cache")
+        return {"FINISHED"}
+
+
 class Preferences(AddonPreferences):
     """Preferences updater"""
 
@@ -221,8 +239,25 @@ class Preferences(AddonPreferences):
         max=59,
     )
 
+    import_cache_size: IntProperty(
+        name="Import cache size (MB)",
+        description="Maximum disk space used to cache parsed frame analysis buffers, so re-importing the same draw calls skips parsing. 0 disables the cache",
+        default=512,
+        min=0,
+    )
+
+    precompile_templates: BoolProperty(
+        name="Precompile templates",
+        description="Compiles the bundled ini templates into Python modules in the add-on config folder, so the first export of a session doesn't have to parse them",
+        default=True,
+    )
+
     def draw(self, context):
         layout = self.layout
+        row = layout.row()
+        row.prop(self, "import_cache_size")
+        row.operator(ClearImportCache.bl_idname, icon="TRASH")
+        layout.prop(self, "precompile_templates")
         print(addon_updater_ops.get_user_preferences(context))
         # Works best if a column, or even just self.layout.
         mainrow = layout.row()
@@ -1,4 +1,6 @@
 import bpy
+import bmesh
+import numpy
 import os
 import functools
 import sys
@@ -6,25 +8,56 @@ import sys
 # =============================================================================
 # 0. 辅助功能：模型清理逻辑
 # =============================================================================
+def remove_loose_geometry(mesh):
+    '''
+    删除不属于任何面的边和不属于任何边的顶点 (等同于 delete_loose)
+    用索引数组找出孤立元素，只有存在孤立元素时才经过 bmesh
+    '''
+    loop_edges = numpy.empty(len(mesh.loops), dtype=numpy.int32)
+    mesh.loops.foreach_get("edge_index", loop_edges)
+    edge_vertices = numpy.empty(len(mesh.edges) * 2, dtype=numpy.int32)
+    mesh.edges.foreach_get("vertices", edge_vertices)
+
+    face_edge_count = numpy.bincount(loop_edges, minlength=len(mesh.edges))
+    vertex_edge_count = numpy.bincount(edge_vertices, minlength=len(mesh.vertices))
+    loose_edges = numpy.flatnonzero(face_edge_count == 0).tolist()
+    loose_verts = numpy.flatnonzero(vertex_edge_count == 0).tolist()
+    if not loose_edges and not loose_verts:
+        return 0
+
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bm.verts.ensure_lookup_table()
+    bm.edges.ensure_lookup_table()
+    verts = [bm.verts[i] for i in loose_verts]
+    edges = [bm.edges[i] for i in loose_edges]
+    # 删除边时会一并删除因此孤立的顶点
+    bmesh.ops.delete(bm, geom=verts, context='VERTS')
+    bmesh.ops.delete(bm, geom=edges, context='EDGES')
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.update()
+    return len(loose_edges) + len(loose_verts)
+
 def remove_unused_vertex_groups(obj):
     '''
-    移除给定obj的未使用的顶点组 (基于用户提供的算法)
+    移除给定obj的未使用的顶点组 (权重全部为 0 或没有顶点)
     '''
     if obj.type == "MESH":
-        # 确保数据是最新的
-        obj.update_from_editmode()
-        
-        # 统计使用情况
-        vgroup_used = {i: False for i, k in enumerate(obj.vertex_groups)}
-
-        for v in obj.data.vertices:
-            for g in v.groups:
-                if g.weight > 0.0:
-                    vgroup_used[g.group] = True
+        # 展开所有顶点的权重条目
+        elements = [v.groups for v in obj.data.vertices]
+        total = sum(map(len, elements))
+        groups = numpy.fromiter(
+            (g.group for e in elements for g in e), dtype=numpy.int32, count=total
+        )
+        weights = numpy.fromiter(
+            (g.weight for e in elements for g in e), dtype=numpy.float32, count=total
+        )
+        used = set(numpy.unique(groups[weights > 0.0]).tolist())
 
         # 倒序删除 (防止索引偏移)
-        for i, used in sorted(vgroup_used.items(), reverse=True):
-            if not used:
+        for i in reversed(range(len(obj.vertex_groups))):
+            if i not in used:
                 obj.vertex_groups.remove(obj.vertex_groups[i])
 
 def perform_cleanup_job(context):
@@ -32,6 +65,7 @@ def perform_cleanup_job(context):
     执行清理任务：针对所有被选中的 Mesh 物体
     1. 清理孤立点 (Delete Loose)
     2. 移除未使用顶点组
+    不切换激活物体和编辑模式，所有物体一次处理
     """
     # 获取导入后选中的物体 (通常导入器会选中所有新导入的物体)
     target_objs = [obj for obj in context.selected_objects if obj.type == 'MESH']
@@ -41,21 +75,20 @@ def perform_cleanup_job(context):
 
     print(f"[XXMI] 开始清理 {len(target_objs)} 个导入物体...")
 
-    # 记录并确保在 Object 模式
+    # 确保在 Object 模式，网格数据才是最新的
     if context.mode != 'OBJECT':
         bpy.ops.object.mode_set(mode='OBJECT')
 
+    # 共用网格的物体只清理一次几何体
+    cleaned_meshes = set()
     for obj in target_objs:
         try:
-            # 必须设为 Active 才能执行 Edit Mode 操作
-            context.view_layer.objects.active = obj
-            
             # --- A. 清理孤立几何体 ---
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='SELECT')
-            # 清理孤立点/边
-            bpy.ops.mesh.delete_loose()
-            bpy.ops.object.mode_set(mode='OBJECT')
+            if obj.data.name not in cleaned_meshes:
+                cleaned_meshes.add(obj.data.name)
+                removed = remove_loose_geometry(obj.data)
+                if removed:
+                    print(f"[XXMI] {obj.name}: 删除 {removed} 个孤立点/边")
             
             # --- B. 移除未使用顶点组 ---
             remove_unused_vertex_groups(obj)
@@ -1,6 +1,5 @@
 import bpy
 from bpy.types import Panel, UIList, Menu, UILayout
-import addon_utils
 from bl_ui.generic_ui_list import draw_ui_list
 from .operators import (
     Import3DMigotoPose,
@@ -17,6 +16,7 @@ from .export_ops import (
     Export3DMigotoXXMI,
 )
 from .. import addon_updater_ops
+from . import ui_state
 from .export_ops import XXMIProperties
 
 
@@ -193,20 +193,16 @@ class XXMI_PT_Sidebar(Panel):
     # bl_context = "objectmode"
 
     def draw_header(self, context):
-        version = ""
-        for module in addon_utils.modules():
-            if module.bl_info.get("name") == "XXMI_Tools":
-                version = module.bl_info.get("version", (-1, -1, -1))
-                break
-        version: str = ".".join(str(i) for i in version)
+        ui_state.count_draw(self.bl_idname)
         layout: UILayout = self.layout
         row = layout.row()
         row.operator("wm.url_open", text="", icon="HELP").url = (
             "https://leotorrez.github.io/modding/guides/xxmi_tools"
         )
-        row.label(text=f"v{version}")
+        row.label(text=f"v{ui_state.version}")
 
     def draw(self, context):
+        ui_state.count_draw(self.bl_idname)
         layout = self.layout
         xxmi: XXMIProperties = context.scene.xxmi
         split = layout.split(factor=0.85)
@@ -232,6 +228,7 @@ class XXMISidebarOptionsPanelBase(object):
     #     return operator.bl_idname == "XXMI_PT_Sidebar"
 
     def draw(self, context):
+        ui_state.count_draw(type(self).__name__)
         self.layout.use_property_split = False
         self.layout.use_property_decorate = False
 
@@ -258,6 +255,11 @@ class XXMI_PT_SidePanelExportSettings(XXMISidebarOptionsPanelBase, Panel):
             box_tex.prop(xxmi, "no_ramps")
             box_tex.prop(xxmi, "ignore_duplicate_textures")
         col.prop(xxmi, "write_buffers")
+        if xxmi.write_buffers:
+            box_buf = col.box()
+            box_buf.prop(xxmi, "pack_index_buffers")
+            box_buf.prop(xxmi, "use_16bit_indices")
+            box_buf.prop(xxmi, "optimize_vertex_cache")
         col.prop(xxmi, "write_ini")
         if xxmi.write_ini:
             box_ini = col.box()
@@ -272,6 +274,8 @@ class XXMI_PT_SidePanelExportSettings(XXMISidebarOptionsPanelBase, Panel):
             col_2.enabled = xxmi.use_custom_template
             col_1_2.prop(xxmi, "template_path")
             col_2.operator("template.selector", icon="FILE_FOLDER", text="")
+            box_ini.prop(xxmi, "merge_ini")
+            box_ini.prop(xxmi, "split_draw_calls")
             box_ini.prop(xxmi, "credit")
         col = box.column(align=True)
         split = col.split(factor=0.25)
@@ -280,7 +284,12 @@ class XXMI_PT_SidePanelExportSettings(XXMISidebarOptionsPanelBase, Panel):
         col_1.prop(xxmi, "outline_optimization")
         col_2.enabled = xxmi.outline_optimization
         col_2.prop(xxmi, "outline_rounding_precision")
-        # col.prop(xxmi, 'export_shapekeys')
+        split = col.split(factor=0.25)
+        col_1 = split.column()
+        col_2 = split.column()
+        col_1.prop(xxmi, "export_shapekeys")
+        col_2.enabled = xxmi.export_shapekeys
+        col_2.prop(xxmi, "shapekey_threshold")
         # col.prop(xxmi, "export_materials")
 
 
@@ -330,6 +339,7 @@ class UpdaterPanel(Panel):
     bl_options = {"DEFAULT_CLOSED"}
 
     def draw(self, context):
+        ui_state.count_draw(self.bl_idname)
         layout = self.layout
 
         # Call to check for update in background.
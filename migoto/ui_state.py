@@ -0,0 +1,28 @@
+"""
+State shown by the sidebar panels. Panels are redrawn many times per second
+in a busy viewport, so anything that is not a plain property read is computed
+once, or when it changes, and draw() only reads it from here.
+
+`counters` tells how often panels were drawn and how often cached state was
+recomputed, e.g. from Blender's Python console:
+
+    >>> from XXMITools.migoto import ui_state
+    >>> ui_state.counters
+"""
+
+from collections import Counter
+
+from .. import bl_info
+
+# Read once, the add-on can't change version without being reloaded
+version: str = ".".join(str(i) for i in bl_info.get("version", (-1, -1, -1)))
+
+counters: Counter = Counter()
+
+
+def count_draw(panel: str) -> None:
+    counters["draw " + panel] += 1
+
+
+def count_refresh(state: str) -> None:
+    counters["refresh " + state] += 1
@@ -1,4 +1,6 @@
 import bpy
+import numpy
+from . import ui_state
 
 # =============================================================================
 # 1. 属性定义
@@ -15,6 +17,72 @@ class XXMI_VertexColorProperties(bpy.types.PropertyGroup):
 # =============================================================================
 # 2. 辅助函数
 # =============================================================================
+def _corner_colors(mesh, attr, loop_totals):
+    """
+    读取颜色属性 attr 并转换到面拐域，返回 (面拐数, 4) 的数组。
+    不是颜色类型或域不支持时返回 None。
+    """
+    if attr.data_type not in {'BYTE_COLOR', 'FLOAT_COLOR'}:
+        return None
+    values = numpy.empty((len(attr.data), 4), dtype=numpy.float32)
+    attr.data.foreach_get("color", values.ravel())
+    if attr.domain == 'CORNER':
+        return values
+
+    loop_count = len(mesh.loops)
+    if attr.domain == 'POINT':
+        index = numpy.empty(loop_count, dtype=numpy.int32)
+        mesh.loops.foreach_get("vertex_index", index)
+    elif attr.domain == 'EDGE':
+        index = numpy.empty(loop_count, dtype=numpy.int32)
+        mesh.loops.foreach_get("edge_index", index)
+    elif attr.domain == 'FACE':
+        index = numpy.repeat(numpy.arange(len(loop_totals)), loop_totals)
+    else:
+        return None
+    return values[index]
+
+def _fill_corner_color(mesh, name, color, selected_only):
+    """
+    用 color 填充网格的 BYTE_COLOR 面拐属性 name。
+    selected_only 时只填充选中的面，其余面拐保留原有颜色（其他类型或域的
+    颜色属性会先转换为面拐颜色）。没有选中的面时不做修改并返回 False。
+    """
+    loop_count = len(mesh.loops)
+    attr = mesh.attributes.get(name)
+    if not selected_only:
+        if attr is not None:
+            mesh.attributes.remove(attr)
+        attr = mesh.attributes.new(name=name, domain='CORNER', type='BYTE_COLOR')
+        colors = numpy.tile(numpy.array(color, dtype=numpy.float32), loop_count)
+        attr.data.foreach_set("color", colors)
+        return True
+
+    polygon_count = len(mesh.polygons)
+    select = numpy.empty(polygon_count, dtype=bool)
+    loop_totals = numpy.empty(polygon_count, dtype=numpy.int32)
+    mesh.polygons.foreach_get("select", select)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    if not select.any():
+        return False
+    # 面的面拐按面的顺序连续存放
+    loop_select = numpy.repeat(select, loop_totals)
+
+    colors = None
+    if attr is not None:
+        colors = _corner_colors(mesh, attr, loop_totals)
+        if attr.domain != 'CORNER' or attr.data_type != 'BYTE_COLOR':
+            mesh.attributes.remove(attr)
+            attr = None
+    if attr is None:
+        attr = mesh.attributes.new(name=name, domain='CORNER', type='BYTE_COLOR')
+    if colors is None:
+        # 原属性不是颜色，未选中的面没有可保留的颜色
+        colors = numpy.zeros((loop_count, 4), dtype=numpy.float32)
+    colors[loop_select] = color
+    attr.data.foreach_set("color", colors.ravel())
+    return True
+
 def _apply_vertex_color_to_selected(context, operator_instance):
     if not hasattr(context.scene, "xxmi_vertex_color_props"):
         operator_instance.report({'ERROR'}, "插件属性未加载，请重启 Blender")
@@ -28,40 +96,50 @@ def _apply_vertex_color_to_selected(context, operator_instance):
         operator_instance.report({'WARNING'}, "没有选中的物体！")
         return {'CANCELLED'}
 
-    applied_count = 0
-    for obj in selected_objects:
-        if obj.type == 'MESH':
-            # 移除现有的COLOR
-            if "COLOR" in obj.data.attributes:
-                obj.data.attributes.remove(obj.data.attributes["COLOR"])
-            
-            # 创建新的 COLOR
-            color_attr = obj.data.attributes.new(name="COLOR", domain='CORNER', type='BYTE_COLOR')
-            for i in range(len(color_attr.data)):
-                color_attr.data[i].color = color_to_apply
-
-            # 鸣潮特殊处理
-            if props.is_ming_chao_selected:
-                if "COLOR1" in obj.data.attributes:
-                    obj.data.attributes.remove(obj.data.attributes["COLOR1"])
-                
-                color_attr1 = obj.data.attributes.new(name="COLOR1", domain='CORNER', type='BYTE_COLOR')
-                for i in range(len(color_attr1.data)):
-                    color_attr1.data[i].color = color_to_apply
-                operator_instance.report({'INFO'}, f"已应用鸣潮双层顶点色: {obj.name}")
-            else:
-                if "COLOR1" in obj.data.attributes:
-                    obj.data.attributes.remove(obj.data.attributes["COLOR1"])
-                    operator_instance.report({'INFO'}, f"已应用顶点色 (并清理 COLOR1): {obj.name}")
-                else:
-                    operator_instance.report({'INFO'}, f"已应用顶点色: {obj.name}")
-            applied_count +=1
-        else:
-            operator_instance.report({'WARNING'}, f"{obj.name} 不是网格物体，已跳过")
-            
-    if applied_count == 0:
+    meshes = [obj for obj in selected_objects if obj.type == 'MESH']
+    skipped = len(selected_objects) - len(meshes)
+    if not meshes:
         operator_instance.report({'WARNING'}, "未找到有效的网格物体。")
         return {'CANCELLED'}
+
+    # 编辑模式下只填充选中的面，先切回物体模式以同步网格数据
+    edit_objects = {obj.name for obj in meshes if obj.mode == 'EDIT'}
+    if edit_objects:
+        bpy.ops.object.mode_set(mode='OBJECT')
+
+    unselected = 0
+    for obj in meshes:
+        mesh = obj.data
+        selected_only = obj.name in edit_objects
+        if not _fill_corner_color(mesh, "COLOR", color_to_apply, selected_only):
+            unselected += 1
+            continue
+
+        # 鸣潮特殊处理
+        if props.is_ming_chao_selected:
+            _fill_corner_color(mesh, "COLOR1", color_to_apply, selected_only)
+        elif "COLOR1" in mesh.attributes:
+            mesh.attributes.remove(mesh.attributes["COLOR1"])
+
+    if edit_objects:
+        bpy.ops.object.mode_set(mode='EDIT')
+
+    if unselected == len(meshes):
+        operator_instance.report({'WARNING'}, "编辑模式下没有选中的面，未应用顶点色。")
+        return {'CANCELLED'}
+
+    applied = len(meshes) - unselected
+    if props.is_ming_chao_selected:
+        msg = f"已应用鸣潮双层顶点色: {applied} 个物体"
+    else:
+        msg = f"已应用顶点色: {applied} 个物体"
+    if edit_objects:
+        msg += " (仅选中的面)"
+    if unselected:
+        msg += f"，{unselected} 个物体没有选中的面，未修改"
+    if skipped:
+        msg += f"，跳过 {skipped} 个非网格物体"
+    operator_instance.report({'WARNING'} if unselected else {'INFO'}, msg)
     
     return {'FINISHED'}
 
@@ -185,6 +263,7 @@ class XXMI_PT_ExtraToolsPanel(bpy.types.Panel):
     bl_order = 100 
 
     def draw(self, context):
+        ui_state.count_draw(self.bl_idname)
         layout = self.layout
         if not hasattr(context.scene, "xxmi_vertex_color_props"):
             layout.label(text="需重启插件", icon="ERROR")
@@ -1,85 +1,227 @@
 import bpy
-import time
+import numpy
+from bpy.app.handlers import persistent
+from dataclasses import dataclass
+from . import ui_state
 
 # =============================================================================
 # 全局数据
 # =============================================================================
-# 结构: { "ObjName": { vert_idx: { "GroupName": weight } } }
-XXMI_LOCK_DATA = {}       
+@dataclass
+class LockedWeights:
+    """
+    一个网格被锁定顶点的权重，以 CSR 数组保存：
+    第 i 个锁定顶点 vertices[i] 的权重条目位于 offsets[i]:offsets[i + 1]，
+    每个条目为 (groups, weights)，groups 是 group_names 中的下标。
+    """
+    vertices: numpy.ndarray     # int32，升序
+    offsets: numpy.ndarray      # int64，长度 len(vertices) + 1
+    groups: numpy.ndarray       # int32
+    weights: numpy.ndarray      # float32
+    group_names: list
+
+# 锁定数据以二进制自定义属性保存在网格上，随 .blend 一起保存，改名不受影响
+# 结构: { "vertices": bytes, "offsets": bytes, "groups": bytes,
+#         "weights": bytes, "group_names": bytes, "count": int }
+XXMI_LOCK_PROPERTY = "xxmi_weight_lock"
+
+# 面板显示用的缓存: (网格数, 顶点数)，锁定/解锁/撤销/打开文件时刷新
+XXMI_LOCK_COUNT = (0, 0)
 
-# 结构: { "ObjName": "LAST_MODE" }
+# 结构: { obj.session_uid: "LAST_MODE" }
 XXMI_MODE_TRACKER = {}    
 
 # 忙碌状态锁
 XXMI_IS_BUSY = False      
 
+# 模式变化订阅的 owner，仅在存在锁定数据时订阅
+XXMI_MSGBUS_OWNER = object()
+
 # =============================================================================
-# 1. 批量还原逻辑 (核心)
+# 1. 采集与批量还原逻辑 (核心)
 # =============================================================================
-def restore_weights_batch(obj_name):
+def capture_locked_weights(obj):
+    """
+    记录物体当前选中顶点的权重，没有选中顶点时返回 None。
+    """
+    mesh = obj.data
+    selection = numpy.zeros(len(mesh.vertices), dtype=bool)
+    mesh.vertices.foreach_get("select", selection)
+    vertices = numpy.flatnonzero(selection).astype(numpy.int32)
+    if len(vertices) == 0:
+        return None
+
+    # 顶点组条目没有批量接口，但只需遍历选中顶点一次
+    elements = [mesh.vertices[i].groups for i in vertices.tolist()]
+    offsets = numpy.zeros(len(vertices) + 1, dtype=numpy.int64)
+    numpy.cumsum(
+        numpy.fromiter(map(len, elements), dtype=numpy.int64, count=len(elements)),
+        out=offsets[1:],
+    )
+    total = int(offsets[-1])
+    groups = numpy.fromiter(
+        (g.group for e in elements for g in e), dtype=numpy.int32, count=total
+    )
+    weights = numpy.fromiter(
+        (g.weight for e in elements for g in e), dtype=numpy.float32, count=total
+    )
+    return LockedWeights(
+        vertices, offsets, groups, weights, [vg.name for vg in obj.vertex_groups]
+    )
+
+def save_locked_weights(mesh, lock):
+    """
+    将锁定数据写入网格的自定义属性，数组直接按字节保存。
+    """
+    mesh[XXMI_LOCK_PROPERTY] = {
+        "vertices": lock.vertices.astype(numpy.int32).tobytes(),
+        "offsets": lock.offsets.astype(numpy.int64).tobytes(),
+        "groups": lock.groups.astype(numpy.int32).tobytes(),
+        "weights": lock.weights.astype(numpy.float32).tobytes(),
+        "group_names": "\0".join(lock.group_names).encode("utf-8"),
+        "count": len(lock.vertices),
+    }
+
+def load_locked_weights(mesh):
+    """
+    读取网格上的锁定数据，没有时返回 None。
+    """
+    data = mesh.get(XXMI_LOCK_PROPERTY)
+    if data is None:
+        return None
+    group_names = data["group_names"]
+    return LockedWeights(
+        numpy.frombuffer(data["vertices"], dtype=numpy.int32),
+        numpy.frombuffer(data["offsets"], dtype=numpy.int64),
+        numpy.frombuffer(data["groups"], dtype=numpy.int32),
+        numpy.frombuffer(data["weights"], dtype=numpy.float32),
+        group_names.decode("utf-8").split("\0") if group_names else [],
+    )
+
+def locked_objects():
+    """
+    网格上带有锁定数据的所有物体。
+    """
+    return [
+        obj for obj in bpy.data.objects
+        if obj.type == 'MESH' and XXMI_LOCK_PROPERTY in obj.data
+    ]
+
+def refresh_lock_count():
+    global XXMI_LOCK_COUNT
+    ui_state.count_refresh("weight locks")
+    counts = [
+        mesh[XXMI_LOCK_PROPERTY]["count"]
+        for mesh in bpy.data.meshes if XXMI_LOCK_PROPERTY in mesh
+    ]
+    XXMI_LOCK_COUNT = (len(counts), sum(counts))
+
+def merge_locked_weights(old, new):
+    """
+    合并同一物体的两次锁定，重复锁定的顶点以新记录为准。
+    """
+    group_names = list(old.group_names)
+    name_index = {name: i for i, name in enumerate(group_names)}
+    for name in new.group_names:
+        if name not in name_index:
+            name_index[name] = len(group_names)
+            group_names.append(name)
+    new_groups = numpy.array(
+        [name_index[name] for name in new.group_names], dtype=numpy.int32
+    )[new.groups] if len(new.groups) else new.groups
+
+    # 展开为 (顶点, 组, 权重) 条目后重新排序
+    old_entry_vertices = numpy.repeat(old.vertices, numpy.diff(old.offsets))
+    keep = ~numpy.isin(old_entry_vertices, new.vertices)
+    entry_vertices = numpy.concatenate(
+        [old_entry_vertices[keep], numpy.repeat(new.vertices, numpy.diff(new.offsets))]
+    )
+    groups = numpy.concatenate([old.groups[keep], new_groups])
+    weights = numpy.concatenate([old.weights[keep], new.weights])
+    order = numpy.argsort(entry_vertices, kind="stable")
+
+    vertices = numpy.union1d(old.vertices, new.vertices).astype(numpy.int32)
+    offsets = numpy.zeros(len(vertices) + 1, dtype=numpy.int64)
+    offsets[1:] = numpy.searchsorted(entry_vertices[order], vertices, side="right")
+    return LockedWeights(vertices, offsets, groups[order], weights[order], group_names)
+
+def restore_weights_batch(obj):
     """
     针对单个物体执行批量还原。
     """
-    global XXMI_LOCK_DATA
-    
     # 安全检查
-    if obj_name not in XXMI_LOCK_DATA: return
-    obj = bpy.data.objects.get(obj_name)
     if not obj or obj.type != 'MESH': return
-
-    locked_verts = XXMI_LOCK_DATA[obj_name]
-    if not locked_verts: return
-
     mesh = obj.data
-    vg_map = {vg.name: vg.index for vg in obj.vertex_groups}
-    all_indices = list(locked_verts.keys())
+    lock = load_locked_weights(mesh)
+    if lock is None or len(lock.vertices) == 0: return
+    obj_name = obj.name
+    vertex_count = len(mesh.vertices)
     
-    print(f"[XXMI] 正在还原 '{obj_name}' 的 {len(all_indices)} 个顶点权重...")
+    print(f"[XXMI] 正在还原 '{obj_name}' 的 {len(lock.vertices)} 个顶点权重...")
     
     # --- A. 批量移除 (极速) ---
-    # 直接操作底层 C 结构，一次性移除
+    # 仅处理依然存在的顶点
+    all_indices = lock.vertices[lock.vertices < vertex_count].tolist()
     for vg in obj.vertex_groups:
         vg.remove(all_indices)
         
     # --- B. 填回数据 ---
-    # 仅处理依然存在的顶点和组
-    for v_idx, saved_weights in locked_verts.items():
-        if v_idx >= len(mesh.vertices): continue
-            
-        for vg_name, w in saved_weights.items():
-            if vg_name in vg_map:
-                obj.vertex_groups[vg_map[vg_name]].add([v_idx], w, 'REPLACE')
+    # 按名称找回顶点组，已删除的组跳过
+    vg_map = {vg.name: vg.index for vg in obj.vertex_groups}
+    group_lookup = numpy.array(
+        [vg_map.get(name, -1) for name in lock.group_names] + [-1], dtype=numpy.int32
+    )
+    entry_vertices = numpy.repeat(lock.vertices, numpy.diff(lock.offsets))
+    entry_groups = group_lookup[lock.groups]
+    valid = (entry_vertices < vertex_count) & (entry_groups >= 0)
+    entry_vertices = entry_vertices[valid]
+    entry_groups = entry_groups[valid]
+    entry_weights = lock.weights[valid]
+
+    # 相同 (组, 权重) 的顶点合并为一次 add 调用
+    order = numpy.lexsort((entry_vertices, entry_weights, entry_groups))
+    entry_vertices = entry_vertices[order]
+    entry_groups = entry_groups[order]
+    entry_weights = entry_weights[order]
+    starts = numpy.flatnonzero(
+        numpy.concatenate((
+            [True],
+            (entry_groups[1:] != entry_groups[:-1])
+            | (entry_weights[1:] != entry_weights[:-1]),
+        ))
+    ).tolist()
+    ends = starts[1:] + [len(entry_vertices)]
+    for start, end in zip(starts, ends):
+        obj.vertex_groups[int(entry_groups[start])].add(
+            entry_vertices[start:end].tolist(), float(entry_weights[start]), 'REPLACE'
+        )
     
     # 强制刷新
     mesh.update()
 
 # =============================================================================
-# 2. 安全看门狗 (支持多物体独立监控)
+# 2. 模式监听 (支持多物体独立监控)
 # =============================================================================
-def xxmi_multi_obj_watchdog():
+def xxmi_on_mode_changed():
     """
-    每 0.5 秒巡逻一次。
+    任意物体切换模式时由 msgbus 调用。
     独立检查每一个被锁定物体的模式状态。
     """
-    global XXMI_MODE_TRACKER, XXMI_LOCK_DATA, XXMI_IS_BUSY
+    global XXMI_MODE_TRACKER, XXMI_IS_BUSY
     
-    if XXMI_IS_BUSY: return 0.5
-    if not XXMI_LOCK_DATA: return 1.0
+    if XXMI_IS_BUSY: return
     
-    # 复制 key 列表以防遍历时修改字典
-    monitor_list = list(XXMI_LOCK_DATA.keys())
+    monitor_list = locked_objects()
     
-    for obj_name in monitor_list:
-        obj = bpy.data.objects.get(obj_name)
-        
-        # 物体丢失处理
-        if not obj:
-            del XXMI_LOCK_DATA[obj_name]
-            if obj_name in XXMI_MODE_TRACKER: del XXMI_MODE_TRACKER[obj_name]
-            continue
-            
+    # 物体丢失处理
+    alive = {obj.session_uid for obj in monitor_list}
+    for uid in list(XXMI_MODE_TRACKER.keys()):
+        if uid not in alive:
+            del XXMI_MODE_TRACKER[uid]
+    
+    for obj in monitor_list:
         current_mode = obj.mode
-        last_mode = XXMI_MODE_TRACKER.get(obj_name, 'OBJECT')
+        last_mode = XXMI_MODE_TRACKER.get(obj.session_uid, 'OBJECT')
         
         # --- 判定：该物体刚退出权重模式 ---
         # 注意：Blender 允许同时对多个物体进入/退出权重模式
@@ -87,16 +229,35 @@ def xxmi_multi_obj_watchdog():
             
             XXMI_IS_BUSY = True
             try:
-                restore_weights_batch(obj_name)
+                restore_weights_batch(obj)
             except Exception as e:
-                print(f"[XXMI] 还原失败 {obj_name}: {e}")
+                print(f"[XXMI] 还原失败 {obj.name}: {e}")
             finally:
                 XXMI_IS_BUSY = False
                 
         # 更新该物体的状态
-        XXMI_MODE_TRACKER[obj_name] = current_mode
-        
-    return 0.2
+        XXMI_MODE_TRACKER[obj.session_uid] = current_mode
+
+def update_mode_subscription():
+    """
+    有锁定数据时订阅物体模式变化，没有时取消订阅，空闲时不运行任何代码。
+    """
+    bpy.msgbus.clear_by_owner(XXMI_MSGBUS_OWNER)
+    if XXMI_LOCK_COUNT[0] == 0:
+        return
+    bpy.msgbus.subscribe_rna(
+        key=(bpy.types.Object, "mode"),
+        owner=XXMI_MSGBUS_OWNER,
+        args=(),
+        notify=xxmi_on_mode_changed,
+        options={"PERSISTENT"},
+    )
+
+@persistent
+def xxmi_locker_refresh(dummy):
+    # 打开文件会清空 msgbus 订阅，撤销/重做可能改变锁定数据
+    refresh_lock_count()
+    update_mode_subscription()
 
 # =============================================================================
 # 3. 锁定操作 (支持多物体选择)
@@ -108,7 +269,7 @@ class XXMI_OT_LockSelection(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}
 
     def execute(self, context):
-        global XXMI_LOCK_DATA, XXMI_MODE_TRACKER
+        global XXMI_MODE_TRACKER
         
         # 获取所有选中的网格物体 (不仅仅是激活的那个)
         targets = [o for o in context.selected_objects if o.type == 'MESH']
@@ -127,35 +288,20 @@ class XXMI_OT_LockSelection(bpy.types.Operator):
 
         # 2. 遍历每一个选中的物体
         for obj in targets:
-            if obj.name not in XXMI_LOCK_DATA:
-                XXMI_LOCK_DATA[obj.name] = {}
-                
-            mesh = obj.data
-            vg_index_map = {vg.index: vg.name for vg in obj.vertex_groups}
-            
-            count_obj = 0
-            
-            # 扫描该物体的顶点
-            selected_verts = [v for v in mesh.vertices if v.select]
-            
-            if not selected_verts:
+            lock = capture_locked_weights(obj)
+            if lock is None:
                 continue
-                
-            for v in selected_verts:
-                w_record = {}
-                for g in v.groups:
-                    if g.group in vg_index_map:
-                        vg_name = vg_index_map[g.group]
-                        w_record[vg_name] = g.weight
-                
-                XXMI_LOCK_DATA[obj.name][v.index] = w_record
-                count_obj += 1
+
+            count_obj = len(lock.vertices)
+            existing = load_locked_weights(obj.data)
+            if existing is not None:
+                lock = merge_locked_weights(existing, lock)
+            save_locked_weights(obj.data, lock)
             
-            if count_obj > 0:
-                print(f"[XXMI] 已锁定 {count_obj} 个顶点 (物体: '{obj.name}')")
-                XXMI_MODE_TRACKER[obj.name] = 'OBJECT'
-                total_locked += count_obj
-                objects_processed += 1
+            print(f"[XXMI] 已锁定 {count_obj} 个顶点 (物体: '{obj.name}')")
+            XXMI_MODE_TRACKER[obj.session_uid] = 'OBJECT'
+            total_locked += count_obj
+            objects_processed += 1
 
         # 3. 恢复之前的模式
         if original_mode != 'OBJECT':
@@ -163,13 +309,13 @@ class XXMI_OT_LockSelection(bpy.types.Operator):
                 if context.view_layer.objects.active in targets:
                     bpy.ops.object.mode_set(mode=original_mode)
                     for obj in targets:
-                        XXMI_MODE_TRACKER[obj.name] = original_mode
+                        XXMI_MODE_TRACKER[obj.session_uid] = original_mode
             except:
                 pass
         
-        # 4. 确保 Timer 启动
-        if not bpy.app.timers.is_registered(xxmi_multi_obj_watchdog):
-            bpy.app.timers.register(xxmi_multi_obj_watchdog, persistent=True)
+        # 4. 开始监听模式变化
+        refresh_lock_count()
+        update_mode_subscription()
 
         if objects_processed > 0:
             msg = f"已锁定 {total_locked} 个顶点 (共 {objects_processed} 个物体)。"
@@ -185,8 +331,12 @@ class XXMI_OT_UnlockAll(bpy.types.Operator):
     bl_label = "清空所有锁定"
     
     def execute(self, context):
-        global XXMI_LOCK_DATA
-        XXMI_LOCK_DATA.clear()
+        for mesh in bpy.data.meshes:
+            if XXMI_LOCK_PROPERTY in mesh:
+                del mesh[XXMI_LOCK_PROPERTY]
+        XXMI_MODE_TRACKER.clear()
+        refresh_lock_count()
+        update_mode_subscription()
         self.report({'INFO'}, "所有锁定已清空。")
         return {'FINISHED'}
 
@@ -196,11 +346,8 @@ class XXMI_OT_SelectLocked(bpy.types.Operator):
     bl_label = "选中已锁定点"
     
     def execute(self, context):
-        global XXMI_LOCK_DATA
-        
         # 获取所有有记录的物体
-        targets = [bpy.data.objects.get(name) for name in XXMI_LOCK_DATA.keys()]
-        targets = [t for t in targets if t] # 过滤空值
+        targets = locked_objects()
         
         if not targets: return {'CANCELLED'}
 
@@ -211,11 +358,10 @@ class XXMI_OT_SelectLocked(bpy.types.Operator):
         for obj in targets:
             obj.select_set(True)
             mesh = obj.data
-            for v in mesh.vertices: v.select = False
-            
-            for idx in XXMI_LOCK_DATA[obj.name]:
-                if idx < len(mesh.vertices):
-                    mesh.vertices[idx].select = True
+            vertices = load_locked_weights(mesh).vertices
+            selection = numpy.zeros(len(mesh.vertices), dtype=bool)
+            selection[vertices[vertices < len(mesh.vertices)]] = True
+            mesh.vertices.foreach_set("select", selection)
         
         # 将所有涉及的物体切入编辑模式 (多物体编辑)
         if targets:
@@ -236,17 +382,15 @@ class XXMI_PT_LockerPanel(bpy.types.Panel):
     bl_order = 105
 
     def draw(self, context):
+        ui_state.count_draw(self.bl_idname)
         layout = self.layout
-        global XXMI_LOCK_DATA
-        
-        total_objs = len(XXMI_LOCK_DATA)
-        total_verts = sum(len(v) for v in XXMI_LOCK_DATA.values())
+        total_objs, total_verts = XXMI_LOCK_COUNT
             
         box = layout.box()
         row = box.row()
         if total_verts > 0:
-            # 状态显示：保护中: 123 点 (共 2 物体)
-            row.label(text=f"保护中: {total_verts} 点 (共 {total_objs} 物体)", icon='LOCKED')
+            # 状态显示：保护中: 123 点 (共 2 网格)
+            row.label(text=f"保护中: {total_verts} 点 (共 {total_objs} 网格)", icon='LOCKED')
         else:
             row.label(text="无锁定数据", icon='UNLOCKED')
             
@@ -263,12 +407,28 @@ class XXMI_PT_LockerPanel(bpy.types.Panel):
 # =============================================================================
 # 注册
 # =============================================================================
+def locker_refresh_handlers():
+    return (
+        bpy.app.handlers.load_post,
+        bpy.app.handlers.undo_post,
+        bpy.app.handlers.redo_post,
+    )
+
 def register():
     # 注意：Operator 和 Panel 类由 auto_load.py 自动注册
-    # 我们只负责注册 Timer
-    if not bpy.app.timers.is_registered(xxmi_multi_obj_watchdog):
-        bpy.app.timers.register(xxmi_multi_obj_watchdog, persistent=True)
+    # 我们只负责模式变化的订阅 (仅在存在锁定数据时订阅)
+    for handlers in locker_refresh_handlers():
+        if xxmi_locker_refresh not in handlers:
+            handlers.append(xxmi_locker_refresh)
+    # 注册时 bpy.data 可能尚不可用，由 load_post 刷新
+    try:
+        refresh_lock_count()
+    except AttributeError:
+        pass
+    update_mode_subscription()
 
 def unregister():
-    if bpy.app.timers.is_registered(xxmi_multi_obj_watchdog):
-        bpy.app.timers.unregister(xxmi_multi_obj_watchdog)
\ No newline at end of file
+    for handlers in locker_refresh_handlers():
+        if xxmi_locker_refresh in handlers:
+            handlers.remove(xxmi_locker_refresh)
+    bpy.msgbus.clear_by_owner(XXMI_MSGBUS_OWNER)
@@ -0,0 +1,24 @@
+// Adds the deltas of one shape key to a vertex buffer, see shapekeys.ini.j2
+// x87: vertex stride, y87: byte offset of the float3 POSITION in a vertex
+// x88: shape key value, y88: first entry of the shape key, z88: entry count
+
+Texture1D<float4> IniParams : register(t120);
+
+struct ShapeKeyEntry {
+	uint vertex;
+	float3 delta;
+};
+
+StructuredBuffer<ShapeKeyEntry> entries : register(t0);
+RWByteAddressBuffer vertices : register(u0);
+
+[numthreads(64, 1, 1)]
+void main(uint3 id : SV_DispatchThreadID)
+{
+	if (id.x >= (uint)IniParams[88].z)
+		return;
+	ShapeKeyEntry entry = entries[(uint)IniParams[88].y + id.x];
+	uint address = entry.vertex * (uint)IniParams[87].x + (uint)IniParams[87].y;
+	float3 position = asfloat(vertices.Load3(address));
+	vertices.Store3(address, asuint(position + entry.delta * IniParams[88].x));
+}
@@ -0,0 +1,137 @@
+import importlib.util
+import unittest
+from pathlib import Path
+
+# Loaded by path, importing it through the add-on package would require bpy
+spec = importlib.util.spec_from_file_location(
+    "ini_format", Path(__file__).parents[1] / "migoto" / "data" / "ini_format.py"
+)
+ini_format = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ini_format)
+INI_file = ini_format.INI_file
+
+EXISTING = """; Mod by someone
+
+[Constants]
+global $active = 0
+global $creditinfo = 0
+global $mytoggle = 1
+
+[Present]
+post $active = 0
+run = CommandListCreditInfo
+
+[TextureOverrideBodyBlend]
+hash = 1234
+vb1 = ResourceBodyBlend
+
+[ResourceBodyBlend]
+type = Buffer
+filename = BodyBlend.buf
+"""
+
+WITH_SHAPEKEYS = """[Constants]
+global $active = 0
+global $creditinfo = 0
+; Smile
+global $Body_Smile = 0.5
+
+[Present]
+post $active = 0
+run = CommandListCreditInfo
+run = CommandListBodyShapeKeys
+
+[TextureOverrideBodyBlend]
+hash = 1234
+vb1 = ResourceBodyBlend
+
+[CommandListBodyShapeKeys]
+ResourceBodyPositionShaped = copy ResourceBodyPositionBase
+
+[ResourceBodyBlend]
+type = Buffer
+filename = BodyBlend.buf
+
+[ResourceBodyShapeKeys]
+type = StructuredBuffer
+filename = BodyShapeKeys.buf
+"""
+
+WITHOUT_SHAPEKEYS = """[Constants]
+global $active = 0
+global $creditinfo = 0
+
+[Present]
+post $active = 0
+run = CommandListCreditInfo
+
+[TextureOverrideBodyBlend]
+hash = 1234
+vb1 = ResourceBodyBlend
+
+[ResourceBodyBlend]
+type = Buffer
+filename = BodyBlend.buf
+"""
+
+
+def is_owned(name):
+    return name.startswith(
+        ("textureoverridebody", "resourcebody", "commandlistbody", "customshaderbody")
+    )
+
+
+def owns_line(section, line):
+    if section == "constants":
+        return line.is_value_pair and line.normalized_key.startswith("global $body_")
+    if section == "present":
+        return line.has_key("run") and line.value.strip().lower() == (
+            "commandlistbodyshapekeys"
+        )
+    return False
+
+
+def merge(existing, generated):
+    ini = INI_file(existing)
+    changed = ini.merge(INI_file(generated), is_owned, owns_line)
+    return str(ini), changed
+
+
+class MergeShapeKeysTest(unittest.TestCase):
+    def test_merge_adds_shapekeys_to_shared_sections(self):
+        merged, changed = merge(EXISTING, WITH_SHAPEKEYS)
+        sections = INI_file(merged).section_index()
+        constants = str(sections["constants"])
+        self.assertIn("; Smile\nglobal $Body_Smile = 0.5\n", constants)
+        self.assertIn("global $mytoggle = 1\n", constants)
+        present = str(sections["present"])
+        self.assertLess(
+            present.index("run = CommandListCreditInfo"),
+            present.index("run = CommandListBodyShapeKeys"),
+        )
+        self.assertIn("commandlistbodyshapekeys", sections)
+        self.assertIn("resourcebodyshapekeys", sections)
+        self.assertTrue(merged.startswith("; Mod by someone\n"))
+        self.assertLessEqual({"constants", "present"}, set(changed))
+
+    def test_merge_shapekeys_again_is_unchanged(self):
+        merged, _ = merge(EXISTING, WITH_SHAPEKEYS)
+        merged_again, changed = merge(merged, WITH_SHAPEKEYS)
+        self.assertEqual(merged_again, merged)
+        self.assertEqual(changed, [])
+
+    def test_merge_replaces_and_removes_shapekey_lines(self):
+        merged, _ = merge(EXISTING, WITH_SHAPEKEYS)
+        merged, _ = merge(merged, WITH_SHAPEKEYS.replace("0.5", "1.0"))
+        self.assertEqual(merged.count("global $Body_Smile"), 1)
+        self.assertIn("global $Body_Smile = 1.0\n", merged)
+        merged, changed = merge(merged, WITHOUT_SHAPEKEYS)
+        self.assertNotIn("$Body_Smile", merged)
+        self.assertNotIn("; Smile", merged)
+        self.assertNotIn("run = CommandListBodyShapeKeys", merged)
+        self.assertIn("global $mytoggle = 1\n", merged)
+        self.assertLessEqual({"constants", "present"}, set(changed))
+
+
+if __name__ == "__main__":
+    unittest.main()